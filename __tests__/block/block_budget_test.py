@@ -0,0 +1,66 @@
+from promptview.block.block9 import Block, TagPriority
+
+
+def word_counter(calls: list[str]):
+    def count(text: str) -> int:
+        calls.append(text)
+        return len(text.split())
+    return count
+
+
+def history(messages: int) -> Block:
+    with Block("History") as h:
+        for i in range(messages):
+            with h(f"msg{i}", tags=["system"] if i == 0 else ["history"]) as msg:
+                msg /= "word " * 10
+    return h
+
+
+
+def test_budget_policies():
+    calls = []
+    h = history(10)
+    full = h.render()
+    assert h.render(max_tokens=1000, tokenizer=word_counter(calls)) == full
+    out = h.render(max_tokens=60, tokenizer=word_counter(calls))
+    assert len(out.split()) <= 60
+    assert "msg4" not in out and "msg5" in out and "msg9" in out
+
+    out = h.render(max_tokens=60, policy="truncate_middle", tokenizer=word_counter(calls))
+    assert "msg0" in out and "msg9" in out and "msg5" not in out
+
+    out = h.render(max_tokens=30, policy=TagPriority({"history": 0}), tokenizer=word_counter(calls))
+    assert "msg0" in out and "msg8" not in out and "msg9" in out
+    assert h.render() == full
+
+
+def test_budget_counts_only_new_blocks():
+    calls = []
+    counter = word_counter(calls)
+    h = history(10)
+    h.render(max_tokens=60, tokenizer=counter)
+    calls.clear()
+    with h("msg10", tags=["history"]) as msg:
+        msg /= "new words"
+    h.render(max_tokens=60, tokenizer=counter)
+    assert not any("msg3" in text for text in calls)
+    assert any("new words" in text for text in calls)
+
+
+def test_budget_counts_the_rendered_text():
+    # rounds down per text, the parts of a text count less than the whole
+    def count(text: str) -> int:
+        return len(text) // 7
+
+    h = history(10)
+    for max_tokens in [10, 20, 40, 80, 120]:
+        out = h.render(max_tokens=max_tokens, tokenizer=count)
+        assert count(out) <= max_tokens
+
+
+def test_budget_under_limit_does_not_count_the_rendered_text():
+    calls = []
+    h = history(10)
+    full = h.render()
+    assert h.render(max_tokens=1000, tokenizer=word_counter(calls)) == full
+    assert full not in calls
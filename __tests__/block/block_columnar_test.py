@@ -0,0 +1,37 @@
+import pytest
+from promptview.block.block9 import Block, BlockChunk, BlockSchema
+from promptview.block.block9.columnar import BlockColumns
+
+
+def dump_tree(blk: Block):
+    return [
+        (b.path, b.role, b.tags, b.styles, b.attrs, [(c.content, c.logprob) for c in b.content.children])
+        for b in blk.traverse()
+    ]
+
+
+
+def test_columnar_round_trip():
+    with Block("History", style="md", attrs={"source": "test"}) as h:
+        for i in range(3):
+            with h(f"message {i}", role="user", style="xml", tags=["message"]) as msg:
+                sent = msg.content.copy()
+                for k in range(3):
+                    sent.append(BlockChunk(f" tök{k}", logprob=-0.5 * k if k else None))
+                msg /= sent
+    h.children[1].id = "msg1"
+
+    data = h.to_bytes()
+    loaded = Block.from_bytes(data)
+    assert loaded.render() == h.render()
+    assert dump_tree(loaded) == dump_tree(h)
+
+    cols = BlockColumns.from_bytes(data)
+    msg = cols.to_block(cols.children(0)[1])
+    assert msg.id == "msg1"
+    assert msg.render() == Block.from_bytes(h.children[1].to_bytes()).render()
+
+    with pytest.raises(ValueError):
+        BlockColumns.from_bytes(data[:100])
+    with pytest.raises(ValueError):
+        BlockSchema("schema", type=str).to_bytes()
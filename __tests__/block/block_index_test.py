@@ -0,0 +1,50 @@
+import pytest
+from promptview.block.block9 import Block
+
+
+
+def test_tag_index_matches_walk():
+    with Block("Response") as r:
+        with r("Items", tags=["items"]) as items:
+            for i in range(3):
+                with items(f"item {i}", tags=["item"]) as item:
+                    item /= Block("thought", tags=["thought"])
+    r.build_index()
+
+    assert r.get("item") is items.children[0]
+    assert r.get_last("item") is items.children[2]
+    assert items.children[1].get("thought") is items.children[1].children[0]
+    assert r.get("answer") is None
+
+    # new blocks are indexed as they are added, in document order
+    items.insert_child(0, Block("item first", tags=["item"]))
+    assert r.get("item").content.render() == "item first"
+    items.children[3].append_child(Block("answer", tags=["answer"]))
+    assert r.get("answer") is items.children[3].children[1]
+
+    # a tagged ancestor wins over the blocks inside it, like the walk
+    items.children[3].children[1].tags = ["item"]
+    assert r.get_last("item") is items.children[3]
+
+    items.replace_child(3, Block("replaced"))
+    assert r.get("answer") is None
+    assert r.get_last("item") is items.children[2]
+
+    assert r.get_by_id(items.children[1].id) is items.children[1]
+
+    # tags edited in place are indexed too
+    items.children[1].tags.append("answer")
+    assert r.get("answer") is items.children[1]
+    items.children[1].tags.remove("answer")
+    assert r.get("answer") is None
+
+    # changes made around the index are picked up by rebuilding it
+    items.children.pop()
+    assert r.get_last("item") is items.children[-1]
+    for b in r.traverse():
+        for tag in ["item", "thought", "answer"]:
+            assert b.get(tag) is b._walk_get(tag)
+            assert b.get_last(tag) is b._walk_get_last(tag)
+
+    with pytest.raises(ValueError):
+        items.build_index()
@@ -0,0 +1,91 @@
+import copy
+import random
+from promptview.block import Block, BlockSent, BlockChunk
+from promptview.block.block9.renderers2 import apply_style, apply_chunk_style
+
+
+STYLES = [None, "md", "xml", "stream", "ast-li", "num-li", "stream-view"]
+TEXTS = ["alpha", "beta gamma", "line\nbreak", "\n", "<tag>", "x"]
+
+
+def reference_render(target) -> str:
+    """Styles a deep copy in place, the way rendering worked before shadows."""
+    if type(target) is str:
+        return target
+    if isinstance(target, Block):
+        target = apply_style(target)
+        parts = [target.prefix, target.content, *target.children, target.postfix]
+        return "".join(reference_render(p) for p in parts if p is not None)
+    if isinstance(target, BlockSent):
+        parts = [target.prefix, target.content, *target.children, target.postfix]
+        return "".join(reference_render(p) for p in parts if p)
+    if isinstance(target, BlockChunk):
+        if target.content is None:
+            return ""
+        target = apply_chunk_style(target)
+        return f"{target.prefix}{reference_render(target.content)}{target.postfix}"
+    return str(target)
+
+
+def random_tree(rng: random.Random, depth: int = 0) -> Block:
+    block = Block(rng.choice(TEXTS), style=rng.choice(STYLES))
+    for _ in range(rng.randint(0, 2)):
+        block.content.append(rng.choice(TEXTS))
+    if depth < 3:
+        for _ in range(rng.randint(0, 3)):
+            if rng.random() < 0.3:
+                block.append(rng.choice(TEXTS))
+            else:
+                block.append_child(random_tree(rng, depth + 1))
+    return block
+
+
+def test_render_matches_reference():
+    rng = random.Random(7)
+    for _ in range(200):
+        block = random_tree(rng)
+        expected = reference_render(copy.deepcopy(block))
+        assert block.render() == expected
+        # memoized
+        assert block.render() == expected
+        target = rng.choice(list(block.traverse()))
+        if isinstance(target, Block):
+            target.content.append(rng.choice(TEXTS))
+            assert block.render() == reference_render(copy.deepcopy(block))
+
+
+def test_stream_children_keep_newlines():
+    with Block("Root") as root:
+        root.append(Block("item a", style="stream"))
+        root.append(Block("item b", style="stream"))
+    assert root.render() == "Root\nitem a\nitem b"
+
+
+def test_chunk_edit_invalidates_render():
+    with Block("Root") as root:
+        with root("task", tags=["task"], style="md") as task:
+            task /= "do it"
+            task /= "then stop"
+    assert root.render() == reference_render(copy.deepcopy(root))
+    chunk = root.get("task").children[0].content.children[0]
+    chunk.content = "CHANGED"
+    assert "CHANGED" in root.render()
+    chunk.postfix = "!"
+    assert root.render() == reference_render(copy.deepcopy(root))
+
+
+def test_styles_and_attrs_edited_in_place_invalidate_render():
+    with Block("List") as items:
+        items /= "one"
+        items /= "two"
+    items.render()
+    items.styles.append("num-li")
+    assert items.render() == reference_render(copy.deepcopy(items)) == "List\n1. one\n2. two"
+
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            output /= "the output"
+    system.render()
+    output.field("name", str, "the name of the output")
+    assert 'name="' in system.render()
+    assert system.render() == reference_render(copy.deepcopy(system))
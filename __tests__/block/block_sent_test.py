@@ -1,4 +1,7 @@
+import copy
+import pickle
 from promptview.block import Block, BlockSent, BlockChunk
+from promptview.block.block9.renderers2 import _render_block, render_offset
 
 
 
@@ -119,4 +122,132 @@ def test_sent_iadd_sent():
     
     
     
-    
\ No newline at end of file
+    
+
+def test_sent_index_after_insert_and_replace():
+    s = BlockSent([BlockChunk("a"), BlockChunk("b"), BlockChunk("c")])
+    first = s.insert(BlockChunk("start"), 0)
+    assert first.index == 0
+    assert [c.index for c in s] == [0, 1, 2, 3]
+    mid = s.insert(BlockChunk("mid"), 2)
+    assert mid.index == 2
+    assert [c.content for c in s] == ["start", "a", "mid", "b", "c"]
+    assert [c.index for c in s] == [0, 1, 2, 3, 4]
+    new = s.replace(BlockChunk("B"), 3)
+    assert new.index == 3
+    s.children.reverse()
+    assert [c.index for c in s] == [0, 1, 2, 3, 4]
+
+
+def test_chunk_lazy_id():
+    c1 = BlockChunk("hello")
+    c2 = BlockChunk("hello")
+    assert c1 != c2
+    assert c1 == c1
+    assert len(c1.id) == 8
+    assert c1.id == c1.id
+    assert c1.copy(copy_id=True) == c1
+    assert c1.type is str
+    s = BlockSent([c1], id="sent1")
+    assert s.id == "sent1"
+
+
+def test_render_is_pure_and_cached():
+    with Block("Tasks", style="md") as b:
+        with b("Items", style="num-li") as items:
+            items /= "one"
+            items /= "two"
+    tree = b.repr_tree()
+    first = b.render()
+    assert b.render() == first
+    assert b.repr_tree() == tree
+    assert b._render_cache is not None
+    items /= "three"
+    assert b._render_cache is None
+    assert b.render() == first + "\n3. three"
+
+
+def test_style_registry_tables():
+    from promptview.block.block9.renderers2 import StyleContext, StyleMeta, XMLStyle, _style_key
+    with Block("Tasks", style="xml") as b:
+        b /= "one"
+    xml = b.render()
+    with StyleContext({}) as ctx:
+        assert StyleMeta.resolve(["xml"], "block") is None
+        assert b.render() == "Tasks\none"
+        ctx.styles[_style_key("xml", "block")] = XMLStyle()
+        assert isinstance(StyleMeta.resolve(["xml"], "block"), XMLStyle)
+        assert b.render() == xml
+
+
+def test_render_delta():
+    with Block("answer", style="xml") as b:
+        field = b.append_child(Block("field"))
+    sent = field.content
+    sent_out = ""
+    block_out = ""
+    for i in range(20):
+        sent.append(BlockChunk(f"t{i} "))
+        sent_out += sent.render_delta(len(sent_out))
+        assert sent_out == sent.render()
+        delta = b.render_delta(len(block_out))
+        assert b.render().endswith(delta)
+        block_out = b.render()
+    assert sent.render_delta(3) == sent.render()[3:]
+    sent.insert(BlockChunk("first "), 0)
+    assert sent.render() == "first field" + "".join(f"t{i} " for i in range(20))
+
+
+def test_render_delta_renders_from_the_changed_child():
+    with Block("answer") as b:
+        with b("items", style="list:num") as items:
+            pass
+    out = b.render_delta(0)
+    for i in range(5):
+        item = items.append_child(Block(f"item{i}"))
+        for j in range(3):
+            item.content.append(BlockChunk(f" w{j}"))
+            start, end = render_offset(b, item)
+            since = start if j == 0 else end - len(f" w{j}")
+            out = out[:since] + b.render_delta(since)
+            assert out == _render_block(b, memo=False)
+            if j == 0:
+                memos = [c._render_cache for c in items.children[:-1]]
+        # the items before the streamed one are rendered once, from then on from their memo
+        assert all(memo is not None for memo in memos)
+        assert [c._render_cache for c in items.children[:-1]] == memos
+
+
+def test_copy_on_write():
+    with Block("System", style="md") as system:
+        for i in range(3):
+            with system(f"Section {i}", style="xml") as section:
+                section /= f"rule {i}"
+    text = system.render()
+    prompt = system.copy()
+    assert prompt.render() == text
+    prompt.children[1].append("extra rule")
+    assert system.render() == text
+    assert "extra rule" in prompt.render()
+    assert prompt.children[0]._source is system.children[0]
+    
+    snapshot = system.copy()
+    system.children[2].content.append(" changed")
+    system.append_child(Block("Section 3"))
+    assert snapshot.render() == text
+    assert [b.path for b in snapshot.traverse()] == [b.path for b in system.traverse()][:-1]
+
+
+def test_deepcopy_and_pickle():
+    with Block("System", style="md", tags=["system"]) as system:
+        for i in range(3):
+            with system(f"Section {i}", style="xml") as section:
+                section /= f"rule {i}"
+    text = system.render()
+    lazy = system.copy()
+    for block in [system, lazy]:
+        for clone in [copy.deepcopy(block), pickle.loads(pickle.dumps(block))]:
+            assert clone.render() == text
+            clone.children[0].append("extra rule")
+            assert "extra rule" in clone.render()
+            assert block.render() == text
@@ -1,5 +1,5 @@
-from promptview.block import Block
-from promptview.block.block9.block_schema import BlockBuilderContext
+from promptview.block import Block, BlockChunk
+from promptview.block.block9.block_schema import BlockBuilderContext, BlockDeltaBuilder
 
 
 
@@ -39,4 +39,32 @@ def test_simple_schema():
     ctx.append("thoughts", "1\n")
     assert ctx.has_events() == True
     assert get_events_types(ctx) == ["BlockChunk"]
-    assert ctx.has_events() == False
\ No newline at end of file
+    assert ctx.has_events() == False
+
+
+
+def test_delta_events():
+    with Block(role="system") as sys:
+        with sys.view("output", str) as out:
+            with out.view("answer", str) as a:
+                a /= "your answer goes here"
+
+    ctx = BlockBuilderContext(out, delta_events=True)
+    ctx.instantiate("output", "<output>")
+    ctx.instantiate("answer", "<answer>")
+    for chunk in ["\nhello", " big", " world"]:
+        ctx.append("answer", chunk)
+    ctx.set_view_attr("answer", postfix=[BlockChunk("</answer>")])
+    builder = BlockDeltaBuilder()
+    events = []
+    while ctx.has_events():
+        events.append(ctx.get_event())
+        builder.apply(events[-1])
+    assert [e["type"] for e in events] == ["block_open", "block_open", "block_open", "block_append", "block_append", "block_close"]
+    assert events[3]["chunk"]["content"] == " big"
+    assert events[3]["path"] == [0, 0]
+    assert builder.instance.render() == ctx.instance.render()
+    rendered = ""
+    for event in events:
+        rendered = rendered[:event["offset"]] + event["text"]
+    assert rendered == ctx.instance.render()
@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+import pytest
+from promptview.block import Block, BlockChunk
+from promptview.block.block9.block_schema import BlockDeltaBuilder
+from promptview.prompt.flow_components import Coalescer, EventLogLevel, StreamController
+from promptview.prompt.tracing import TracePolicy
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("thought", str) as thought:
+                thought /= "your thoughts"
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+    return system
+
+
+TOKENS = ["<output>", "\n<thought>", *[f" think{i}" for i in range(50)], "\n</thought>", "\n<answer>", *[f" word{i}" for i in range(50)], "\n</answer>", "\n</output>"]
+
+
+async def llm(latency: float = 0):
+    for token in TOKENS:
+        await asyncio.sleep(latency)
+        yield BlockChunk(token)
+
+
+async def parse_events(coalesce: bool):
+    stream = MemoryStream(llm(), name="llm").parse(response_schema())
+    if coalesce:
+        stream.coalesce(0.05)
+    with TracePolicy("off"):
+        events = [e async for e in await stream.stream_events(EventLogLevel.chunk)]
+    builder = BlockDeltaBuilder()
+    for event in events:
+        if event.type == "stream_delta":
+            builder.apply(event.payload)
+    return events, builder.instance.render()
+
+
+@pytest.mark.asyncio
+async def test_coalesced_stream_builds_the_same_response():
+    events, response = await parse_events(coalesce=False)
+    coalesced_events, coalesced_response = await parse_events(coalesce=True)
+    assert coalesced_response == response
+    assert len(coalesced_events) < len(events) / 5
+    assert "think0 think1" in coalesced_response
+    for stream_events, text in [(events, response), (coalesced_events, coalesced_response)]:
+        rendered = ""
+        for event in stream_events:
+            if event.type == "stream_delta" and "text" in event.payload:
+                rendered = rendered[:event.payload["offset"]] + event.payload["text"]
+        assert rendered == text
+
+
+@pytest.mark.asyncio
+async def test_coalescer_window():
+    async def values():
+        for value in [BlockChunk("a"), BlockChunk("b"), "not a delta", BlockChunk("c"), BlockChunk("d"), BlockChunk("e")]:
+            yield value
+        await asyncio.sleep(0.05)
+        yield BlockChunk("late")
+
+    coalescer = Coalescer(0.01, max_chars=2, gen=values())
+    out = [v async for v in coalescer]
+    assert [v.content if isinstance(v, BlockChunk) else v for v in out] == ["ab", "not a delta", "cd", "e", "late"]
+    assert coalescer.received == 7 and coalescer.sent == 5
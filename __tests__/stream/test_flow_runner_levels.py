@@ -0,0 +1,41 @@
+import uuid
+import pytest
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, PipeController, StreamController
+from promptview.prompt.tracing import TracePolicy
+
+
+class MemorySpans:
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+class MemoryStream(MemorySpans, StreamController):
+    pass
+
+
+class MemoryPipe(MemorySpans, PipeController):
+    pass
+
+
+async def chunks(n: int):
+    for i in range(n):
+        yield BlockChunk(f"tok{i} ")
+
+
+def component():
+    async def agent():
+        response = yield MemoryStream(chunks(5), name="llm")
+        yield response
+    return MemoryPipe(agent, name="agent", span_type="component")
+
+
+@pytest.mark.asyncio
+async def test_event_levels():
+    with TracePolicy("off"):
+        events = [e async for e in component().stream_events(EventLogLevel.chunk)]
+        assert [e.type for e in events].count("stream_delta") == 5
+        assert events[0].type == "span_start" and events[-1].type == "span_end"
+        assert [e async for e in component().stream_events(EventLogLevel.span)] == []
+        assert [e async for e in component().stream_events(EventLogLevel.turn)] == []
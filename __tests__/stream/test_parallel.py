@@ -0,0 +1,106 @@
+import asyncio
+import uuid
+import pytest
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, PipeController, StreamController, parallel
+from promptview.prompt.tracing import TracePolicy
+
+
+class MemorySpans:
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+class MemoryStream(MemorySpans, StreamController):
+    pass
+
+
+class MemoryPipe(MemorySpans, PipeController):
+    pass
+
+
+async def chunks(name: str, n: int, fail: bool = False):
+    for i in range(n):
+        await asyncio.sleep(0.01)
+        if fail and i == 1:
+            raise RuntimeError("stream failed")
+        yield BlockChunk(f"{name}{i} ")
+
+
+def answer(name: str):
+    async def answer():
+        yield MemoryStream(chunks(name, 3), name=name)
+        yield f"{name} done"
+    return MemoryPipe(answer, name=name, span_type="component")
+
+
+def component(ordered: bool = False, fail: bool = False):
+    async def agent():
+        responses = yield parallel(
+            MemoryStream(chunks("a", 3, fail=fail), name="a"),
+            answer("b"),
+            ordered=ordered,
+        )
+        yield responses
+    return MemoryPipe(agent, name="agent", span_type="component")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ordered", [False, True])
+async def test_parallel_streams(ordered):
+    with TracePolicy("off"):
+        events = [e async for e in component(ordered).stream_events(EventLogLevel.chunk)]
+    deltas = [(e.name, e.path) for e in events if e.type == "stream_delta"]
+    assert deltas.count(("a", [1, 0, 0])) == 3
+    assert deltas.count(("b", [1, 1, 1, 0])) == 3
+    names = [name for name, _ in deltas]
+    if ordered:
+        assert names == ["a"] * 3 + ["b"] * 3
+    else:
+        assert names != sorted(names)
+    assert events[-2].payload == [None, "b done"]
+
+
+@pytest.mark.asyncio
+async def test_parallel_error_cancels_siblings():
+    with TracePolicy("off"):
+        events = []
+        with pytest.raises(RuntimeError):
+            async for event in component(fail=True).stream_events(EventLogLevel.chunk):
+                events.append(event)
+    assert events[-1].type == "stream_error" and events[-1].name == "a"
+    assert [e.name for e in events if e.type == "stream_delta"].count("b") < 3
+
+
+@pytest.mark.asyncio
+async def test_parallel_error_drains_and_closes_siblings():
+    closed = []
+
+    async def fast_failure():
+        yield BlockChunk("a0 ")
+        yield BlockChunk("a1 ")
+        raise RuntimeError("stream failed")
+
+    async def slow():
+        try:
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield BlockChunk(f"b{i} ")
+        finally:
+            closed.append("b")
+
+    sibling = MemoryStream(slow(), name="b")
+
+    async def agent():
+        yield parallel(sibling, MemoryStream(fast_failure(), name="a"))
+
+    with TracePolicy("off"):
+        events = []
+        with pytest.raises(RuntimeError):
+            async for event in MemoryPipe(agent, name="agent", span_type="component").stream_events(EventLogLevel.chunk):
+                events.append(event)
+    # the chunks queued before the failure are not lost
+    assert [e.name for e in events if e.type == "stream_delta"].count("a") == 2
+    assert closed == ["b"]
+    assert sibling.span.status == "failed" and sibling.span.metadata == {"error": "cancelled"}
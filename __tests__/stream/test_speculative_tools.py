@@ -0,0 +1,98 @@
+import asyncio
+import uuid
+import pytest
+from pydantic import BaseModel
+from promptview.block import Block, BlockChunk
+from promptview.block.block9 import BlockDeltaBuilder
+from promptview.prompt.flow_components import EventLogLevel, StreamController
+from promptview.prompt.tracing import TracePolicy
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+class Search(BaseModel):
+    query: str
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("thought", str) as thought:
+                thought /= "your thoughts"
+            with output.view("tools", list[str]) as tools:
+                with tools.view("tool", str) as tool:
+                    tool.field("name", str, "the name of the tool")
+                    tool /= "the tool arguments as JSON"
+    return system
+
+
+TOKENS = [
+    "<output>", "\n<thought>", " search", " twice", "\n</thought>", "\n<tools>",
+    '\n<tool name="Search">', '{"query":', ' "first"}', "</tool>",
+    '\n<tool name="Unknown">', "{}", "</tool>",
+    '\n<tool name="Search">', '\n{"query": "second"}', "\n</tool>",
+    "\n</tools>", *[" done"] * 5, "\n</output>",
+]
+
+
+@pytest.mark.asyncio
+async def test_tools_start_before_the_stream_ends():
+    started = []
+    read = []
+
+    async def llm():
+        for token in TOKENS:
+            read.append(token)
+            await asyncio.sleep(0)
+            yield BlockChunk(token)
+
+    async def run_tool(call):
+        started.append((call.tool.query, len(read)))
+        return f"results of {call.tool.query}"
+
+    stream = MemoryStream(llm(), name="llm").parse(response_schema(), tools=[Search], run_tool=run_tool)
+    with TracePolicy("off"):
+        events = [e async for e in await stream.stream_events(EventLogLevel.chunk)]
+    assert [query for query, _ in started] == ["first", "second"]
+    assert all(at < len(TOKENS) for _, at in started)
+    calls = [e.payload["tool_call"] for e in events if e.type == "stream_delta" and e.payload["type"] == "tool_call"]
+    assert [c["tool"] for c in calls] == [{"query": "first"}, {"query": "second"}]
+    builder = BlockDeltaBuilder()
+    for event in events:
+        if event.type == "stream_delta":
+            builder.apply(event.payload)
+    assert [(c.name, c.tool) for c in builder.tool_calls] == [("Search", {"query": "first"}), ("Search", {"query": "second"})]
+    assert sorted(stream.tool_results.values()) == ["results of first", "results of second"]
+
+
+@pytest.mark.asyncio
+async def test_tools_are_cancelled():
+    cancelled = []
+
+    async def llm():
+        for token in TOKENS[:10]:
+            yield BlockChunk(token)
+        await asyncio.sleep(0)
+        raise ValueError("connection lost")
+
+    async def run_tool(call):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(call.tool.query)
+            raise
+
+    stream = MemoryStream(llm(), name="llm").parse(response_schema(), tools=[Search], run_tool=run_tool)
+    with TracePolicy("off"), pytest.raises(ValueError):
+        async for _ in await stream.stream_events(EventLogLevel.chunk):
+            pass
+    assert stream.span.status == "failed"
+    assert cancelled == ["first"] and stream.tool_results == {}
+
+    stream = MemoryStream(llm(), name="llm")
+    with pytest.raises(ValueError):
+        stream.parse(response_schema(), run_tool=run_tool)
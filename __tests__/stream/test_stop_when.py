@@ -0,0 +1,46 @@
+import uuid
+import pytest
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, StreamController
+from promptview.prompt.tracing import TracePolicy
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+            with output.view("explanation", str) as explanation:
+                explanation /= "why"
+    return system
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stop_when", ["answer", ["answer"], lambda response: response.get("answer") is not None])
+async def test_stop_when_closes_the_stream(stop_when):
+    read = []
+    closed = []
+
+    async def llm():
+        try:
+            for token in ["<output>", "\n<answer>", " yes", " it", " is", "\n</answer>", "\n<explanation>", *[" because"] * 20, "\n</explanation>", "\n</output>"]:
+                read.append(token)
+                yield BlockChunk(token)
+        finally:
+            closed.append(True)
+
+    stream = MemoryStream(llm(), name="llm").parse(response_schema(), stop_when=stop_when)
+    with TracePolicy("off"):
+        events = [e async for e in await stream.stream_events(EventLogLevel.chunk)]
+    assert read[-1] == "\n</answer>" and closed == [True]
+    assert events[-1].type == "stream_end"
+    response = stream.get_response()
+    assert "yes it is" in response.get("answer").render()
+    assert response.get("explanation") is None
+    assert stream.span.metadata == {"stop_reason": "stop_when"}
@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import Buffer, Stream
+
+
+async def chunk_stream(n: int, fail: bool = False):
+    for i in range(n):
+        yield BlockChunk(f"tok{i} ")
+    if fail:
+        raise RuntimeError("stream failed")
+
+
+async def drain(buffer: Buffer, delay: float = 0):
+    values = []
+    async for value in buffer:
+        values.append(value)
+        await asyncio.sleep(delay)
+    return values
+
+
+@pytest.mark.asyncio
+async def test_block_keeps_order_and_bounds_depth():
+    buffer = Stream(chunk_stream(50)) | Buffer(4)
+    values = await drain(buffer, delay=0.001)
+    assert [v.content for v in values] == [f"tok{i} " for i in range(50)]
+    assert buffer.stats.max_depth == 4 and buffer.stats.producer_stall > 0
+
+
+@pytest.mark.asyncio
+async def test_coalesce_keeps_text():
+    buffer = Stream(chunk_stream(50)) | Buffer(2, policy="coalesce")
+    values = await drain(buffer, delay=0.001)
+    assert "".join(v.content for v in values) == "".join(f"tok{i} " for i in range(50))
+    assert buffer.stats.coalesced == 50 - len(values)
+
+
+@pytest.mark.asyncio
+async def test_error_after_values():
+    buffer = Stream(chunk_stream(5, fail=True)) | Buffer(8)
+    values = []
+    with pytest.raises(RuntimeError):
+        async for value in buffer:
+            values.append(value)
+    assert len(values) == 5
@@ -0,0 +1,34 @@
+import json
+import pytest
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import Stream
+from promptview.prompt.recording import open_record
+
+
+async def chunk_stream(n: int):
+    for i in range(n):
+        yield BlockChunk(f"tok{i} ")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["record.jsonl", "record.jsonl.gz"])
+async def test_buffered_recording(tmp_path, name):
+    path = str(tmp_path / name)
+    stream = Stream(chunk_stream(100))
+    stream.save_stream(path, flush_size=16)
+    chunks = [c async for c in stream]
+    with open_record(path) as f:
+        recorded = [BlockChunk.model_validate(json.loads(line)) for line in f]
+    assert [c.content for c in recorded] == [c.content for c in chunks]
+
+
+@pytest.mark.asyncio
+async def test_recording_with_asend(tmp_path):
+    path = str(tmp_path / "record.jsonl")
+    stream = Stream(chunk_stream(100))
+    stream.save_stream(path, flush_size=16)
+    with pytest.raises(StopAsyncIteration):
+        while True:
+            await stream.asend(None)
+    with open_record(path) as f:
+        assert len(f.readlines()) == 100
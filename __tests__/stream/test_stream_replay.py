@@ -0,0 +1,64 @@
+import asyncio
+import uuid
+import pytest
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, Stream, StreamController
+from promptview.prompt.recording import StreamReplay
+from promptview.prompt.tracing import TracePolicy
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+    return system
+
+
+TOKENS = ["<output>", "\n<answer>", *[f" word{i}" for i in range(20)], "\n</answer>", "\n</output>"]
+
+
+async def record(path: str):
+    async def llm():
+        for i, token in enumerate(TOKENS):
+            await asyncio.sleep(0.01 if i == 5 else 0)
+            yield BlockChunk(token)
+
+    stream = Stream(llm())
+    stream.save_stream(path, record_times=True)
+    return [c async for c in stream]
+
+
+@pytest.mark.asyncio
+async def test_replay_is_repeatable(tmp_path):
+    await record(str(tmp_path / "answer.jsonl"))
+    responses = []
+    for _ in range(2):
+        stream = MemoryStream(None, name="llm").load("answer", str(tmp_path), timing="none").parse(response_schema())
+        with TracePolicy("off"):
+            events = [e async for e in stream.replay.measure(await stream.stream_events(EventLogLevel.chunk))]
+        stats = stream.replay.stats
+        assert stats.chunks == len(TOKENS) and stats.events == len(events) and stats.waited == 0
+        assert 0 < stats.first_event <= stats.total
+        responses.append(stream.get_response().render())
+    assert responses[0] == responses[1] and "word19" in responses[0]
+
+
+@pytest.mark.asyncio
+async def test_replay_timing(tmp_path):
+    path = str(tmp_path / "answer.jsonl")
+    await record(path)
+    replay = StreamReplay.from_record(path, timing="recorded")
+    assert replay.schedule()[5] >= 0.01 and replay.schedule()[4] < 0.01
+    assert [c.content async for c in replay.stream()] == TOKENS
+    assert replay.stats.total >= 0.01
+
+    first = StreamReplay.from_record(path, timing="random", interval=0.01, seed=7).schedule()
+    assert first == StreamReplay.from_record(path, timing="random", interval=0.01, seed=7).schedule()
+    assert StreamReplay.from_record(path, timing="fixed", interval=0.01, speed=2).schedule()[:2] == [0.005, 0.01]
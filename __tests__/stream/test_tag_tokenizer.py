@@ -0,0 +1,54 @@
+import pytest
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import Parser, Stream
+from promptview.prompt.tag_tokenizer import TagTokenizer
+
+
+def tokenize(chunks: list[str], tags=None):
+    tokenizer = TagTokenizer(tags=tags)
+    events = []
+    for chunk in chunks:
+        events.extend(tokenizer.feed(chunk))
+    events.extend(tokenizer.close())
+    return [(e.type, e.tag or e.text) for e in events if e.type != "text"], events
+
+
+def test_tags_split_across_chunks():
+    tags, events = tokenize(['<ans', 'wer id="1', '">yes</', 'answer>'], tags=["answer"])
+    assert tags == [("start", "answer"), ("end", "answer")]
+    assert events[0].start == (0, 0) and events[0].end == (2, 2)
+    assert events[0].attrs == {"id": "1"}
+    assert events[2].start == (2, 5) and events[2].end == (3, 7)
+
+
+def test_malformed_output():
+    tags, events = tokenize(["<answer>x < y and <b>bold</b>", "</thought>"], tags=["answer", "thought"])
+    assert tags == [("start", "answer"), ("end", "answer")]
+    assert "".join(e.text for e in events if e.type == "text") == "x < y and <b>bold</b></thought>"
+    # an outer end tag closes the inner tag, the stream end closes the rest
+    tags, _ = tokenize(["<a><b>", "text</a><a>", "more"])
+    assert tags == [("start", "a"), ("start", "b"), ("end", "b"), ("end", "a"), ("start", "a"), ("end", "a")]
+
+
+@pytest.mark.asyncio
+async def test_parser_keeps_content_of_split_tags():
+    with Block("system") as schema:
+        with schema.view("output", str) as output:
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+    text = "<output>\n<answer>\nyes it is\n</answer>\n</output>"
+
+    async def chunks():
+        for i in range(0, len(text), 3):
+            yield BlockChunk(text[i:i + 3])
+
+    parser = Parser(schema, gen=Stream(chunks()))
+    try:
+        while True:
+            await parser.asend(None)
+    except StopAsyncIteration:
+        pass
+    answer = parser.res_ctx.instance.get("answer")
+    content = "".join(c.content for blk in answer.traverse() if isinstance(blk, Block) for c in blk.content.children)
+    assert "yes it i" in content
+    assert "".join(c.content for c in answer.postfix.children) == "\n</answer>\n<"
@@ -0,0 +1,41 @@
+import pytest
+from promptview.prompt.tracing import TracePolicy, TraceLevel, TraceDecision
+
+
+
+
+def test_trace_levels():
+    assert TracePolicy("off").decide() == TraceDecision(TraceLevel.off, persist_errors=False)
+    turn = TracePolicy("turn").decide()
+    assert turn.records_span(is_root=True)
+    assert not turn.records_span(is_root=False)
+    assert not turn.records_streams()
+    span = TracePolicy("span").decide()
+    assert span.records_span(is_root=False)
+    assert not span.records_streams()
+    full = TracePolicy().decide()
+    assert full.records_span(is_root=False)
+    assert full.records_streams()
+
+
+def test_sampled_policy():
+    policy = TracePolicy.sampled(50, seed=42)
+    decisions = [policy.decide() for _ in range(1000)]
+    recorded = [d for d in decisions if d.level == TraceLevel.full]
+    assert 400 < len(recorded) < 600
+    assert all(d.persist_errors for d in decisions)
+    assert all(d.level == TraceLevel.off for d in (TracePolicy.sampled(0).decide() for _ in range(10)))
+    with pytest.raises(ValueError):
+        TracePolicy(sample_rate=2)
+
+
+def test_policy_context():
+    assert TracePolicy.current().level == TraceLevel.full
+    TracePolicy.set_default("span")
+    try:
+        assert TracePolicy.current().level == TraceLevel.span
+        with TracePolicy("off"):
+            assert TracePolicy.current().level == TraceLevel.off
+        assert TracePolicy.current().level == TraceLevel.span
+    finally:
+        TracePolicy.set_default(None)
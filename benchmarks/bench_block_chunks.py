@@ -0,0 +1,54 @@
+"""
+Allocation benchmark for streamed BlockChunks.
+
+Appends N chunks to a response sentence the way the LLM streaming path does
+and reports throughput (chunks/sec) and memory (bytes/chunk, tracemalloc).
+
+    python benchmarks/bench_block_chunks.py --chunks 100000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from promptview.block.block9 import Block, BlockChunk
+
+
+def stream(chunks: int) -> Block:
+    response = Block(tags=["response"])
+    sent = response.content
+    for i in range(chunks):
+        sent.append(BlockChunk("tok ", logprob=-0.1))
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        gc.collect()
+        start = time.perf_counter()
+        stream(args.chunks)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    response = stream(args.chunks)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"chunks={args.chunks}")
+    print(f"  chunks/sec: {args.chunks / best:12.0f}")
+    print(f"  us/chunk:   {best / args.chunks * 1e6:12.2f}")
+    print(f"  bytes/chunk:{(after - before) / args.chunks:12.1f}")
+    print(f"  peak bytes/chunk:{(peak - before) / args.chunks:7.1f}")
+    del response
+
+
+if __name__ == "__main__":
+    main()
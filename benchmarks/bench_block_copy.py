@@ -0,0 +1,57 @@
+"""
+Prompt assembly benchmark for copies of a large shared block.
+
+Builds a large system block once, then for every turn copies it into a new
+prompt, changes one rule of the copy and renders the prompt, the way a
+prompt is rebuilt on every LLM call. Reports the time of the copy alone and
+of the whole turn.
+
+    python benchmarks/bench_block_copy.py --sections 100 --rules 20
+"""
+import argparse
+import time
+
+from promptview.block.block9 import Block
+
+
+def system_block(sections: int, rules: int) -> Block:
+    with Block("System", style="md", role="system") as system:
+        for i in range(sections):
+            with system(f"Section {i}", style="xml") as section:
+                for j in range(rules):
+                    section /= f"rule {j} of section {i}, with some words to render"
+    return system
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=100)
+    parser.add_argument("--rules", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    system = system_block(args.sections, args.rules)
+    system.render()
+
+    start = time.perf_counter()
+    for _ in range(args.turns):
+        system.copy()
+    copy_time = (time.perf_counter() - start) / args.turns
+
+    start = time.perf_counter()
+    for turn in range(args.turns):
+        prompt = Block()
+        sys_copy = prompt.append_child(system.copy())
+        sys_copy.children[turn % args.sections].append(f"extra rule for turn {turn}")
+        prompt.append_child(Block(f"question {turn}", role="user"))
+        prompt.render()
+    turn_time = (time.perf_counter() - start) / args.turns
+
+    blocks = sum(1 for _ in system.traverse())
+    print(f"blocks={blocks}")
+    print(f"  copy:                 {copy_time * 1e3:10.3f} ms")
+    print(f"  copy, change, render: {turn_time * 1e3:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
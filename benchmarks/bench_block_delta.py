@@ -0,0 +1,45 @@
+"""
+Streaming render benchmark.
+
+Streams N chunks into a response block and reads the rendered text after
+every chunk: with a full render, with render_delta on the block and with
+render_delta on the streamed sentence, the way an SSE consumer forwards
+only the new text.
+
+    python benchmarks/bench_block_delta.py --chunks 5000
+"""
+import argparse
+import time
+
+from promptview.block.block9 import Block, BlockChunk
+
+
+def stream(chunks: int, mode: str) -> float:
+    with Block("response", style="xml") as response:
+        field = response.append_child(Block("answer"))
+    sent = field.content
+    offset = 0
+    start = time.perf_counter()
+    for i in range(chunks):
+        sent.append(BlockChunk(f"tok{i} "))
+        if mode == "render":
+            response.render()
+        elif mode == "block delta":
+            offset += len(response.render_delta(offset))
+        else:
+            offset += len(sent.render_delta(offset))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=5000)
+    args = parser.parse_args()
+
+    for mode in ("render", "block delta", "sentence delta"):
+        elapsed = stream(args.chunks, mode)
+        print(f"{mode:15s} chunks={args.chunks} total={elapsed * 1e3:9.2f} ms  us/chunk={elapsed / args.chunks * 1e6:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
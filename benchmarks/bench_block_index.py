@@ -0,0 +1,54 @@
+"""
+Micro-benchmark for block9 index/path bookkeeping.
+
+Builds a stream block of N chunks (as the LLM streaming path does) and times
+model_dump(), repr_tree() and reading the path of every chunk.
+
+    python benchmarks/bench_block_index.py --chunks 10000
+"""
+import argparse
+import time
+
+from promptview.block.block9 import Block, BlockChunk
+
+
+def build_stream_block(chunks: int) -> Block:
+    root = Block("root")
+    stream = Block(tags=["response"])
+    root.append(stream)
+    for i in range(chunks):
+        stream.content.append(BlockChunk(f"tok{i} "))
+    return root
+
+
+def timeit(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    build_time = timeit(lambda: build_stream_block(args.chunks), args.repeat)
+    root = build_stream_block(args.chunks)
+    sent = root.children[0].content
+    results = {
+        "build": build_time,
+        "paths": timeit(lambda: [c.path for c in sent.children], args.repeat),
+        "model_dump": timeit(root.model_dump, args.repeat),
+        "repr_tree": timeit(lambda: root.repr_tree(verbose=True), args.repeat),
+    }
+    print(f"chunks={args.chunks}")
+    for name, seconds in results.items():
+        print(f"{name:>12}: {seconds * 1000:9.2f} ms  ({seconds / args.chunks * 1e6:7.2f} us/chunk)")
+
+
+if __name__ == "__main__":
+    main()
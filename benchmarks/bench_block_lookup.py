@@ -0,0 +1,71 @@
+"""
+Tag lookup benchmark, walking the tree against the tag index.
+
+Builds a response of N items, each with a few tagged children, and times
+`get` / `get_last` lookups without and with `Block.build_index`: the first
+and the last item, a tag that only the last item has (the first match is at
+the end of the tree) and a tag that is not in the tree.
+
+    python benchmarks/bench_block_lookup.py --items 1000
+"""
+import argparse
+import time
+
+from promptview.block.block9 import Block
+
+
+def response_block(items: int) -> Block:
+    with Block("Response") as response:
+        with response("Items", tags=["items"]) as section:
+            for i in range(items):
+                with section(f"item {i}", tags=["item"]) as item:
+                    item /= Block("thought", tags=["thought"])
+                    item /= Block("action", tags=["action"])
+                    if i == items - 1:
+                        item /= Block("answer", tags=["answer"])
+    return response
+
+
+LOOKUPS = [
+    ("get item", lambda b: b.get("item")),
+    ("get_last item", lambda b: b.get_last("item")),
+    ("get answer", lambda b: b.get("answer")),
+    ("get missing", lambda b: b.get("missing")),
+    ("get_last missing", lambda b: b.get_last("missing")),
+]
+
+
+def best_of(repeat: int, number: int, fn, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(*args)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    walked = response_block(args.items)
+    indexed = response_block(args.items)
+    start = time.perf_counter()
+    indexed.build_index()
+    build = time.perf_counter() - start
+
+    print(f"items={args.items} build index: {build * 1e3:.2f} ms")
+    print(f"  {'':18} {'walk us':>10} {'index us':>10}")
+    for name, lookup in LOOKUPS:
+        assert (lookup(walked) is None) == (lookup(indexed) is None)
+        walk = best_of(args.repeat, args.number, lookup, walked)
+        index = best_of(args.repeat, args.number, lookup, indexed)
+        print(f"  {name:18} {walk * 1e6:10.2f} {index * 1e6:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
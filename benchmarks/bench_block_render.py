@@ -0,0 +1,63 @@
+"""
+Re-render benchmark for a growing conversation history.
+
+Builds a history of N messages and renders it once per new message, the way
+the prompt is rebuilt on every turn. Reports the time of a cold render (empty
+caches) and of a re-render after appending one message, where only the new
+message and its ancestors are rendered again.
+
+    python benchmarks/bench_block_render.py --messages 100
+"""
+import argparse
+import time
+
+from promptview.block.block9 import Block
+
+
+def message(i: int) -> Block:
+    role = "user" if i % 2 == 0 else "assistant"
+    with Block(role, style="xml", role=role) as msg:
+        msg /= f"message number {i} with some text to render"
+        with msg("details", style="num-li") as details:
+            for j in range(5):
+                details /= f"point {j} of message {i}"
+    return msg
+
+
+def history(messages: int) -> Block:
+    with Block("History", style="md") as h:
+        for i in range(messages):
+            h.append_child(message(i))
+    return h
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    h = history(args.messages)
+    start = time.perf_counter()
+    first = h.render()
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert h.render() == first
+    cached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(args.turns):
+        h.append_child(message(args.messages + i))
+        h.render()
+    incremental = (time.perf_counter() - start) / args.turns
+
+    print(f"messages={args.messages}")
+    print(f"  cold render:        {cold * 1e3:10.2f} ms")
+    print(f"  unchanged render:   {cached * 1e3:10.2f} ms")
+    print(f"  render after append:{incremental * 1e3:10.2f} ms")
+    print(f"  speedup:            {cold / incremental:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
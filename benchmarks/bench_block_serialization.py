@@ -0,0 +1,81 @@
+"""
+Serialization benchmark, dict/JSON format against the columnar format.
+
+Builds a conversation of N messages made of streamed chunks with logprobs
+and round-trips it through `dump_block` / `load_block_dump` with JSON, and
+through `Block.to_bytes` / `Block.from_bytes`. Reports the encoded size and
+the encode and decode times, and the time to load a single message from the
+columnar bytes.
+
+    python benchmarks/bench_block_serialization.py --messages 200 --chunks 50
+"""
+import argparse
+import json
+import time
+
+from promptview.block.block9 import Block, BlockChunk
+from promptview.block.block9.columnar import BlockColumns
+from promptview.model3.block_models.block_log import dump_block, load_block_dump
+
+
+def conversation(messages: int, chunks: int) -> Block:
+    with Block("Conversation", style="md") as root:
+        for i in range(messages):
+            role = "user" if i % 2 == 0 else "assistant"
+            with root(role, role=role, style="xml", tags=["message"]) as msg:
+                sent = msg.content.copy()
+                for k in range(chunks):
+                    sent.append(BlockChunk(f" tok{k % 100}", logprob=-0.01 * k))
+                msg /= sent
+    return root
+
+
+def dict_encode(block: Block) -> bytes:
+    return json.dumps(dump_block(block)).encode()
+
+
+def dict_decode(data: bytes) -> Block:
+    rows = json.loads(data)
+    return load_block_dump([{**row, "block": {"json_content": row["json_content"]}} for row in rows])
+
+
+def best_of(repeat: int, fn, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = conversation(args.messages, args.chunks)
+    text = root.render()
+
+    dict_enc, dict_data = best_of(args.repeat, dict_encode, root)
+    dict_dec, _ = best_of(args.repeat, dict_decode, dict_data)
+    col_enc, col_data = best_of(args.repeat, Block.to_bytes, root)
+    col_dec, loaded = best_of(args.repeat, Block.from_bytes, col_data)
+    assert loaded.render() == text
+
+    def load_one(data: bytes):
+        cols = BlockColumns.from_bytes(data)
+        return cols.to_block(cols.children(0)[-1])
+
+    one, _ = best_of(args.repeat, load_one, col_data)
+
+    print(f"messages={args.messages} chunks/message={args.chunks}")
+    print(f"  {'':10} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+    print(f"  {'dict/json':10} {len(dict_data):10d} {dict_enc * 1e3:10.2f} {dict_dec * 1e3:10.2f}")
+    print(f"  {'columnar':10} {len(col_data):10d} {col_enc * 1e3:10.2f} {col_dec * 1e3:10.2f}")
+    print(f"  load one message from bytes: {one * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
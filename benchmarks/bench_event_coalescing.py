@@ -0,0 +1,87 @@
+"""
+Event coalescing benchmark for SSE/websocket delivery.
+
+A fake LLM streams --tokens tokens into a parsed response, one token every
+--latency seconds. The chunk level events are serialized with to_ndjson as
+a server sends them, once per event and with a Coalescer of each --window.
+Reports the frames sent, the bytes and the time spent serializing, and the
+longest time a token waited in the coalescer. Spans are kept in memory.
+
+    python benchmarks/bench_event_coalescing.py --tokens 1000 --window 0.02 0.05
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import Coalescer, EventLogLevel, StreamController
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+    return system
+
+
+async def fake_llm(tokens: int, latency: float, sent_at: dict[str, float]):
+    for token in ["<output>", "\n<answer>", *[f" w{i}" for i in range(tokens)], "\n</answer>", "\n</output>"]:
+        await asyncio.sleep(latency)
+        sent_at[token] = time.perf_counter()
+        yield BlockChunk(token)
+
+
+async def run(tokens: int, latency: float, window: float | None):
+    sent_at: dict[str, float] = {}
+    stream = MemoryStream(fake_llm(tokens, latency, sent_at), name="llm").parse(response_schema())
+    events = await stream.stream_events(EventLogLevel.chunk)
+    if window is not None:
+        events = Coalescer(window, gen=events)
+    frames = 0
+    size = 0
+    serialize = 0.0
+    wait = 0.0
+    async for event in events:
+        now = time.perf_counter()
+        if event.type == "stream_delta" and event.payload.get("type") == "block_append":
+            # the first token of a merged delta waited the longest
+            content = event.payload["chunk"]["content"]
+            first = content[:content.find(" ", 1)] if content.find(" ", 1) > 0 else content
+            if first in sent_at:
+                wait = max(wait, now - sent_at[first])
+        start = time.perf_counter()
+        size += len(event.to_ndjson())
+        serialize += time.perf_counter() - start
+        frames += 1
+    return frames, size, serialize, wait
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--window", type=float, nargs="+", default=[0.02, 0.05])
+    args = parser.parse_args()
+
+    # the first span imports the models, keep it out of the timings
+    await run(1, 0, None)
+    print(f"tokens={args.tokens} latency={args.latency * 1e3}ms")
+    for window in [None, *args.window]:
+        frames, size, serialize, wait = await run(args.tokens, args.latency, window)
+        name = "per event" if window is None else f"window {window * 1e3:.0f}ms"
+        print(
+            f"  {name:14} frames {frames:6d}  bytes {size:9d}  serialize {serialize * 1e3:7.1f} ms"
+            f"  max token wait {wait * 1e3:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
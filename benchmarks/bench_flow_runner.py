@@ -0,0 +1,68 @@
+"""
+FlowRunner per-chunk overhead benchmark.
+
+Runs a component that streams N chunks from an LLM-like stream through
+FlowRunner at every event level, and reports the time per chunk. Spans are
+kept in memory (nothing is written), so the numbers are the runner's own
+overhead and not the database's.
+
+    python benchmarks/bench_flow_runner.py --chunks 20000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, PipeController, StreamController
+
+
+class MemorySpans:
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+class MemoryStream(MemorySpans, StreamController):
+    pass
+
+
+class MemoryPipe(MemorySpans, PipeController):
+    pass
+
+
+async def chunks(n: int):
+    for i in range(n):
+        yield BlockChunk(f" tok{i % 100}")
+
+
+def component(n: int) -> PipeController:
+    async def agent():
+        response = yield MemoryStream(chunks(n), name="llm")
+        yield response
+    return MemoryPipe(agent, name="agent", span_type="component")
+
+
+async def run(n: int, level: EventLogLevel) -> tuple[float, int]:
+    events = 0
+    start = time.perf_counter()
+    async for _ in component(n).stream_events(level):
+        events += 1
+    return (time.perf_counter() - start) / n, events
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"chunks={args.chunks}")
+    for level in EventLogLevel:
+        results = [await run(args.chunks, level) for _ in range(args.repeat)]
+        best = min(t for t, _ in results)
+        print(f"  {level.name:6} {best * 1e6:8.2f} us/chunk  events={results[0][1]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
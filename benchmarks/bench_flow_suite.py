@@ -0,0 +1,247 @@
+"""
+Flow runtime benchmark suite.
+
+Runs an agent built with @component and @stream end to end: a synthetic
+LLM streams a response of a nested XML schema, every sub-stream parses it
+(Parser, BlockBuilderContext), FlowRunner emits the events of each event
+level and the spans are persisted as the trace policy says. Every scenario
+of the product of the options below is run at every event level and
+reports:
+- cpu_us_per_chunk: process time per LLM chunk
+- events_per_sec and first_event_ms: the events of the run
+- memory_growth_kb_per_turn: memory kept after a turn, with tracemalloc,
+  in a pass of its own so it does not slow the timed turns
+- db_writes_per_turn: model saves and block trees by model
+
+The LLM streams --rate chunks per second (0 for as fast as it can) of
+--chunk-size characters, the schema nests --depth views and the agent
+runs --streams sub-streams per turn. With --db mock (the default) the
+writes are counted and not sent, with --db postgres they go to the
+database of POSTGRES_URL in a turn of the main branch.
+
+    python benchmarks/bench_flow_suite.py --depth 1 4 --streams 1 4 --json results.json
+"""
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import platform
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from promptview.block import Block, BlockChunk
+from promptview.prompt.decorators import component, stream
+from promptview.prompt.flow_components import EventLogLevel
+from promptview.prompt.recording import StreamReplay
+from promptview.prompt.tracing import TracePolicy
+
+
+def response_schema(depth: int) -> Block:
+    with Block("system") as system:
+        parent = system
+        for i in range(depth):
+            parent = parent.view(f"level{i}", str)
+        with parent.view("answer", str) as answer:
+            answer /= "the answer"
+    return system
+
+
+def llm_chunks(depth: int, tokens: int, chunk_size: int) -> list[BlockChunk]:
+    tags = [f"level{i}" for i in range(depth)] + ["answer"]
+    text = "".join(f"<{tag}>\n" for tag in tags)
+    text += "".join(f" word{i}" for i in range(tokens))
+    text += "".join(f"\n</{tag}>" for tag in reversed(tags))
+    return [BlockChunk(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+
+
+def build_agent(replay: StreamReplay, schema: Block, streams: int):
+
+    @stream()
+    async def llm():
+        async for chunk in replay.stream():
+            yield chunk
+
+    @component()
+    async def agent():
+        response = None
+        for _ in range(streams):
+            response = yield llm().parse(schema)
+        yield response
+
+    return agent()
+
+
+class WriteCounter:
+    """
+    Counts the writes of the flow runtime: model saves, in-memory spans
+    persisted on errors and block trees. With `mock` nothing is sent, the
+    models get a fake id.
+    """
+
+    def __init__(self, mock: bool):
+        self.mock = mock
+        self.writes: Counter[str] = Counter()
+        self._ids = itertools.count(1)
+
+    def _fake_id(self, model):
+        if type(model).model_fields["id"].annotation is uuid.UUID:
+            return uuid.uuid4()
+        return next(self._ids)
+
+    def _count(self, kind: str | None, original):
+        counter = self
+
+        async def write(self, *args, **kwargs):
+            counter.writes[kind or type(self).__name__] += 1
+            if counter.mock:
+                if getattr(self, "id", None) is None:
+                    self.id = counter._fake_id(self)
+                return self
+            return await original(self, *args, **kwargs)
+        return write
+
+    def _count_blocks(self, original):
+        counter = self
+
+        async def insert_block(*args, **kwargs):
+            counter.writes["BlockTree"] += 1
+            if counter.mock:
+                return str(uuid.uuid4())
+            return await original(*args, **kwargs)
+        return insert_block
+
+    def install(self, stack: ExitStack):
+        from promptview.model3.model3 import Model
+        from promptview.model3.versioning.models import ExecutionSpan, VersionedModel
+        from promptview.model3.block_models import block_log
+
+        stack.enter_context(patch.object(Model, "save", self._count(None, Model.save)))
+        stack.enter_context(patch.object(ExecutionSpan, "persist", self._count(None, ExecutionSpan.persist)))
+        stack.enter_context(patch.object(block_log, "insert_block", self._count_blocks(block_log.insert_block)))
+        if self.mock:
+            # versioned models are written as if the run was in a turn
+            stack.enter_context(patch.object(VersionedModel, "save", self._count(None, VersionedModel.save)))
+            stack.enter_context(patch.object(VersionedModel, "_should_save_to_db", lambda self, *args: True))
+
+
+async def run_turn(agent, replay: StreamReplay, level: EventLogLevel, branch=None) -> int:
+    events = 0
+
+    async def consume():
+        nonlocal events
+        async for _ in replay.measure(agent.stream_events(level)):
+            events += 1
+
+    if branch is None:
+        await consume()
+    else:
+        async with branch.start_turn():
+            await consume()
+    return events
+
+
+async def run_scenario(args, depth: int, streams: int, chunk_size: int, level: EventLogLevel, branch=None) -> dict:
+    schema = response_schema(depth)
+    chunks = llm_chunks(depth, args.tokens, chunk_size)
+    replay = StreamReplay(chunks, timing="fixed" if args.rate else "none", interval=1 / args.rate if args.rate else 0.0)
+    counter = WriteCounter(mock=args.db == "mock")
+    with ExitStack() as stack, TracePolicy(args.trace):
+        counter.install(stack)
+        # warm up, the first run imports and caches what the next ones use
+        await run_turn(build_agent(replay, schema, streams), replay, level, branch)
+        counter.writes.clear()
+
+        cpu = 0.0
+        wall = 0.0
+        events = 0
+        first_event = []
+        for _ in range(args.turns):
+            agent = build_agent(replay, schema, streams)
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            events += await run_turn(agent, replay, level, branch)
+            wall += time.perf_counter() - wall_start
+            cpu += time.process_time() - cpu_start
+            first_event.append(replay.stats.first_event or 0.0)
+        writes = Counter({kind: count / args.turns for kind, count in counter.writes.items()})
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(args.memory_turns):
+            await run_turn(build_agent(replay, schema, streams), replay, level, branch)
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    chunks_per_turn = len(chunks) * streams
+    return {
+        "depth": depth,
+        "streams": streams,
+        "chunk_size": chunk_size,
+        "level": level.name,
+        "chunks_per_turn": chunks_per_turn,
+        "events_per_turn": events / args.turns,
+        "cpu_us_per_chunk": cpu / (chunks_per_turn * args.turns) * 1e6,
+        "wall_ms_per_turn": wall / args.turns * 1e3,
+        "events_per_sec": events / wall if wall else 0.0,
+        "first_event_ms": sorted(first_event)[len(first_event) // 2] * 1e3,
+        "memory_growth_kb_per_turn": (after - before) / args.memory_turns / 1024 if args.memory_turns else 0.0,
+        "memory_peak_kb": peak / 1024,
+        "db_writes_per_turn": sum(writes.values()),
+        "db_writes_by_model": dict(sorted(writes.items())),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=500, help="words in a response")
+    parser.add_argument("--rate", type=float, default=0, help="LLM chunks per second, 0 for no delay")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[8])
+    parser.add_argument("--depth", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--level", choices=[level.name for level in EventLogLevel], nargs="+", default=[level.name for level in EventLogLevel])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--memory-turns", type=int, default=3)
+    parser.add_argument("--trace", choices=["off", "turn", "span", "full"], default="full")
+    parser.add_argument("--db", choices=["mock", "postgres"], default="mock")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    branch = None
+    if args.db == "postgres":
+        from promptview.model3.namespace_manager2 import NamespaceManager
+        from promptview.model3.versioning.models import Branch
+        await NamespaceManager.initialize_all()
+        branch = await Branch.get_main()
+
+    results = []
+    print(f"tokens={args.tokens} rate={args.rate or 'max'} trace={args.trace} db={args.db} turns={args.turns}")
+    for depth, streams, chunk_size, level in itertools.product(args.depth, args.streams, args.chunk_size, args.level):
+        result = await run_scenario(args, depth, streams, chunk_size, EventLogLevel[level], branch)
+        results.append(result)
+        print(
+            f"  depth {depth:2d} streams {streams:2d} chunk {chunk_size:3d} {level:5}"
+            f"  cpu {result['cpu_us_per_chunk']:7.1f} us/chunk  {result['events_per_sec']:9.0f} events/s"
+            f"  first {result['first_event_ms']:6.2f} ms  mem {result['memory_growth_kb_per_turn']:7.1f} KB/turn"
+            f"  writes {result['db_writes_per_turn']:5.1f}/turn"
+        )
+
+    if args.json:
+        report = {
+            "benchmark": "flow_suite",
+            "python": platform.python_version(),
+            "config": {k: v for k, v in vars(args).items() if k != "json"},
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+Fan-out latency benchmark.
+
+A component calls N LLM-like streams, each one waits --latency seconds
+before the first chunk and streams --chunks chunks after it. It yields them
+one after another, then all at once with parallel(), and reports the wall
+time of both. Spans are kept in memory.
+
+    python benchmarks/bench_parallel.py --calls 5 --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, PipeController, StreamController, parallel
+
+
+class MemorySpans:
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+class MemoryStream(MemorySpans, StreamController):
+    pass
+
+
+class MemoryPipe(MemorySpans, PipeController):
+    pass
+
+
+async def llm_call(latency: float, n: int):
+    await asyncio.sleep(latency)
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield BlockChunk(f" tok{i}")
+
+
+def component(calls: int, latency: float, n: int, fan_out: bool) -> PipeController:
+    async def agent():
+        streams = [MemoryStream(llm_call(latency, n), name=f"llm_{i}") for i in range(calls)]
+        if fan_out:
+            responses = yield parallel(*streams)
+        else:
+            responses = []
+            for stream in streams:
+                responses.append((yield stream))
+        yield responses
+    return MemoryPipe(agent, name="agent", span_type="component")
+
+
+async def run(calls: int, latency: float, n: int, fan_out: bool) -> tuple[float, int]:
+    events = 0
+    start = time.perf_counter()
+    async for _ in component(calls, latency, n, fan_out).stream_events(EventLogLevel.chunk):
+        events += 1
+    return time.perf_counter() - start, events
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--chunks", type=int, default=200)
+    args = parser.parse_args()
+
+    # the first span imports the models, keep it out of the timings
+    await run(1, 0, 1, False)
+    print(f"calls={args.calls} latency={args.latency}s chunks={args.chunks}")
+    for name, fan_out in [("sequential", False), ("parallel", True)]:
+        seconds, events = await run(args.calls, args.latency, args.chunks, fan_out)
+        print(f"  {name:12} {seconds * 1e3:10.1f} ms {events:8d} events")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Speculative tool execution benchmark.
+
+A fake LLM streams a short thought, --calls tool calls and then --tail more
+tokens, one token every --latency seconds, every tool call takes --tool
+seconds. The tools are run after the stream ends (all of them at once), and
+speculatively, started by the parser as soon as their tag is closed. Reports
+the time until the response and all the tool results are ready. Spans are
+kept in memory.
+
+    python benchmarks/bench_speculative_tools.py --calls 3 --tool 0.3
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from pydantic import BaseModel
+
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, StreamController
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+class Search(BaseModel):
+    query: str
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("thought", str) as thought:
+                thought /= "your thoughts"
+            with output.view("tools", list[str]) as tools:
+                with tools.view("tool", str) as tool:
+                    tool.field("name", str, "the name of the tool")
+                    tool /= "the tool arguments as JSON"
+            with output.view("answer", str) as answer:
+                answer /= "what you tell the user while the tools run"
+    return system
+
+
+def llm_tokens(calls: int, tail: int) -> list[str]:
+    tokens = ["<output>", "\n<thought>", *[f" step{i}" for i in range(20)], "\n</thought>", "\n<tools>"]
+    for i in range(calls):
+        tokens += ['\n<tool name="Search">', json.dumps({"query": f"query {i}"}), "</tool>", *[" "] * 10]
+    tokens += ["\n</tools>", "\n<answer>", *[f" word{i}" for i in range(tail)], "\n</answer>", "\n</output>"]
+    return tokens
+
+
+async def fake_llm(tokens: list[str], latency: float):
+    for token in tokens:
+        await asyncio.sleep(latency)
+        yield BlockChunk(token)
+
+
+async def run(tokens: list[str], latency: float, tool_seconds: float, speculative: bool) -> float:
+    async def run_tool(call):
+        await asyncio.sleep(tool_seconds)
+        return f"results of {call.tool.query}"
+
+    start = time.perf_counter()
+    stream = MemoryStream(fake_llm(tokens, latency), name="llm")
+    if speculative:
+        stream.parse(response_schema(), tools=[Search], run_tool=run_tool)
+    else:
+        stream.parse(response_schema(), tools=[Search])
+    async for _ in await stream.stream_events(EventLogLevel.span):
+        pass
+    if speculative:
+        results = list(stream.tool_results.values())
+    else:
+        results = await asyncio.gather(*(run_tool(call) for call in stream._parser.tool_calls))
+    seconds = time.perf_counter() - start
+    assert len(results) == len(stream._parser.tool_calls)
+    return seconds
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--tail", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--tool", type=float, default=0.3)
+    args = parser.parse_args()
+
+    tokens = llm_tokens(args.calls, args.tail)
+    # the first span imports the models, keep it out of the timings
+    await run(llm_tokens(1, 1), 0, 0, True)
+    print(f"calls={args.calls} tokens={len(tokens)} latency={args.latency * 1e3}ms tool={args.tool * 1e3}ms")
+    for name, speculative in [("after the stream", False), ("speculative", True)]:
+        seconds = await run(tokens, args.latency, args.tool, speculative)
+        print(f"  {name:17} {seconds * 1e3:9.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Early stop benchmark on a verbose model.
+
+A fake LLM streams a short answer and then a long explanation that the
+caller does not need, one token every --latency seconds. The response is
+parsed with and without `stop_when="answer"` and the benchmark reports the
+time to done, the tokens read from the LLM and whether the LLM request
+was closed. Spans are kept in memory.
+
+    python benchmarks/bench_stop_when.py --answer 50 --explanation 500
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, StreamController
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+            with output.view("explanation", str) as explanation:
+                explanation /= "why"
+    return system
+
+
+class FakeLLM:
+
+    def __init__(self, answer: int, explanation: int, latency: float):
+        self.tokens = [
+            "<output>", "\n<answer>", *[f" word{i}" for i in range(answer)], "\n</answer>",
+            "\n<explanation>", *[f" because{i}" for i in range(explanation)], "\n</explanation>", "\n</output>",
+        ]
+        self.latency = latency
+        self.read = 0
+        self.closed = False
+
+    async def stream(self):
+        try:
+            for token in self.tokens:
+                await asyncio.sleep(self.latency)
+                self.read += 1
+                yield BlockChunk(token)
+        finally:
+            self.closed = True
+
+
+async def run(llm: FakeLLM, stop_when) -> tuple[float, MemoryStream]:
+    stream = MemoryStream(llm.stream(), name="llm").parse(response_schema(), stop_when=stop_when)
+    start = time.perf_counter()
+    async for _ in await stream.stream_events(EventLogLevel.span):
+        pass
+    return time.perf_counter() - start, stream
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answer", type=int, default=50)
+    parser.add_argument("--explanation", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.002)
+    args = parser.parse_args()
+
+    # the first span imports the models, keep it out of the timings
+    await run(FakeLLM(1, 1, 0), None)
+    print(f"answer={args.answer} explanation={args.explanation} latency={args.latency * 1e3}ms")
+    for name, stop_when in [("full stream", None), ("stop_when", "answer")]:
+        llm = FakeLLM(args.answer, args.explanation, args.latency)
+        seconds, stream = await run(llm, stop_when)
+        answer = stream.get_response().get("answer")
+        print(
+            f"  {name:12} {seconds * 1e3:9.1f} ms  tokens read {llm.read:5d}/{len(llm.tokens)}"
+            f"  request closed {llm.closed}  span {stream.span.status} {stream.span.metadata}"
+            f"  answer {len(answer.render())} chars"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
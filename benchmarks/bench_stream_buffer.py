@@ -0,0 +1,66 @@
+"""
+Bounded queue benchmark with a slow consumer.
+
+An LLM-like stream produces N chunks, --produce seconds apart (network
+time), and the consumer spends --consume seconds on every value it gets
+(a websocket send, a DB write). Without a buffer the two times add up
+per chunk. With a Buffer the stream is read in its own task while the
+consumer works. Reports the wall time, the values the consumer got and
+the buffer stats, for every policy.
+
+    python benchmarks/bench_stream_buffer.py --chunks 500 --capacity 32
+"""
+import argparse
+import asyncio
+import time
+
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import Buffer, Stream
+
+
+async def llm_stream(n: int, produce: float):
+    for i in range(n):
+        await asyncio.sleep(produce)
+        yield BlockChunk(f" tok{i}", logprob=-0.1)
+
+
+async def consume(source, consume: float) -> tuple[float, int, str]:
+    start = time.perf_counter()
+    values = 0
+    text = []
+    try:
+        while True:
+            value = await source.asend(None)
+            values += 1
+            text.append(value.content)
+            await asyncio.sleep(consume)
+    except StopAsyncIteration:
+        pass
+    return time.perf_counter() - start, values, "".join(text)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--produce", type=float, default=0.002)
+    parser.add_argument("--consume", type=float, default=0.003)
+    parser.add_argument("--capacity", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"chunks={args.chunks} produce={args.produce * 1e3}ms consume={args.consume * 1e3}ms capacity={args.capacity}")
+    seconds, values, expected = await consume(Stream(llm_stream(args.chunks, args.produce)), args.consume)
+    print(f"  {'no buffer':10} {seconds * 1e3:9.1f} ms {values:6d} values")
+    for policy in ["block", "drop", "coalesce"]:
+        buffer = Stream(llm_stream(args.chunks, args.produce)) | Buffer(args.capacity, policy=policy)
+        seconds, values, text = await consume(buffer, args.consume)
+        stats = buffer.stats
+        print(
+            f"  {policy:10} {seconds * 1e3:9.1f} ms {values:6d} values"
+            f"  max depth {stats.max_depth:4d}  dropped {stats.dropped:5d}  coalesced {stats.coalesced:5d}"
+            f"  producer stall {stats.producer_stall * 1e3:8.1f} ms  consumer stall {stats.consumer_stall * 1e3:8.1f} ms"
+            f"  text {'kept' if text == expected else 'lost'}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+"""
+Streaming tag parser benchmark on recorded streams.
+
+Records a generated LLM response (a thought and a long answer, one token
+per chunk) with StreamRecorder, or takes an existing recording with
+--record, and replays it:
+- through the old tag detection of Parser: XMLPullParser fed chunk by
+  chunk, with the whole content concatenated again on every chunk.
+- through TagTokenizer alone.
+- through the whole Parser, building the response block (generated
+  recordings only, they match the benchmark schema).
+
+Reports the time per chunk and the throughput, for a few stream lengths
+to show how the cost per chunk grows with the stream.
+
+    python benchmarks/bench_stream_parser.py --tokens 2000 8000 32000
+    python benchmarks/bench_stream_parser.py --malformed
+    python benchmarks/bench_stream_parser.py --record records/answer.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from lxml import etree
+
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import Parser, Stream
+from promptview.prompt.recording import StreamRecorder, open_record
+from promptview.prompt.tag_tokenizer import TagTokenizer
+
+
+WORDS = ["the", "answer", "is", "a", "stream", "of", "tokens", "with", "some", "longer", "words", "and"]
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("thought", str) as thought:
+                thought /= "think step by step"
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+    return system
+
+
+def response_tokens(tokens: int, malformed: bool = False) -> list[str]:
+    rng = random.Random(0)
+    words = [" " + rng.choice(WORDS) if i % 12 else "\n" + rng.choice(WORDS) for i in range(tokens)]
+    if malformed:
+        # a comparison and a tag that is not in the schema, XMLPullParser fails on both
+        words[tokens // 2] = " x < y and <b>bold</b>"
+    half = tokens // 4
+    return ["<output>", "\n<thought>", *words[:half], "\n</thought>", "\n<answer>", *words[half:], "\n</answer>", "\n</output>"]
+
+
+async def record(path: str, texts: list[str]):
+    recorder = StreamRecorder(path)
+    for text in texts:
+        recorder.write(BlockChunk(text))
+    await recorder.close()
+
+
+def load(path: str) -> list[BlockChunk]:
+    with open_record(path) as f:
+        return [BlockChunk.model_validate(json.loads(line)) for line in f]
+
+
+class XmlPullTags:
+    """Tag detection of the Parser before TagTokenizer."""
+
+    def __init__(self):
+        self.parser = etree.XMLPullParser(events=("start", "end"))
+        self._full_content = ""
+        self.feed("<stream_start>")
+
+    def feed(self, content: str):
+        self._full_content += content
+        self.parser.feed(content)
+        return list(self.parser.read_events())
+
+
+def bench_tags(chunks: list[BlockChunk], tags: list[str]) -> dict[str, float]:
+    texts = [c.content for c in chunks]
+    results = {}
+    start = time.perf_counter()
+    try:
+        xml = XmlPullTags()
+        for text in texts:
+            xml.feed(text)
+        results["XMLPullParser"] = time.perf_counter() - start
+    except etree.XMLSyntaxError:
+        results["XMLPullParser"] = float("nan")
+    start = time.perf_counter()
+    tokenizer = TagTokenizer(tags=tags)
+    for text in texts:
+        tokenizer.feed(text)
+    tokenizer.close()
+    results["TagTokenizer"] = time.perf_counter() - start
+    return results
+
+
+async def bench_parser(chunks: list[BlockChunk]) -> float:
+    async def replay():
+        for chunk in chunks:
+            yield chunk
+    parser = Parser(response_schema(), gen=Stream(replay()))
+    start = time.perf_counter()
+    try:
+        while True:
+            await parser.asend(None)
+    except StopAsyncIteration:
+        pass
+    return time.perf_counter() - start
+
+
+def report(name: str, chunks: list[BlockChunk], seconds: float):
+    size = sum(len(c.content) for c in chunks)
+    if seconds != seconds:
+        print(f"  {name:15} {'failed':>12}")
+        return
+    print(f"  {name:15} {seconds / len(chunks) * 1e6:9.2f} us/chunk {size / seconds / 1e6:9.2f} MB/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, nargs="+", default=[2000, 8000, 32000])
+    parser.add_argument("--malformed", action="store_true", help="put text that is not well formed XML in the answer")
+    parser.add_argument("--record", type=str, default=None, help="replay this .jsonl(.gz) recording instead")
+    args = parser.parse_args()
+
+    tags = ["output", "thought", "answer"]
+    if args.record:
+        chunks = load(args.record)
+        print(f"record={args.record} chunks={len(chunks)}")
+        for name, seconds in bench_tags(chunks, tags=None).items():
+            report(name, chunks, seconds)
+        return
+
+    tmp = tempfile.mkdtemp()
+    for tokens in args.tokens:
+        path = os.path.join(tmp, f"response_{tokens}.jsonl")
+        await record(path, response_tokens(tokens, args.malformed))
+        chunks = load(path)
+        print(f"chunks={len(chunks)}")
+        for name, seconds in bench_tags(chunks, tags).items():
+            report(name, chunks, seconds)
+        report("Parser", chunks, await bench_parser(chunks))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
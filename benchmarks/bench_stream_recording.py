@@ -0,0 +1,88 @@
+"""
+Stream recording benchmark.
+
+Streams N chunks through a Stream and reports the time the recording takes
+on the event loop per chunk (mean and worst), and the total time including
+the writes that finish after the last chunk. It compares the old recording,
+which opened the file and wrote one line per chunk, with the buffered
+StreamRecorder, plain and gzip compressed.
+
+    python benchmarks/bench_stream_recording.py --chunks 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from promptview.block import BlockChunk
+from promptview.prompt.flow_components import Stream
+
+
+class TimedStream(Stream):
+
+    def __init__(self, gen):
+        super().__init__(gen)
+        self.loop_times: list[float] = []
+
+    async def post_next(self, value=None):
+        start = time.perf_counter()
+        await super().post_next(value)
+        self.loop_times.append(time.perf_counter() - start)
+        return value
+
+
+class LineStream(TimedStream):
+    """The recording Stream did before: one open and write per chunk."""
+
+    def __init__(self, gen, path: str):
+        super().__init__(gen)
+        self._path = path
+
+    async def post_next(self, value=None):
+        start = time.perf_counter()
+        with open(self._path, "a") as f:
+            f.write(json.dumps(value.model_dump()) + "\n")
+        self.loop_times.append(time.perf_counter() - start)
+        return value
+
+
+async def chunks(n: int):
+    for i in range(n):
+        yield BlockChunk(f" token{i % 100}", logprob=-0.01 * (i % 100))
+
+
+async def run(stream: TimedStream) -> tuple[float, float, float]:
+    start = time.perf_counter()
+    count = 0
+    async for _ in stream:
+        count += 1
+    total = time.perf_counter() - start
+    times = stream.loop_times
+    return sum(times) / count, max(times), total / count
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    results = {}
+    results["line per chunk"] = await run(LineStream(chunks(args.chunks), os.path.join(tmp, "lines.jsonl")))
+    for name, file in [("buffered", "buffered.jsonl"), ("buffered gzip", "buffered.jsonl.gz")]:
+        stream = TimedStream(chunks(args.chunks))
+        stream.save_stream(os.path.join(tmp, file))
+        results[name] = await run(stream)
+
+    print(f"chunks={args.chunks}")
+    print(f"  {'':15} {'loop us':>10} {'worst us':>10} {'total us':>10}")
+    for name, (mean, worst, total) in results.items():
+        print(f"  {name:15} {mean * 1e6:10.2f} {worst * 1e6:10.2f} {total * 1e6:10.2f}")
+    for file in sorted(os.listdir(tmp)):
+        print(f"  {file:20} {os.path.getsize(os.path.join(tmp, file)):10d} bytes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Stream replay benchmark.
+
+Writes a record of --tokens tokens and replays it through a parsed stream
+without delays, --runs times: reading and validating every line while the
+stream runs, the way load() used to, and with a StreamReplay that loaded
+the record once. Reports the mean time to the first event, the total time
+and the pipeline time per chunk. Spans are kept in memory.
+
+    python benchmarks/bench_stream_replay.py --tokens 2000 --runs 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+from promptview.block import Block, BlockChunk
+from promptview.prompt.flow_components import EventLogLevel, StreamController
+from promptview.prompt.recording import StreamReplay, open_record
+
+
+class MemoryStream(StreamController):
+    async def _record_span(self, span):
+        span.id = uuid.uuid4()
+        return span
+
+
+def response_schema() -> Block:
+    with Block("system") as system:
+        with system.view("output", str) as output:
+            with output.view("answer", str) as answer:
+                answer /= "the answer"
+    return system
+
+
+def write_record(path: str, tokens: int):
+    with open(path, "w") as f:
+        for token in ["<output>", "\n<answer>", *[f" word{i}" for i in range(tokens)], "\n</answer>", "\n</output>"]:
+            f.write(json.dumps(BlockChunk(token).model_dump()) + "\n")
+
+
+async def read_per_chunk(path: str):
+    with open_record(path) as f:
+        for line in f:
+            yield BlockChunk.model_validate(json.loads(line))
+
+
+async def run(chunks) -> tuple[float, float, int]:
+    start = time.perf_counter()
+    first = None
+    stream = MemoryStream(chunks, name="llm").parse(response_schema())
+    async for _ in await stream.stream_events(EventLogLevel.chunk):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dir:
+        path = os.path.join(dir, "record.jsonl")
+        write_record(path, args.tokens)
+        replay = StreamReplay.from_record(path, timing="none")
+        chunks = len(replay.chunks)
+        # the first span imports the models, keep it out of the timings
+        await run(replay.stream())
+
+        results = {"read per chunk": [], "replay": []}
+        for _ in range(args.runs):
+            results["read per chunk"].append(await run(read_per_chunk(path)))
+            results["replay"].append(await run(replay.stream()))
+
+    print(f"chunks={chunks} runs={args.runs}")
+    for name, timings in results.items():
+        first = statistics.mean(t[0] for t in timings)
+        total = statistics.mean(t[1] for t in timings)
+        spread = statistics.pstdev(t[1] for t in timings)
+        print(
+            f"  {name:15} first event {first * 1e3:7.2f} ms  total {total * 1e3:8.1f} ms (+-{spread * 1e3:.1f})"
+            f"  per chunk {total / chunks * 1e6:6.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+Style resolution benchmark on a large XML-schema prompt.
+
+Builds a nested XML prompt (sections of fields, every field a streamed
+sentence of chunks) and measures cold renders, with the memoized renders
+dropped before every run so each node resolves its styles again.
+
+    python benchmarks/bench_style_resolve.py --sections 50 --fields 20
+"""
+import argparse
+import time
+
+from promptview.block.block9 import Block, BlockChunk
+
+
+def schema_prompt(sections: int, fields: int, words: int) -> Block:
+    with Block("schema", style="xml") as root:
+        for i in range(sections):
+            with root(f"section_{i}", style="xml") as section:
+                for j in range(fields):
+                    with section(f"field_{j}", style="xml") as field:
+                        sent = field.content.copy()
+                        for k in range(words):
+                            sent.append(BlockChunk(f"w{k}"))
+                        field /= sent
+    return root
+
+
+def clear_caches(block: Block):
+    for node in block.traverse():
+        if isinstance(node, Block):
+            node.invalidate()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=50)
+    parser.add_argument("--fields", type=int, default=20)
+    parser.add_argument("--words", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    prompt = schema_prompt(args.sections, args.fields, args.words)
+    blocks = sum(1 for node in prompt.traverse() if isinstance(node, Block))
+    best = float("inf")
+    for _ in range(args.repeat):
+        clear_caches(prompt)
+        start = time.perf_counter()
+        text = prompt.render()
+        best = min(best, time.perf_counter() - start)
+
+    print(f"blocks={blocks} chars={len(text)}")
+    print(f"  cold render: {best * 1e3:10.2f} ms")
+    print(f"  us/block:    {best / blocks * 1e6:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from fastapi.responses import StreamingResponse
 
 from promptview.context.execution_context import ExecutionContext
 from promptview.model3.context import Context
-from promptview.prompt.flow_components import EventLogLevel
+from promptview.prompt.flow_components import Coalescer, EventLogLevel
 from promptview.block.util import StreamEvent
 from promptview.model3 import Branch
 from promptview.block import Block
@@ -115,6 +115,7 @@ class Agent():
         filter_events: Set[str] | None = None,
         auto_commit: bool = True,
         metadata: dict | None = None,
+        coalesce_window: float | None = None,
     ):
 
         async with ctx.start_turn() as turn:            
@@ -126,7 +127,11 @@ class Agent():
                 if message.role == "user":
                     events = []  
                     index = 0
-                    async for event in self.agent_component(message).stream_events():
+                    agent_events = self.agent_component(message).stream_events()
+                    if coalesce_window:
+                        # fewer and larger delta events, one frame each on the wire
+                        agent_events = Coalescer(coalesce_window, gen=agent_events)
+                    async for event in agent_events:
                         event = self.update_metadata(ctx, index, events, event)
                         index += 1
                         if filter_events and event.type not in filter_events:
@@ -1,5 +1,9 @@
 from .block import Block, BlockChunk, BlockSent, BlockSchema
 from .base_blocks import BaseBlock, BaseContent, BlockSequence
+from .block_schema import BlockDeltaBuilder
+from .budget import BudgetPolicy, DropOldest, TruncateMiddle, TagPriority
+from .columnar import BlockColumns
+from .tag_index import BlockIndex
 __all__ = [
     "Block",
     "BlockChunk",
@@ -8,4 +12,11 @@ __all__ = [
     "BaseContent",
     "BlockSequence",
     "BlockSchema",
-]
\ No newline at end of file
+    "BlockDeltaBuilder",
+    "BudgetPolicy",
+    "DropOldest",
+    "TruncateMiddle",
+    "TagPriority",
+    "BlockColumns",
+    "BlockIndex",
+]
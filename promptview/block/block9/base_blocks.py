@@ -14,6 +14,30 @@ class UnsetType:
 
 CONTENT = TypeVar("CONTENT")
 
+# marks the temporary copies the renderer styles, they never invalidate caches
+RENDER_SHADOW = UnsetType()
+
+
+_slots_cache: dict[type, tuple] = {}
+
+
+def slot_descriptors(cls: type) -> tuple:
+    """
+    (name, get, set) of every slot of `cls`, bound to the slot descriptors.
+    They skip __setattr__ and __getattr__, so nodes can be copied without
+    invalidating caches or materializing lazy copies.
+    """
+    slots = _slots_cache.get(cls)
+    if slots is None:
+        found = {}
+        for klass in reversed(cls.__mro__):
+            for name in getattr(klass, "__slots__", ()):
+                if name != "__weakref__":
+                    slot = klass.__dict__[name]
+                    found[name] = (name, slot.__get__, slot.__set__)
+        slots = _slots_cache[cls] = tuple(found.values())
+    return slots
+
 
 class BaseBlock(Generic[CONTENT]):
     __slots__ = [
@@ -21,9 +45,16 @@ class BaseBlock(Generic[CONTENT]):
         "parent",
         "prefix",
         "postfix", 
-        "id",      
+        "_id",      
+        "_index",
+        "_render_cache",
     ]   
     
+    # lazy copies sharing the structure of this block and the block a lazy
+    # copy shares its structure with, see Block.copy
+    _copies = None
+    _source = None
+    
     def __init__(
         self,
         content: CONTENT,
@@ -33,11 +64,85 @@ class BaseBlock(Generic[CONTENT]):
         parent: "BlockSequence | None" = None,
         id: str | None = None,        
     ):
-        self.content: CONTENT = content
+        self._render_cache = None
         self.parent: "BlockSequence | None" = parent
+        self.content: CONTENT = content
         self.prefix: CONTENT = prefix
         self.postfix: CONTENT = postfix
-        self.id: str = id or uuid4().hex[:8]
+        # ids are generated on first access, most streamed chunks never need one
+        self._id: str | None = id or None
+        # position in parent.children, kept up to date by the parent
+        self._index: int | None = None
+    
+    def invalidate(self):
+        """
+        Drop the memoized rendering of this block and of all its ancestors.
+        Called before a block changes, so lazy copies that share it are
+        detached while they still see the old state.
+        """
+        if getattr(self, "_source", None) is not None:
+            self._materialize()
+        node = self
+        shared = False
+        while node is not None:
+            cache = getattr(node, "_render_cache", None)
+            if cache is RENDER_SHADOW:
+                return
+            if cache is not None:
+                object.__setattr__(node, "_render_cache", None)
+            if getattr(node, "_copies", None):
+                shared = True
+            node = getattr(node, "parent", None)
+        if shared:
+            self._detach_copies()
+    
+    def _detach_copies(self):
+        """Materialize the lazy copies along the path from the root to this block."""
+        path = []
+        node = self
+        while node is not None:
+            path.append(node)
+            node = getattr(node, "parent", None)
+        for node in reversed(path):
+            copies = getattr(node, "_copies", None)
+            if copies:
+                object.__setattr__(node, "_copies", None)
+                # materializing a copy makes lazy copies of the next block on the path
+                for copy in list(copies.values()):
+                    copy._materialize()
+    
+    def __getstate__(self):
+        # a lazy copy is materialized, the copies of the block are tracked with
+        # weak references and the render memo is rebuilt on the next render
+        if getattr(self, "_source", None) is not None:
+            self._materialize()
+        state = {}
+        for name, get, _ in slot_descriptors(type(self)):
+            if name in ("_copies", "_render_cache"):
+                continue
+            try:
+                state[name] = get(self)
+            except AttributeError:
+                continue
+        return state
+    
+    def __setstate__(self, state: dict):
+        # set through the slots, __setattr__ would invalidate a half built tree
+        for name, _, set in slot_descriptors(type(self)):
+            if name in state:
+                set(self, state[name])
+            elif name in ("_copies", "_render_cache"):
+                set(self, None)
+    
+    @property
+    def id(self) -> str:
+        if self._id is None:
+            self._id = uuid4().hex[:8]
+        return self._id
+    
+    @id.setter
+    def id(self, value: str | None):
+        self._id = value
     
     @property
     def path(self) -> list[int]:
@@ -72,8 +177,13 @@ class BaseBlock(Generic[CONTENT]):
         
         
     def __eq__(self, other: object):
+        if self is other:
+            return True
         if isinstance(other, BaseBlock):
-            return self.id == other.id
+            # a block without an id yet can only be equal to itself
+            if self._id is None or other._id is None:
+                return False
+            return self._id == other._id
         else:
             return False
     
@@ -89,6 +199,13 @@ class BlockSequence(Generic[CONTENT,CHILD], BaseBlock[CONTENT]):
         "children",  
     ]
     
+    _render_fields = frozenset({"content", "prefix", "postfix", "children", "styles", "attrs", "role", "tags"})
+    
+    def __setattr__(self, name: str, value: Any):
+        if name in self._render_fields:
+            self.invalidate()
+        object.__setattr__(self, name, value)
+    
     def __init__(
         self,
         content: CONTENT,
@@ -101,8 +218,6 @@ class BlockSequence(Generic[CONTENT,CHILD], BaseBlock[CONTENT]):
     ):
         BaseBlock.__init__(self, content=content, parent=parent, prefix=prefix, postfix=postfix, id=id)
         self.children: list[CHILD] = []
-        self.parent: "BlockSequence | None" = parent
-        self.id: str = uuid4().hex[:8]
         if children is not None:
             for child in children:
                 self.append(child)
@@ -124,8 +239,20 @@ class BlockSequence(Generic[CONTENT,CHILD], BaseBlock[CONTENT]):
             return None
         return self.parent.index_of(self)
         
-    def index_of(self, child: CHILD) -> int | None:        
-        return self.children.index(child)
+    def index_of(self, child: CHILD) -> int | None:
+        idx = child._index
+        if idx is not None and idx < len(self.children):
+            current = self.children[idx]
+            if current is child or current == child:
+                return idx
+        # children list was changed directly, fall back to a scan
+        idx = self.children.index(child)
+        child._index = idx
+        return idx
+    
+    def _reindex(self, start: int = 0):
+        for i in range(start, len(self.children)):
+            self.children[i]._index = i
     
     def _parse_path(self, path: PathType):
         if isinstance(path, int):
@@ -138,10 +265,9 @@ class BlockSequence(Generic[CONTENT,CHILD], BaseBlock[CONTENT]):
     def path_get(self, path: PathType) -> "BlockSequence | BaseBlock | None":
         _path = self._parse_path(path)
         target = self
-        while _path:
-            idx = _path.pop(0)
+        for i, idx in enumerate(_path):
             if not isinstance(target, BlockSequence):
-                if len(_path) == 0:
+                if i == len(_path) - 1:
                     return target
                 raise ValueError(f"Invalid path: {path}, target is not a BlockSequence and not supporting insert")
             if idx >= len(target.children):
@@ -153,8 +279,7 @@ class BlockSequence(Generic[CONTENT,CHILD], BaseBlock[CONTENT]):
     def path_exists(self, path: PathType) -> bool:
         path = self._parse_path(path)
         target = self
-        while path:
-            idx = path.pop(0)
+        for idx in path:
             if not isinstance(target, BlockSequence):
                 return False
             if idx >= len(target.children):
@@ -171,19 +296,25 @@ class BlockSequence(Generic[CONTENT,CHILD], BaseBlock[CONTENT]):
     
     
     def append_child(self, child: CHILD):
+        self.invalidate()
+        child._index = len(self.children)
         self.children.append(child)
         child.parent = self        
         return child
     
     def insert_child(self, index: int, child: CHILD):
+        self.invalidate()
         self.children.insert(index, child)
-        child.parent = self        
+        child.parent = self
+        self._reindex(min(index, len(self.children) - 1) if index >= 0 else 0)
         return child
     
     
     def replace_child(self, index: int, child: CHILD):
+        self.invalidate()
         child.parent = self
         self.children[index] = child
+        child._index = index if index >= 0 else len(self.children) + index
         return child
     
     def append(
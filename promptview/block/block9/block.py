@@ -1,12 +1,16 @@
-import copy
 import json
 import textwrap
-from typing import Any, Callable, List, Type
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, List, Type
 
 from promptview.utils.model_utils import is_list_type
-from .base_blocks import BaseBlock, BaseContent, BlockSequence
+from .base_blocks import RENDER_SHADOW, BaseBlock, BaseContent, BlockSequence, slot_descriptors
+from .tag_index import BlockIndex
 import annotated_types
 
+if TYPE_CHECKING:
+    from .budget import BudgetPolicy
+
 
 
 def parse_style(style: str | List[str] | None) -> List[str]:
@@ -22,7 +26,6 @@ class BlockChunk(BaseBlock[str]):
     
     __slots__ = [
         "logprob",
-        "type",
     ]
     
     def __init__(
@@ -37,14 +40,35 @@ class BlockChunk(BaseBlock[str]):
         # if content.endswith("\n"):
         #     content = content[:-1]
         #     postfix = "\n"
-        super().__init__(content, prefix=prefix or "", postfix=postfix or "", id=id, parent=parent)
+        # streamed tokens go through here, so fields are set directly, the
+        # parent first so __setattr__ skips invalidating a detached chunk
+        self._render_cache = None
+        self.parent = parent
+        self.content = content
+        self.prefix = prefix or ""
+        self.postfix = postfix or ""
+        self._id = id or None
+        self._index = None
         self.logprob: float | None = logprob
-        self.type: Type = type(content)
+    
+    _render_fields = frozenset({"content", "prefix", "postfix"})
+    
+    def __setattr__(self, name: str, value: Any):
+        # a chunk changed in place changes the rendering of its sentence and the blocks above
+        if name in self._render_fields:
+            parent = getattr(self, "parent", None)
+            if parent is not None and parent._render_cache is not RENDER_SHADOW:
+                parent._rendered = None
+                self.invalidate()
+        object.__setattr__(self, name, value)
         
+    @property
+    def type(self) -> Type:
+        return type(self.content)
         
     @property
     def is_eol(self) -> bool:
-        if self.type is str and self.content is not None:
+        if type(self.content) is str:
             return self.content.endswith("\n")
         return False
     
@@ -88,7 +112,9 @@ SentContent = list[BlockChunk] | BlockChunk | str | None
 
 class BlockSent(BlockSequence[str, BlockChunk]):
     
-    
+    __slots__ = [
+        "_rendered",
+    ]
     
     def __init__(
         self,
@@ -100,6 +126,8 @@ class BlockSent(BlockSequence[str, BlockChunk]):
         id: str | None = None,
 
     ):
+        # rendered chunks, kept by the renderer while chunks are only appended
+        self._rendered = None
         children = children or []
         if content is None:
             content = ""
@@ -114,6 +142,8 @@ class BlockSent(BlockSequence[str, BlockChunk]):
     
     
     def promote_content(self, content: SentContent, prefix: str | None = None, postfix: str | None = None) -> BlockChunk:
+        if type(content) is BlockChunk and prefix is None and postfix is None:
+            return content
         if isinstance(content, str):
             return BlockChunk(content, prefix=prefix, postfix=postfix)
         elif isinstance(content, int):
@@ -148,10 +178,23 @@ class BlockSent(BlockSequence[str, BlockChunk]):
             return True
         return self.children[-1].is_eol
     
+    def insert_child(self, index: int, child: BlockChunk):
+        self._rendered = None
+        return super().insert_child(index, child)
+    
+    def replace_child(self, index: int, child: BlockChunk):
+        self._rendered = None
+        return super().replace_child(index, child)
+    
     
     def render(self, verbose: bool = False) -> str:
         from .renderers2 import render
-        return render(copy.deepcopy(self))
+        return render(self)
+    
+    def render_delta(self, since: int = 0) -> str:
+        """The rendered text from offset `since` on, see renderers2.render_delta."""
+        from .renderers2 import render_delta
+        return render_delta(self, since)
     
     def print(self, verbose: bool = False):
         print(self.render(verbose=verbose))
@@ -184,6 +227,120 @@ class BlockSent(BlockSequence[str, BlockChunk]):
 BlockContent = BlockSent | BlockChunk | BaseContent 
  
 
+# fields a lazy copy shares with its source until it is materialized
+_STRUCTURE_FIELDS = ("content", "prefix", "postfix", "children")
+_OWN_FIELDS = frozenset(_STRUCTURE_FIELDS + ("parent", "_id", "_index", "_render_cache", "_source", "_copies", "_tag_index"))
+# fields that change what the tag index of the tree holds
+_INDEXED_FIELDS = frozenset({"tags", "children"})
+
+
+def _retags(method):
+    def wrapper(self: "BlockTags", *args, **kwargs):
+        block = self.block
+        if block is None:
+            return method(self, *args, **kwargs)
+        block.invalidate()
+        index = block._root_index()
+        if index is None or not index.contains(block):
+            return method(self, *args, **kwargs)
+        index.remove(block)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            index.add(block)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class BlockTags(list):
+    """
+    The tags of a block. Changing them in place updates the block like
+    assigning `tags` does, its render memo and the tag index of the tree.
+    """
+    __slots__ = ("block",)
+    
+    def __init__(self, tags=(), block: "Block | None" = None):
+        super().__init__(tags)
+        self.block = block
+    
+    def __reduce__(self):
+        # rebuilt in one go, copying the items one by one would retag a half built block
+        return (BlockTags, (list(self), self.block))
+    
+    append = _retags(list.append)
+    extend = _retags(list.extend)
+    insert = _retags(list.insert)
+    remove = _retags(list.remove)
+    pop = _retags(list.pop)
+    clear = _retags(list.clear)
+    sort = _retags(list.sort)
+    reverse = _retags(list.reverse)
+    __setitem__ = _retags(list.__setitem__)
+    __delitem__ = _retags(list.__delitem__)
+    __iadd__ = _retags(list.__iadd__)
+    __imul__ = _retags(list.__imul__)
+
+
+def _invalidates(method):
+    def wrapper(self, *args, **kwargs):
+        if self.block is not None:
+            self.block.invalidate()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+class BlockStyles(list):
+    """The styles of a block. Changing them in place drops the render memo of the block."""
+    __slots__ = ("block",)
+    
+    def __init__(self, styles=(), block: "Block | None" = None):
+        super().__init__(styles)
+        self.block = block
+    
+    def __reduce__(self):
+        return (BlockStyles, (list(self), self.block))
+    
+    append = _invalidates(list.append)
+    extend = _invalidates(list.extend)
+    insert = _invalidates(list.insert)
+    remove = _invalidates(list.remove)
+    pop = _invalidates(list.pop)
+    clear = _invalidates(list.clear)
+    sort = _invalidates(list.sort)
+    reverse = _invalidates(list.reverse)
+    __setitem__ = _invalidates(list.__setitem__)
+    __delitem__ = _invalidates(list.__delitem__)
+    __iadd__ = _invalidates(list.__iadd__)
+    __imul__ = _invalidates(list.__imul__)
+
+
+class BlockAttrs(dict):
+    """The attributes of a block. Changing them in place drops the render memo of the block."""
+    __slots__ = ("block",)
+    
+    def __init__(self, attrs=(), block: "Block | None" = None):
+        super().__init__(attrs)
+        self.block = block
+    
+    def __reduce__(self):
+        return (BlockAttrs, (dict(self), self.block))
+    
+    __setitem__ = _invalidates(dict.__setitem__)
+    __delitem__ = _invalidates(dict.__delitem__)
+    __ior__ = _invalidates(dict.__ior__)
+    update = _invalidates(dict.update)
+    setdefault = _invalidates(dict.setdefault)
+    pop = _invalidates(dict.pop)
+    popitem = _invalidates(dict.popitem)
+    clear = _invalidates(dict.clear)
+
+
+# fields kept in containers that tell their block about changes made in place
+_OWNED_FIELDS: dict[str, type] = {"tags": BlockTags, "styles": BlockStyles, "attrs": BlockAttrs}
+_OWNED_TYPES = frozenset(_OWNED_FIELDS.values())
+
+
 class Block(BlockSequence[BlockSent, "Block"]):
     
     __slots__ = [
@@ -193,6 +350,10 @@ class Block(BlockSequence[BlockSent, "Block"]):
         "attrs",
         "postfix",
         "prefix",
+        "_source",
+        "_copies",
+        "_tag_index",
+        "__weakref__",
     ]
     
     def __init__(
@@ -209,6 +370,11 @@ class Block(BlockSequence[BlockSent, "Block"]):
         postfix: BlockSent | str | None = None,
         parent: "Block | None" = None,
     ):
+        # the block this one is a lazy copy of, see copy
+        self._source: "Block | None" = None
+        self._copies: weakref.WeakValueDictionary | None = None
+        # tag and id index of the tree, only on root blocks, see build_index
+        self._tag_index: BlockIndex | None = None
         super().__init__(
             content=self._init_content(content),
             children=children or [], 
@@ -351,20 +517,96 @@ class Block(BlockSequence[BlockSent, "Block"]):
             le=le,
         )
             
+    def __setattr__(self, name: str, value: Any):
+        if name in self._render_fields:
+            self.invalidate()
+            owned = _OWNED_FIELDS.get(name)
+            if owned is not None and value is not None and (type(value) is not owned or value.block is not self):
+                value = owned(value, self)
+            if name in _INDEXED_FIELDS and (index := self._root_index()) is not None and index.contains(self):
+                index.remove(self)
+                object.__setattr__(self, name, value)
+                index.add(self)
+                return
+        object.__setattr__(self, name, value)
+    
+    def _root_index(self) -> BlockIndex | None:
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return getattr(node, "_tag_index", None)
+    
+    def build_index(self) -> BlockIndex:
+        """
+        Keep a tag and id index on this root block, so get, get_last and
+        get_by_id on any block of the tree do not walk the tree. See BlockIndex.
+        """
+        if self.parent is not None:
+            raise ValueError("Only a root block can hold an index")
+        if self._tag_index is None:
+            self._tag_index = BlockIndex(self)
+        return self._tag_index
+    
+    def _index_child(self, child: "Block", replaced: "Block | None" = None):
+        if getattr(child, "_tag_index", None) is not None:
+            # the child is not a root anymore, its index would go stale
+            child._tag_index = None
+        if (index := self._root_index()) is not None:
+            if replaced is not None:
+                index.remove(replaced)
+            index.add(child)
+    
+    def append_child(self, child: "Block"):
+        super().append_child(child)
+        self._index_child(child)
+        return child
+    
+    def insert_child(self, index: int, child: "Block"):
+        super().insert_child(index, child)
+        self._index_child(child)
+        return child
+    
+    def replace_child(self, index: int, child: "Block"):
+        replaced = self.children[index]
+        super().replace_child(index, child)
+        self._index_child(child, replaced)
+        return child
+    
+    def get_by_id(self, id: str) -> "Block | None":
+        index = self._root_index()
+        if index is not None and self is index.root:
+            return index.get_id(id)
+        for block in self.traverse():
+            if isinstance(block, Block) and block._id == id:
+                return block
+        return None
+            
     def get(self, tag: str):
         tag = tag.lower()
+        index = self._root_index()
+        if index is not None and index.contains(self):
+            return index.get(tag, self)
+        return self._walk_get(tag)
+    
+    def _walk_get(self, tag: str):
         if tag in self.tags:
             return self
         for child in self.children:
             if isinstance(child,Block):
                 if tag in child.tags:
                     return child                            
-                if (block:= child.get(tag)) is not None:
+                if (block:= child._walk_get(tag)) is not None:
                     return block
         return None
     
     def get_last(self, tag: str):
         tag = tag.lower()
+        index = self._root_index()
+        if index is not None and index.contains(self):
+            return index.get(tag, self, last=True)
+        return self._walk_get_last(tag)
+    
+    def _walk_get_last(self, tag: str):
         if tag in self.tags:
             return self
         candidates = []
@@ -372,7 +614,7 @@ class Block(BlockSequence[BlockSent, "Block"]):
             if isinstance(child, Block):
                 if tag in child.tags:
                     candidates.append(child)                            
-                if (block:= child.get_last(tag)) is not None:
+                if (block:= child._walk_get_last(tag)) is not None:
                     return block
         if not candidates:
             return None
@@ -475,6 +717,16 @@ class Block(BlockSequence[BlockSent, "Block"]):
             print(e)
             raise e
         return dump
+
+    def to_bytes(self) -> bytes:
+        """Compact columnar encoding of the tree, see columnar.BlockColumns."""
+        from .columnar import dumps
+        return dumps(self)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Block":
+        from .columnar import loads
+        return loads(data)
     # def model_dump(self):
     #     dump = super().model_dump()
     #     dump["_type"] = "Block"
@@ -532,18 +784,92 @@ class Block(BlockSequence[BlockSent, "Block"]):
         copy_id: bool = False,
         copy_parent: bool = False,
     ):
-        return Block(
-            content=self.content.copy() if not overrides or "content" not in overrides else overrides["content"],
-            children=[c.copy() for c in self.children] if not overrides or "children" not in overrides else overrides["children"],
-            attrs=self.attrs if not overrides or "attrs" not in overrides else overrides["attrs"],
-            prefix=self.prefix if not overrides or "prefix" not in overrides else overrides["prefix"],
-            postfix=self.postfix if not overrides or "postfix" not in overrides else overrides["postfix"],
-            role=self.role if not overrides or "role" not in overrides else overrides["role"],
-            tags=self.tags if not overrides or "tags" not in overrides else overrides["tags"],
-            styles=self.styles if not overrides or "styles" not in overrides else overrides["styles"],
-            id=self.id if copy_id else None,
-            parent=self.parent if copy_parent else None,
-        )
+        """
+        Copy the block. Unless the structure is overridden the copy is lazy:
+        it shares content and children with this block and clones them one
+        level at a time, when they are accessed through the copy or before
+        this block or one of its descendants changes. Copying a large block
+        and changing a few blocks of the copy only clones the changed paths.
+        """
+        if overrides and any(name in overrides for name in _STRUCTURE_FIELDS):
+            return Block(
+                content=self.content.copy() if "content" not in overrides else overrides["content"],
+                children=[c.copy() for c in self.children] if "children" not in overrides else overrides["children"],
+                attrs=self.attrs if "attrs" not in overrides else overrides["attrs"],
+                prefix=self.prefix if "prefix" not in overrides else overrides["prefix"],
+                postfix=self.postfix if "postfix" not in overrides else overrides["postfix"],
+                role=self.role if "role" not in overrides else overrides["role"],
+                tags=self.tags if "tags" not in overrides else overrides["tags"],
+                styles=self.styles if "styles" not in overrides else overrides["styles"],
+                id=self.id if copy_id else None,
+                parent=self.parent if copy_parent else None,
+            )
+        blk = self._lazy_copy(copy_id=copy_id, copy_parent=copy_parent)
+        if overrides:
+            # set directly, invalidating would materialize the copy
+            for name, value in overrides.items():
+                object.__setattr__(blk, name, value)
+            object.__setattr__(blk, "_render_cache", None)
+        return blk
+    
+    def __copy__(self):
+        return self.copy(copy_id=True, copy_parent=True)
+    
+    def _lazy_copy(self, copy_id: bool = False, copy_parent: bool = False) -> "Block":
+        source = self._source if self._source is not None else self
+        blk = object.__new__(type(self))
+        # the structure is left unset, the first read of it goes to __getattr__
+        for name, get, set in slot_descriptors(type(self)):
+            if name in _OWN_FIELDS:
+                continue
+            try:
+                value = get(self)
+            except AttributeError:
+                continue
+            if type(value) is list or type(value) is dict:
+                value = value.copy()
+            elif type(value) in _OWNED_TYPES:
+                value = type(value)(value, blk)
+            set(blk, value)
+        object.__setattr__(blk, "_source", source)
+        object.__setattr__(blk, "_copies", None)
+        object.__setattr__(blk, "_tag_index", None)
+        object.__setattr__(blk, "_id", self.id if copy_id else None)
+        object.__setattr__(blk, "_index", None)
+        object.__setattr__(blk, "parent", self.parent if copy_parent else None)
+        # both render the same text, the copy starts with the memo of the block
+        cache = self._render_cache
+        object.__setattr__(blk, "_render_cache", cache if cache is not RENDER_SHADOW else None)
+        if source._copies is None:
+            object.__setattr__(source, "_copies", weakref.WeakValueDictionary())
+        source._copies[id(blk)] = blk
+        return blk
+    
+    def __getattr__(self, name: str):
+        # only called for unset slots
+        if name in _STRUCTURE_FIELDS and self._source is not None:
+            self._materialize()
+            return object.__getattribute__(self, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+    
+    def _materialize(self):
+        """Clone the structure shared with the source, the children become lazy copies."""
+        source = self._source
+        object.__setattr__(self, "_source", None)
+        if source._copies is not None:
+            source._copies.pop(id(self), None)
+        content = source.content.copy()
+        content.parent = self
+        children = []
+        for i, child in enumerate(source.children):
+            child = child.copy()
+            child.parent = self
+            child._index = i
+            children.append(child)
+        object.__setattr__(self, "content", content)
+        object.__setattr__(self, "prefix", source.prefix.copy())
+        object.__setattr__(self, "postfix", source.postfix.copy())
+        object.__setattr__(self, "children", children)
         
     def traverse(self):
         yield self
@@ -612,9 +938,28 @@ class Block(BlockSequence[BlockSent, "Block"]):
     
     
     
-    def render(self, verbose: bool = False) -> str:
+    def render(
+        self,
+        verbose: bool = False,
+        max_tokens: int | None = None,
+        policy: "str | BudgetPolicy" = "drop_oldest",
+        tokenizer: Any = None,
+    ) -> str:
+        """
+        Render the block. With `max_tokens` blocks are left out in the order
+        of `policy` ("drop_oldest", "truncate_middle" or a BudgetPolicy such
+        as TagPriority) until the prompt fits, see budget.render_budget.
+        """
+        if max_tokens is not None:
+            from .budget import render_budget
+            return render_budget(self, max_tokens, policy=policy, tokenizer=tokenizer)
         from .renderers2 import render
-        return render(copy.deepcopy(self))
+        return render(self)
+    
+    def render_delta(self, since: int = 0) -> str:
+        """The rendered text from offset `since` on, see renderers2.render_delta."""
+        from .renderers2 import render_delta
+        return render_delta(self, since)
 
     def print(self, verbose: bool = False):
         print(self.render(verbose=verbose))
@@ -746,6 +1091,8 @@ class BlockSchema(Block):
         copy_id: bool = False,
         copy_parent: bool = False,
     ):
+        if not overrides or not any(name in overrides for name in _STRUCTURE_FIELDS):
+            return super().copy(overrides, copy_id=copy_id, copy_parent=copy_parent)
         blk = BlockSchema(
             name=self.name if not overrides or "name" not in overrides else overrides["name"],
             type=self.type if not overrides or "type" not in overrides else overrides["type"],
@@ -2,7 +2,11 @@ from queue import SimpleQueue
 
 from .block import Block, BlockChunk, BlockSchema, AttrBlock, BlockSent
 from .base_blocks import BaseBlock
-from typing import Type
+from .renderers2 import render_offset
+from typing import TYPE_CHECKING, Type
+
+if TYPE_CHECKING:
+    from ..util import ToolCall
 
 
 
@@ -11,13 +15,41 @@ class BlockBuilderError(Exception):
 
 
 
+def _dump_chunk(chunk: BlockChunk) -> dict:
+    return {
+        "content": chunk.content,
+        "logprob": chunk.logprob,
+        "prefix": chunk.prefix,
+        "postfix": chunk.postfix,
+    }
+
+
 class BlockBuilderContext:
+    """
+    Builds the response block from the parsed stream and queues an event for
+    every change, the model_dump of the changed block. With `delta_events`
+    the events are compact structural deltas whose size does not depend on
+    the size of the block, a BlockDeltaBuilder rebuilds the block from them:
+    
+        {"type": "block_open", "id", "path", "content": [chunk], "tags", "styles", "attrs", "role", "offset", "text"}
+        {"type": "block_append", "id", "path", "chunk": chunk, "offset", "text"}
+        {"type": "block_close", "id", "path", "postfix": [chunk], "offset", "text"}
+        {"type": "tool_call", "id", "path", "tool_call": tool_call}
     
+    `path` is the index path of the block in the response. `text` is the
+    rendering of the response from `offset` on, the text before it did not
+    change, so a consumer keeps the rendering with:
     
-    def __init__(self, schema: Block):
+        rendered = rendered[:event["offset"]] + event["text"]
+    """
+    
+    def __init__(self, schema: Block, delta_events: bool = False):
         self.schema = self.extract_schema(schema)
+        # views are looked up by tag for every parsed tag
+        self.schema.build_index()
         self.instance = None
         self.queue = SimpleQueue()
+        self.delta_events = delta_events
         
         
     def extract_schema(self, schema: Block) -> BlockSchema:
@@ -53,6 +85,57 @@ class BlockBuilderContext:
     def _push_event(self, event: Block):
         self.queue.put(event.model_dump())
         
+    def _render_delta(self, since: int) -> dict:
+        return {"offset": since, "text": self.instance.render_delta(since)}
+        
+    def _push_open(self, view: Block):
+        if not self.delta_events:
+            return self._push_event(view)
+        self.queue.put({
+            "type": "block_open",
+            "id": view.id,
+            "path": view.path,
+            "content": [_dump_chunk(c) for c in view.content.children],
+            "tags": list(view.tags),
+            "styles": list(view.styles),
+            "attrs": dict(view.attrs) if view.attrs else {},
+            "role": view.role,
+            **self._render_delta(render_offset(self.instance, view)[0]),
+        })
+        
+    def _push_append(self, view: Block, chunk: BlockChunk, since: int = 0):
+        if not self.delta_events:
+            return self._push_event(chunk)
+        self.queue.put({
+            "type": "block_append",
+            "id": view.id,
+            "path": view.path,
+            "chunk": _dump_chunk(chunk),
+            **self._render_delta(since),
+        })
+        
+    def _push_close(self, view: Block, postfix: list[BlockChunk]):
+        if not self.delta_events:
+            return
+        self.queue.put({
+            "type": "block_close",
+            "id": view.id,
+            "path": view.path,
+            "postfix": [_dump_chunk(c) for c in postfix],
+            **self._render_delta(render_offset(self.instance, view)[0]),
+        })
+        
+    def push_tool_call(self, view: Block, tool_call: "ToolCall"):
+        """Emit the tool call of a closed tool view."""
+        if not self.delta_events:
+            return
+        self.queue.put({
+            "type": "tool_call",
+            "id": view.id,
+            "path": view.path,
+            "tool_call": tool_call.model_dump(),
+        })
+        
         
     def get_view_info(self, view_name: str, is_last: bool = False) -> tuple[BlockSchema, Block | None]:
         schema = self.schema.get(view_name)
@@ -146,6 +229,7 @@ class BlockBuilderContext:
         def insert(path: list[int], view: Block):
             if not path:
                 self.instance = view
+                view.build_index()
                 return view
             else:
                 if self.instance is None:
@@ -160,7 +244,7 @@ class BlockBuilderContext:
             if pth_view is None:
                 pth_view = build_response_block(vw_scm)                
                 insert(vw_scm.path, pth_view)
-                self._push_event(pth_view)
+                self._push_open(pth_view)
             curr_view = pth_view            
         return curr_view
     
@@ -223,11 +307,14 @@ class BlockBuilderContext:
         if view.is_last_eol():
             blk = view.append(content)                
             blk.styles += ["stream"]
+            if attrs:
+                self.set_attributes(schema, blk, attrs)
+            self._push_open(blk)
         else:
+            # the chunks are added after the content of the last line
+            since = render_offset(self.instance, view.last_child)[1] if self.delta_events else 0
             blk = view.inline_append(content)
-        if attrs:
-            self.set_attributes(view_name, blk, attrs)
-        self._push_event(blk)
+            self._push_append(view.last_child, blk, since)
         return blk  
         
             
@@ -285,7 +372,7 @@ class BlockBuilderContext:
         item_view = self._build_response_block(schema, content, tags, attrs)
         list_view.append(item_view)
         item_view = self.set_attributes(schema, item_view, attrs)
-        self._push_event(item_view)
+        self._push_open(item_view)
         return item_view, schema
     
     
@@ -311,7 +398,10 @@ class BlockBuilderContext:
         if postfix is not None:            
             if view is None:
                 raise BlockBuilderError(f"View {view_name} not found")
+            # the postfix has no parent to drop the render memo of the view
+            view.invalidate()
             view.postfix.extend(postfix)
+            self._push_close(view, postfix)
         
         return view
     
@@ -325,4 +415,69 @@ class BlockBuilderContext:
         if view is None:
             raise BlockBuilderError(f"View {view_name} not found")
         # view.commit()
-        return view
\ No newline at end of file
+        return view
+
+
+
+class BlockDeltaBuilder:
+    """
+    Rebuilds a response block from the delta events of a BlockBuilderContext,
+    for consumers on the other side of a stream.
+    
+        builder = BlockDeltaBuilder()
+        for event in events:
+            builder.apply(event)
+        builder.instance.render()
+        builder.tool_calls
+    """
+    
+    def __init__(self):
+        self.instance: Block | None = None
+        self.tool_calls: list["ToolCall"] = []
+        self._views: dict[str, Block] = {}
+        
+    def _get_view(self, event: dict) -> Block:
+        view = self._views.get(event["id"])
+        if view is None:
+            raise BlockBuilderError(f"View {event['id']} at {event['path']} is not open")
+        return view
+        
+    def apply(self, event: dict) -> Block:
+        """Apply an event and return the block it changed."""
+        event_type = event["type"]
+        if event_type == "block_open":
+            view = Block(
+                content=[BlockChunk.model_validate(c) for c in event["content"]],
+                tags=event["tags"],
+                styles=event["styles"],
+                attrs=event["attrs"],
+                role=event["role"],
+                id=event["id"],
+            )
+            if not event["path"]:
+                self.instance = view
+            elif self.instance is None:
+                raise BlockBuilderError("Instance is not initialized")
+            else:
+                self.instance.insert(view, event["path"])
+            self._views[event["id"]] = view
+        elif event_type == "block_append":
+            view = self._get_view(event)
+            view.content.append(BlockChunk.model_validate(event["chunk"]))
+        elif event_type == "block_close":
+            view = self._get_view(event)
+            view.invalidate()
+            view.postfix.extend([BlockChunk.model_validate(c) for c in event["postfix"]])
+        elif event_type == "tool_call":
+            from ..util import ToolCall
+            view = self._get_view(event)
+            tool_call = event["tool_call"]
+            self.tool_calls.append(ToolCall(
+                id=tool_call["id"],
+                name=tool_call["name"],
+                tool=tool_call["tool"],
+                extra=tool_call.get("extra"),
+            ))
+        else:
+            raise BlockBuilderError(f"Unknown event type: {event_type}")
+        return view
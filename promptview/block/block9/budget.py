@@ -0,0 +1,174 @@
+from typing import Any, Callable
+
+from .block import Block
+from .renderers2 import Exclusion, _render_block, count_tokens, render
+
+
+
+TokenCounter = Callable[[str], int]
+
+_default_counter: TokenCounter | None = None
+
+
+def default_token_counter() -> TokenCounter:
+    global _default_counter
+    if _default_counter is None:
+        from promptview.vectors.tokenizer import Tokenizer
+        _default_counter = Tokenizer().count_tokens
+    return _default_counter
+
+
+def _as_counter(tokenizer: Any) -> TokenCounter:
+    if tokenizer is None:
+        return default_token_counter()
+    if hasattr(tokenizer, "count_tokens"):
+        return tokenizer.count_tokens
+    if callable(tokenizer):
+        return tokenizer
+    raise ValueError(f"Invalid tokenizer: {tokenizer}, expected a Tokenizer or a callable")
+
+
+
+class BudgetPolicy:
+    """Decides which blocks to leave out first when a prompt is over budget."""
+
+    def candidates(self, root: Block) -> list[Block]:
+        """Blocks that may be dropped, in the order they are dropped."""
+        raise NotImplementedError
+
+
+class DropOldest(BudgetPolicy):
+    """Drops the children of the root from the oldest, keeping the last `keep_last`."""
+
+    def __init__(self, keep_last: int = 1):
+        self.keep_last = keep_last
+
+    def candidates(self, root: Block) -> list[Block]:
+        end = max(len(root.children) - self.keep_last, 0)
+        return root.children[:end]
+
+
+class TruncateMiddle(BudgetPolicy):
+    """Drops the children of the root from the middle out, keeping the first and the last ones."""
+
+    def __init__(self, keep_first: int = 1, keep_last: int = 1):
+        self.keep_first = keep_first
+        self.keep_last = keep_last
+
+    def candidates(self, root: Block) -> list[Block]:
+        middle = root.children[self.keep_first:max(len(root.children) - self.keep_last, self.keep_first)]
+        order = []
+        left = (len(middle) - 1) // 2
+        right = left + 1
+        while left >= 0 or right < len(middle):
+            if left >= 0:
+                order.append(middle[left])
+                left -= 1
+            if right < len(middle):
+                order.append(middle[right])
+                right += 1
+        return order
+
+
+class TagPriority(BudgetPolicy):
+    """
+    Drops tagged blocks anywhere in the tree, lowest priority first and the
+    oldest first within a priority. Blocks without a tag in `priorities` are
+    always kept.
+
+    Example:
+        block.render(max_tokens=4000, policy=TagPriority({"examples": 0, "history": 1}))
+    """
+
+    def __init__(self, priorities: dict[str, int]):
+        self.priorities = priorities
+
+    def priority(self, block: Block) -> int | None:
+        values = [self.priorities[tag] for tag in block.tags if tag in self.priorities]
+        return max(values) if values else None
+
+    def candidates(self, root: Block) -> list[Block]:
+        ranked = []
+        for order, block in enumerate(root.traverse()):
+            if block is root or not isinstance(block, Block):
+                continue
+            if (priority := self.priority(block)) is not None:
+                ranked.append((priority, order, block))
+        ranked.sort(key=lambda item: (item[0], item[1]))
+        return [block for _, _, block in ranked]
+
+
+POLICIES: dict[str, type[BudgetPolicy]] = {
+    "drop_oldest": DropOldest,
+    "truncate_middle": TruncateMiddle,
+}
+
+
+def _as_policy(policy: str | BudgetPolicy) -> BudgetPolicy:
+    if isinstance(policy, BudgetPolicy):
+        return policy
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown budget policy: {policy}, expected one of {list(POLICIES)} or a BudgetPolicy")
+    return POLICIES[policy]()
+
+
+def _is_descendant(block: Block, ancestors: set[int]) -> bool:
+    parent = block.parent
+    while parent is not None:
+        if id(parent) in ancestors:
+            return True
+        parent = parent.parent
+    return False
+
+
+def _fits(total: int, text: str, max_tokens: int, counter: TokenCounter) -> bool:
+    """
+    Whether `text`, whose blocks sum to `total` tokens, fits in `max_tokens`.
+    Joining texts can add about a token at each separator, so the text is
+    only tokenized when the sum with a token per line comes close to the
+    budget.
+    """
+    if total > max_tokens:
+        return False
+    if total + text.count("\n") + 1 <= max_tokens:
+        return True
+    return counter(text) <= max_tokens
+
+
+def render_budget(
+    root: Block,
+    max_tokens: int,
+    policy: str | BudgetPolicy = "drop_oldest",
+    tokenizer: Any = None,
+) -> str:
+    """
+    Render `root` leaving out blocks, in the order of `policy`, until it fits
+    in `max_tokens`. Token counts are summed from the cached counts of the
+    blocks, so only blocks that changed since the last call are tokenized.
+    A tokenizer may count a joined text differently than its parts, so when
+    the sum is close to the budget the rendered text is counted and blocks
+    are dropped until it fits too. If dropping every candidate is not enough
+    the result is over budget.
+    """
+    if max_tokens < 0:
+        raise ValueError(f"max_tokens must be non negative, got {max_tokens}")
+    counter = _as_counter(tokenizer)
+    text = render(root)
+    total = count_tokens(root, counter)
+    if _fits(total, text, max_tokens, counter):
+        return text
+    dropped: list[Block] = []
+    for block in _as_policy(policy).candidates(root):
+        if _is_descendant(block, {id(b) for b in dropped}):
+            continue
+        # blocks dropped before inside this one are counted with it
+        inner = [b for b in dropped if _is_descendant(b, {id(block)})]
+        total -= count_tokens(block, counter) - sum(count_tokens(b, counter) for b in inner)
+        dropped = [b for b in dropped if not any(b is i for i in inner)] + [block]
+        if total <= max_tokens:
+            text = _render_block(root, exclude=Exclusion(dropped))
+            if _fits(total, text, max_tokens, counter):
+                return text
+    if dropped:
+        text = _render_block(root, exclude=Exclusion(dropped))
+    return text
@@ -0,0 +1,306 @@
+import json
+import math
+import struct
+import sys
+from array import array
+from typing import Iterator
+
+from .block import Block, BlockChunk, BlockSent
+
+
+
+MAGIC = b"PVB1"
+VERSION = 1
+
+KIND_BLOCK = 0
+KIND_SENT = 1
+KIND_CHUNK = 2
+
+SLOT_CHILD = 0
+SLOT_CONTENT = 1
+SLOT_PREFIX = 2
+SLOT_POSTFIX = 3
+
+NONE = -1
+
+_HEADER = struct.Struct("<4sHII")
+_COLUMN = struct.Struct("<cI")
+
+# column name and array typecode, in the order they are written
+_COLUMNS = [
+    ("kinds", "B"),
+    ("slots", "B"),
+    ("parents", "i"),
+    ("sizes", "I"),
+    ("ids", "i"),
+    ("contents", "i"),
+    ("prefixes", "i"),
+    ("postfixes", "i"),
+    ("logprobs", "f"),
+    ("roles", "i"),
+    ("attrs", "i"),
+    ("style_offsets", "I"),
+    ("style_ids", "i"),
+    ("tag_offsets", "I"),
+    ("tag_ids", "i"),
+    ("string_offsets", "I"),
+]
+
+
+
+class BlockColumns:
+    """
+    Columnar form of a block tree. Nodes (blocks, sentences and chunks) are
+    stored in pre-order as parallel arrays: a block is followed by its
+    content, prefix and postfix sentences, each followed by its chunks, and
+    then by its child blocks. `sizes` holds the number of nodes in every
+    subtree, so a subtree is a contiguous range and any node can be turned
+    back into a block without decoding the rest. Strings are deduplicated in
+    one UTF-8 table and decoded on first use.
+
+    Example:
+        data = block.to_bytes()
+        cols = BlockColumns.from_bytes(data)
+        message = cols.to_block(cols.children(0)[3])
+    """
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode))
+        self.string_data = b""
+        self._strings: list[str | None] = []
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @classmethod
+    def from_block(cls, block: Block) -> "BlockColumns":
+        cols = cls()
+        table: dict[str, int] = {}
+
+        def string(value: str | None) -> int:
+            if value is None:
+                return NONE
+            sid = table.get(value)
+            if sid is None:
+                sid = table[value] = len(table)
+            return sid
+
+        kinds, slots, parents, sizes, ids = [], [], [], [], []
+        contents, prefixes, postfixes, logprobs = [], [], [], []
+        roles, attrs = [], []
+        style_offsets, style_ids, tag_offsets, tag_ids = [0], [], [0], []
+
+        def add(kind: int, slot: int, parent: int, node, content: int, prefix: int, postfix: int) -> int:
+            index = len(kinds)
+            kinds.append(kind)
+            slots.append(slot)
+            parents.append(parent)
+            sizes.append(1)
+            ids.append(string(node._id))
+            contents.append(content)
+            prefixes.append(prefix)
+            postfixes.append(postfix)
+            if kind == KIND_CHUNK and node.logprob is not None:
+                logprobs.append(node.logprob)
+            else:
+                logprobs.append(math.nan)
+            if kind == KIND_BLOCK:
+                roles.append(string(node.role))
+                attrs.append(string(json.dumps(node.attrs)) if node.attrs else NONE)
+                style_ids.extend(string(s) for s in node.styles)
+                tag_ids.extend(string(t) for t in node.tags)
+            else:
+                roles.append(NONE)
+                attrs.append(NONE)
+            style_offsets.append(len(style_ids))
+            tag_offsets.append(len(tag_ids))
+            return index
+
+        def add_sent(sent: BlockSent, slot: int, parent: int):
+            if type(sent) is not BlockSent:
+                raise ValueError(f"Can not serialize {type(sent).__name__}, only Block, BlockSent and BlockChunk are supported")
+            index = add(KIND_SENT, slot, parent, sent, string(sent.content), string(sent.prefix), string(sent.postfix))
+            for chunk in sent.children:
+                if type(chunk) is not BlockChunk or type(chunk.content) is not str:
+                    raise ValueError(f"Can not serialize chunk {chunk!r}, only string chunks are supported")
+                add(KIND_CHUNK, SLOT_CHILD, index, chunk, string(chunk.content), string(chunk.prefix), string(chunk.postfix))
+            sizes[index] = len(kinds) - index
+
+        def add_block(blk: Block, slot: int, parent: int):
+            if type(blk) is not Block:
+                raise ValueError(f"Can not serialize {type(blk).__name__}, only Block, BlockSent and BlockChunk are supported")
+            index = add(KIND_BLOCK, slot, parent, blk, NONE, NONE, NONE)
+            add_sent(blk.content, SLOT_CONTENT, index)
+            add_sent(blk.prefix, SLOT_PREFIX, index)
+            add_sent(blk.postfix, SLOT_POSTFIX, index)
+            for child in blk.children:
+                add_block(child, SLOT_CHILD, index)
+            sizes[index] = len(kinds) - index
+
+        add_block(block, SLOT_CHILD, NONE)
+
+        for name, values in [
+            ("kinds", kinds), ("slots", slots), ("parents", parents), ("sizes", sizes),
+            ("ids", ids), ("contents", contents), ("prefixes", prefixes), ("postfixes", postfixes),
+            ("logprobs", logprobs), ("roles", roles), ("attrs", attrs),
+            ("style_offsets", style_offsets), ("style_ids", style_ids),
+            ("tag_offsets", tag_offsets), ("tag_ids", tag_ids),
+        ]:
+            getattr(cols, name).extend(values)
+        encoded = [s.encode("utf-8") for s in table]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        cols.string_offsets.extend(offsets)
+        cols.string_data = b"".join(encoded)
+        cols._strings = list(table)
+        return cols
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(MAGIC, VERSION, len(self), len(self.string_offsets) - 1)]
+        for name, typecode in _COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder == "big" and column.itemsize > 1:
+                column = array(typecode, column)
+                column.byteswap()
+            parts.append(_COLUMN.pack(typecode.encode(), len(column)))
+            parts.append(column.tobytes())
+        parts.append(struct.pack("<I", len(self.string_data)))
+        parts.append(self.string_data)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BlockColumns":
+        view = memoryview(data)
+        if len(view) < _HEADER.size:
+            raise ValueError("Invalid block data: too short")
+        magic, version, nodes, strings = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError("Invalid block data: bad magic")
+        if version != VERSION:
+            raise ValueError(f"Unsupported block data version: {version}")
+        cols = cls()
+        offset = _HEADER.size
+        for name, typecode in _COLUMNS:
+            if offset + _COLUMN.size > len(view):
+                raise ValueError(f"Invalid block data: truncated before column {name}")
+            code, length = _COLUMN.unpack_from(view, offset)
+            offset += _COLUMN.size
+            if code.decode() != typecode:
+                raise ValueError(f"Invalid block data: column {name} has type {code.decode()}, expected {typecode}")
+            column = getattr(cols, name)
+            end = offset + length * column.itemsize
+            if end > len(view):
+                raise ValueError(f"Invalid block data: truncated column {name}")
+            column.frombytes(view[offset:end])
+            if sys.byteorder == "big" and column.itemsize > 1:
+                column.byteswap()
+            offset = end
+        if offset + 4 > len(view):
+            raise ValueError("Invalid block data: truncated before the string table")
+        (length,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        cols.string_data = bytes(view[offset:offset + length])
+        if len(cols.string_data) != length:
+            raise ValueError("Invalid block data: truncated string table")
+        if len(cols) != nodes or len(cols.string_offsets) != strings + 1:
+            raise ValueError("Invalid block data: column lengths do not match the header")
+        cols._strings = [None] * strings
+        return cols
+
+    def string(self, sid: int) -> str | None:
+        if sid == NONE:
+            return None
+        value = self._strings[sid]
+        if value is None:
+            value = self._strings[sid] = self.string_data[self.string_offsets[sid]:self.string_offsets[sid + 1]].decode("utf-8")
+        return value
+
+    def _direct(self, index: int) -> Iterator[int]:
+        i = index + 1
+        end = index + self.sizes[index]
+        while i < end:
+            yield i
+            i += self.sizes[i]
+
+    def children(self, index: int) -> list[int]:
+        """Indices of the child blocks of a block, or of the chunks of a sentence."""
+        return [i for i in self._direct(index) if self.slots[i] == SLOT_CHILD]
+
+    def blocks(self) -> Iterator[int]:
+        """Indices of all the blocks, in pre-order."""
+        for i, kind in enumerate(self.kinds):
+            if kind == KIND_BLOCK:
+                yield i
+
+    def logprob(self, index: int) -> float | None:
+        value = self.logprobs[index]
+        return None if math.isnan(value) else value
+
+    def to_block(self, index: int = 0) -> Block | BlockSent | BlockChunk:
+        """Materialize the subtree of node `index`, the whole tree by default."""
+        kind = self.kinds[index]
+        string = self.string
+        if kind == KIND_CHUNK:
+            return BlockChunk(
+                string(self.contents[index]),
+                logprob=self.logprob(index),
+                prefix=string(self.prefixes[index]),
+                postfix=string(self.postfixes[index]),
+                id=string(self.ids[index]),
+            )
+        if kind == KIND_SENT:
+            sent = BlockSent(
+                string(self.contents[index]),
+                prefix=string(self.prefixes[index]),
+                postfix=string(self.postfixes[index]),
+                id=string(self.ids[index]),
+            )
+            # chunks are built inline and attached directly, append_child
+            # would invalidate the sentence once per chunk
+            contents, prefixes, postfixes, ids, logprobs = self.contents, self.prefixes, self.postfixes, self.ids, self.logprobs
+            chunks = []
+            for position, i in enumerate(range(index + 1, index + self.sizes[index])):
+                logprob = logprobs[i]
+                chunk = BlockChunk(
+                    string(contents[i]),
+                    logprob=None if logprob != logprob else logprob,
+                    prefix=string(prefixes[i]),
+                    postfix=string(postfixes[i]),
+                    id=string(ids[i]),
+                )
+                chunk.parent = sent
+                chunk._index = position
+                chunks.append(chunk)
+            sent.children = chunks
+            return sent
+        sents = {}
+        children = []
+        for i in self._direct(index):
+            if self.slots[i] == SLOT_CHILD:
+                children.append(self.to_block(i))
+            else:
+                sents[self.slots[i]] = self.to_block(i)
+        attrs = self.attrs[index]
+        blk = Block(
+            sents.get(SLOT_CONTENT),
+            role=string(self.roles[index]),
+            tags=[string(t) for t in self.tag_ids[self.tag_offsets[index]:self.tag_offsets[index + 1]]],
+            styles=[string(s) for s in self.style_ids[self.style_offsets[index]:self.style_offsets[index + 1]]],
+            attrs=json.loads(string(attrs)) if attrs != NONE else None,
+            id=string(self.ids[index]),
+            prefix=sents.get(SLOT_PREFIX),
+            postfix=sents.get(SLOT_POSTFIX),
+        )
+        for child in children:
+            blk.append_child(child)
+        return blk
+
+
+def dumps(block: Block) -> bytes:
+    return BlockColumns.from_block(block).to_bytes()
+
+
+def loads(data: bytes) -> Block:
+    return BlockColumns.from_bytes(data).to_block()
@@ -1,10 +1,12 @@
+import bisect
 import contextvars
 import textwrap
-from typing import Any, Generic, Text, Type, TypeVar
+from typing import Any, Callable, Generic, Text, Type, TypeVar
 from typing import get_type_hints, List
 from typing import get_args, get_origin, List
 from uuid import uuid4
 import uuid
+from .base_blocks import RENDER_SHADOW, slot_descriptors
 from .block import AttrBlock, Block, BlockSequence, BlockSent, BlockChunk, BlockSchema
 
 
@@ -13,17 +15,95 @@ BaseContent = str | int | float | bool | None
 CONTENT = TypeVar("CONTENT")
 
 
-style_registry_ctx = contextvars.ContextVar("style_registry_ctx", default={})
-
 def _style_key(style: str, target: str, effects: str="all") -> str:
     return f"{style}_{target}_{effects}"   
+
+
+class StyleTable(dict):
+    """
+    The compiled styles of one style list: maps (target, effects) to the
+    first matching style object, or None. Entries are resolved on first use.
+    """
+    __slots__ = ("registry", "styles")
+    
+    def __init__(self, registry: "StyleRegistry", styles: tuple[str, ...]):
+        super().__init__()
+        self.registry = registry
+        self.styles = styles
+    
+    def __missing__(self, key: tuple[str, str]):
+        target, effects = key
+        style_obj = None
+        for style in self.styles:
+            if style_obj := self.registry.get(_style_key(style, target, effects)):
+                break
+        self[key] = style_obj
+        return style_obj
+
+
+class StyleRegistry(dict):
+    """
+    Style registry keyed by _style_key. Keeps a StyleTable per style list,
+    every change bumps `version` and drops the tables.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self._tables: dict[tuple[str, ...], StyleTable] = {}
+        
+    def _changed(self):
+        self.version += 1
+        self._tables.clear()
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+        
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+        
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+    
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+        
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+    
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+    
+    def clear(self):
+        super().clear()
+        self._changed()
+    
+    def table(self, styles: list[str] | tuple[str, ...]) -> StyleTable:
+        key = styles if type(styles) is tuple else tuple(styles)
+        table = self._tables.get(key)
+        if table is None:
+            table = self._tables[key] = StyleTable(self, key)
+        return table
+
+
+style_registry_ctx = contextvars.ContextVar("style_registry_ctx", default=StyleRegistry())
+
 class StyleContext:
         
     def __init__(
         self,
         styles: dict
     ):
-        self.styles = styles
+        self.styles = styles if isinstance(styles, StyleRegistry) else StyleRegistry(styles)
         self._token = None
         
         
@@ -73,21 +153,19 @@ class StyleMeta(type):
     
     @classmethod
     def resolve(cls, styles: list[str], target: str, effects: str="all", default: "BlockStyle | TextStyle | ChunkStyle | None"=None) -> "BlockStyle | TextStyle | ChunkStyle | None":
-        current = style_registry_ctx.get()
-        for style in styles:
-            if style_obj := current.get(_style_key(style, target, effects)):
-                return style_obj
-        return default
+        return style_registry_ctx.get().table(styles)[(target, effects)] or default
 
 
 
 def apply_style(target):
-    if styler:= StyleMeta.resolve(target.styles, "text", "content", default=TextStyle()):
+    registry = style_registry_ctx.get()
+    table = registry.table(target.styles)
+    if styler:= table[("text", "content")] or _default_text_style:
         target.content = styler(target.content)
     if target.parent:
-        if styler:= StyleMeta.resolve(target.parent.styles, "text", "children"):
+        if styler:= registry.table(target.parent.styles)[("text", "children")]:
             target.content = styler(target.content)
-    if styler:= StyleMeta.resolve(target.styles, "block", default=BlockStyle()):
+    if styler:= table[("block", "all")] or _default_block_style:
         target = styler(target)
     
     return target
@@ -102,11 +180,263 @@ def apply_chunk_style(target):
     return target
 
 
-def render_text(target) -> str:
+# -------------------------
+# Shadows
+# -------------------------
+# Styles change the blocks they are applied to. Rendering applies them to
+# shadows: shallow copies of a block that own their prefix, content and
+# postfix, so the source tree is never touched. Slots are copied through
+# their descriptors, a lazy copy (see Block.copy) is shadowed from the
+# structure it shares without cloning it.
+
+
+def _shadow_sent(sent: BlockSent, parent, share_chunks: bool = False) -> BlockSent:
+    """
+    Copy a sentence for rendering. Chunks are never copied up front, see
+    RenderedChunks. Styles insert chunks into prefixes and postfixes, so
+    those shadows get their own chunk list, content shadows can share it.
+    """
+    if sent._rendered is None:
+        sent._rendered = RenderedChunks()
+    node = object.__new__(type(sent))
+    for name, get, set in slot_descriptors(type(sent)):
+        try:
+            set(node, get(sent))
+        except AttributeError:
+            pass
+    object.__setattr__(node, "_render_cache", RENDER_SHADOW)
+    object.__setattr__(node, "parent", parent)
+    if not share_chunks:
+        object.__setattr__(node, "children", list(sent.children))
+    return node
+
+
+def _shadow_block(block: Block, parent) -> Block:
+    """Copy the parts of a block that styles of its parent may change."""
+    node = object.__new__(type(block))
+    source = block._source
+    for name, get, set in slot_descriptors(type(block)):
+        try:
+            set(node, get(block))
+        except AttributeError:
+            if source is not None:
+                # a lazy copy renders the structure it shares with its source
+                try:
+                    set(node, get(source))
+                except AttributeError:
+                    pass
+    object.__setattr__(node, "_source", None)
+    object.__setattr__(node, "_copies", None)
+    object.__setattr__(node, "_tag_index", None)
+    object.__setattr__(node, "_render_cache", RENDER_SHADOW)
+    object.__setattr__(node, "parent", parent)
+    if parent is block.parent and parent is not None:
+        # the shadow is not in the parent's children, find its index by id
+        object.__setattr__(node, "_id", block.id)
+    # prefixes and postfixes usually have no parent, so chunk styles skip them
+    prefix, postfix = node.prefix, node.postfix
+    object.__setattr__(node, "prefix", _shadow_sent(prefix, node if prefix.parent is block else prefix.parent))
+    object.__setattr__(node, "postfix", _shadow_sent(postfix, node if postfix.parent is block else postfix.parent))
+    return node
+
+
+# -------------------------
+# Memoization
+# -------------------------
+
+def _render_key(block: Block, nested: bool) -> tuple:
+    registry = style_registry_ctx.get()
+    parent = block.parent
+    if parent is None or not nested:
+        return (id(registry), registry.version, tuple(block.styles), None, None)
+    return (id(registry), registry.version, tuple(block.styles), tuple(getattr(parent, "styles", ())), block.index)
+
+
+class RenderMemo:
+    """
+    The memoized rendering of a block. `own` holds the text the block adds
+    around its children when they were rendered from their own memos, token
+    counts are built from it without tokenizing the children again.
+    """
+    __slots__ = ("key", "text", "own", "tokens")
+    
+    def __init__(self, key: tuple, text: str, own: tuple[str, str] | None):
+        self.key = key
+        self.text = text
+        self.own = own
+        self.tokens: dict[Any, int] = {}
+
+
+class Exclusion:
+    """Blocks left out of a rendering, and the ancestors they change."""
+    __slots__ = ("dropped", "dirty")
+    
+    def __init__(self, blocks: list[Block]):
+        self.dropped = {id(b) for b in blocks}
+        self.dirty = set()
+        for b in blocks:
+            parent = b.parent
+            while parent is not None and id(parent) not in self.dirty:
+                self.dirty.add(id(parent))
+                parent = parent.parent
+
+
+def _style_shadow(block: Block, node: Block | None, exclude: Exclusion | None = None):
+    """
+    Style a shadow of `block` and of its children. Returns the shadow, the
+    children it was built from, their shadows and the styled shadow.
+    """
+    if node is None:
+        node = _shadow_block(block, block.parent)
+    source = block.children
+    if exclude is not None:
+        source = [c for c in source if id(c) not in exclude.dropped]
+    object.__setattr__(node, "content", _shadow_sent(block.content, node, share_chunks=True))
+    children = [_shadow_block(c, node) if isinstance(c, Block) else c for c in source]
+    object.__setattr__(node, "children", children)
+    for i, child in enumerate(children):
+        object.__setattr__(child, "_index", i)
+    return node, source, children, apply_style(node)
+
+
+def _render_block(block: Block, node: Block | None = None, exclude: Exclusion | None = None, memo: bool = True) -> str:
+    """
+    Render a block without changing it. The result is memoized on the block
+    until it or one of its descendants changes. `node` is the shadow the
+    parent already styled. Blocks in `exclude` are left out, the blocks
+    above them are rendered without the memo.
+    """
+    cache = block._render_cache
+    is_shadow = cache is RENDER_SHADOW
+    dirty = exclude is not None and id(block) in exclude.dirty
+    use_memo = memo and not is_shadow and not dirty
+    key = None
+    if use_memo:
+        key = _render_key(block, node is not None)
+        if cache is not None and cache.key == key:
+            return cache.text
+    node, source, children, target = _style_shadow(block, node, exclude if dirty else None)
     prefix = ""
     content = ""
+    postfix = ""
     children_content = ""
+    own = None
+    if target.prefix is not None:
+        prefix = render_text(target.prefix)
+    if target.content is not None:
+        content = render_text(target.content)
+    if target.postfix is not None:
+        postfix = render_text(target.postfix)
+    if target is node and target.children is children and len(children) == len(source):
+        # a child that moved up renders differently than its memo
+        children_content = "".join(
+            _render_block(c, n, exclude, memo=not dirty or c.index == i) if isinstance(c, Block) else render(c)
+            for i, (c, n) in enumerate(zip(source, children))
+        )
+        own = (f"{prefix}{content}", postfix)
+    elif target.children:
+        children_content = "".join(render(c) for c in target.children)
+    result = f"{prefix}{content}{children_content}{postfix}"
+    if use_memo:
+        block._render_cache = RenderMemo(key, result, own)
+    return result
+
+
+def count_tokens(block: Block, counter: Callable[[str], int]) -> int:
+    """
+    Token count of the rendering of `block`. Counts are kept on the render
+    memo, a block that changed only counts the text it adds around its
+    children and takes the rest from the memos of its children.
+    """
+    memo = block._render_cache
+    if not isinstance(memo, RenderMemo):
+        render(block)
+        memo = block._render_cache
+        if not isinstance(memo, RenderMemo):
+            return counter(render(block))
+    tokens = memo.tokens.get(counter)
+    if tokens is None:
+        if memo.own is None:
+            tokens = counter(memo.text)
+        else:
+            tokens = sum(counter(text) for text in memo.own if text)
+            for child in block.children:
+                tokens += count_tokens(child, counter) if isinstance(child, Block) else counter(render(child))
+        memo.tokens[counter] = tokens
+    return tokens
+
+
+class RenderedChunks:
+    """
+    Rendered-offset index of the chunks of a sentence. Chunks are only ever
+    appended while streaming, so rendering a sentence again only renders the
+    new chunks. Shared by a sentence and its render shadows, it starts over
+    when the chunk styler changes or the chunks were changed in any other
+    way than appending.
+    """
+    __slots__ = ("styler", "texts", "ends", "last", "_text", "_joined")
+    
+    def __init__(self, styler=None):
+        self.reset(styler)
+        
+    def reset(self, styler=None):
+        self.styler = styler
+        self.texts: list[str] = []
+        self.ends: list[int] = []
+        self.last = None
+        self._text = ""
+        self._joined = 0
+        
+    @property
+    def length(self) -> int:
+        return self.ends[-1] if self.ends else 0
+    
+    @property
+    def text(self) -> str:
+        if self._joined < len(self.texts):
+            self._text += "".join(self.texts[self._joined:])
+            self._joined = len(self.texts)
+        return self._text
+    
+    def text_from(self, offset: int) -> str:
+        """The rendered chunks from `offset` on, without joining the whole text."""
+        if offset <= 0:
+            return self.text
+        i = bisect.bisect_right(self.ends, offset)
+        if i == len(self.texts):
+            return ""
+        start = self.ends[i - 1] if i else 0
+        return self.texts[i][offset - start:] + "".join(self.texts[i + 1:])
+    
+    def update(self, target: BlockSent, styler):
+        """Render the chunks of `target` appended since the last update."""
+        children = target.children
+        count = len(self.texts)
+        if styler is not self.styler or (count and (count > len(children) or children[count - 1] is not self.last)):
+            self.reset(styler)
+            count = 0
+        if count == len(children):
+            return
+        end = self.length
+        for i in range(count, len(children)):
+            chunk = children[i]
+            if styler is not None:
+                # styles change chunks, style a copy that takes its place
+                chunk = chunk.copy(copy_id=True)
+                chunk.parent = target
+                chunk._index = i
+            text = _render_chunk(chunk, styler)
+            end += len(text)
+            self.texts.append(text)
+            self.ends.append(end)
+        self.last = children[-1]
+
+
+def _render_sent_parts(target) -> tuple[str, RenderedChunks | None, str]:
+    prefix = ""
+    content = ""
     postfix = ""
+    rendered = None
     if target.prefix:
         prefix = render(target.prefix)
     if target.content:
@@ -114,11 +444,37 @@ def render_text(target) -> str:
     if target.postfix:
         postfix = render(target.postfix)
     if target.children:
-        children_content = "".join(render(c) for c in target.children)
-    return f"{prefix}{content}{children_content}{postfix}"
+        styler = None
+        if target.parent is not None:
+            styler = style_registry_ctx.get().table(target.parent.styles)[("chunk", "all")]
+        if target._render_cache is not RENDER_SHADOW:
+            target = _shadow_sent(target, target.parent, share_chunks=True)
+        elif target._rendered is None:
+            # a style changed the chunks of the shadow
+            object.__setattr__(target, "_rendered", RenderedChunks())
+        rendered = target._rendered
+        rendered.update(target, styler)
+    return prefix + content, rendered, postfix
+
+
+def render_text(target) -> str:
+    head, rendered, postfix = _render_sent_parts(target)
+    if rendered is None:
+        return f"{head}{postfix}"
+    return f"{head}{rendered.text}{postfix}"
+
+
+def _render_chunk(target: BlockChunk, styler=None) -> str:
+    if target.content is not None:
+        if styler is not None:
+            target = styler(target)
+        return f"{target.prefix}{render(target.content)}{target.postfix}"
+    else:
+        return ""
 
 
 def render(target) -> str:    
+    """Render a block, sentence or chunk. The source is never changed."""
     if type(target) is str:
         return target
     elif type(target) in (int, float, bool):
@@ -127,33 +483,145 @@ def render(target) -> str:
         return "".join(render(c) for c in target)
     # elif type(target) is Block:
     elif isinstance(target, Block):
-        target = apply_style(target)
-        prefix = ""
-        content = ""
-        postfix = ""
-        children_content = ""
-        if target.prefix is not None:
-            prefix = render_text(target.prefix)
-        if target.content is not None:
-            content = render_text(target.content)
-        if target.postfix is not None:
-            postfix = render_text(target.postfix)
-        if target.children:
-            cl = [render(c) for c in target.children]
-            children_content = "".join(cl)
-            # children_content = textwrap.indent(children_content, "  ")
-        return f"{prefix}{content}{children_content}{postfix}"
+        return _render_block(target)
     elif type(target) is BlockSent:
         return render_text(target)
 
     elif type(target) is BlockChunk:
-        if target.content is not None:
-            target = apply_chunk_style(target)
-            return f"{target.prefix}{render(target.content)}{target.postfix}"
-        else:
-            return ""
+        return _render_chunk(apply_chunk_style(target.copy(copy_parent=True, copy_id=True)))
     else:
         raise ValueError(f"Unknown type: {type(target)}") 
+
+
+def render_delta(target: Block | BlockSent, since: int = 0) -> str:
+    """
+    The rendered text of `target` from offset `since` on, the same as
+    render(target)[since:]. Streaming consumers keep the offset and ask for
+    what was added since:
+    
+        offset = 0
+        async for chunk in stream:
+            delta = response.render_delta(offset)
+            offset += len(delta)
+    
+    Sentences only render the chunks appended since the last call. Blocks
+    take the length of the children that did not change from their render
+    memo and only render from the first child that changed, the text before
+    `since` is never joined.
+    """
+    if since < 0:
+        raise ValueError(f"since must be a non negative offset, got {since}")
+    if type(target) is BlockSent:
+        return _sent_delta(target, since)[1]
+    if isinstance(target, Block):
+        return _block_delta(target, since)[1]
+    return render(target)[since:]
+
+
+def render_offset(root: Block, block: Block) -> tuple[int, int]:
+    """
+    Where `block` starts in the rendering of `root` and where the chunks of
+    its content end. The blocks before it are measured from their render
+    memo. Text is only ever added after the chunks of a content, so a
+    consumer that keeps the rendering up to date with render_delta can
+    re-render from there:
+    
+        since = render_offset(response, view)[1]
+        view.content.append(chunk)
+        text = text[:since] + response.render_delta(since)
+    """
+    path = []
+    node = block
+    while node is not root:
+        if node is None:
+            raise ValueError("block is not a descendant of root")
+        path.append(node)
+        node = node.parent
+    offset = 0
+    shadow = None
+    for next_block in reversed(path):
+        shadow, source, children, target = _style_shadow(node, shadow)
+        if target is not shadow or target.children is not children or len(children) != len(source):
+            # styles rebuilt the children, they can not be matched to the blocks
+            return 0, 0
+        if target.prefix is not None:
+            offset += len(render_text(target.prefix))
+        if target.content is not None:
+            offset += _sent_length(target.content)
+        index = node.index_of(next_block)
+        for c, n in zip(source[:index], children[:index]):
+            offset += len(_render_block(c, n)) if isinstance(c, Block) else len(render(c))
+        node, shadow = next_block, children[index]
+    target = _style_shadow(node, shadow)[3]
+    start = offset
+    if target.prefix is not None:
+        offset += len(render_text(target.prefix))
+    if target.content is not None:
+        head, rendered, _ = _render_sent_parts(target.content)
+        offset += len(head) + (rendered.length if rendered else 0)
+    return start, offset
+
+
+def _sent_length(target: BlockSent) -> int:
+    head, rendered, postfix = _render_sent_parts(target)
+    return len(head) + (rendered.length if rendered else 0) + len(postfix)
+
+
+def _sent_delta(target: BlockSent, since: int) -> tuple[int, str]:
+    """The length of the rendering of a sentence and its text from `since` on."""
+    head, rendered, postfix = _render_sent_parts(target)
+    length = len(head) + (rendered.length if rendered else 0) + len(postfix)
+    if since <= len(head):
+        return length, head[since:] + (rendered.text if rendered else "") + postfix
+    since -= len(head)
+    if rendered is None:
+        return length, postfix[since:]
+    if since <= rendered.length:
+        return length, rendered.text_from(since) + postfix
+    return length, postfix[since - rendered.length:]
+
+
+def _block_delta(block: Block, since: int, node: Block | None = None) -> tuple[int, str]:
+    """
+    The length of the rendering of a block and its text from `since` on. A
+    block with a valid memo is sliced from it, the last child of a changed
+    block, where streamed text is added, is followed down the same way and
+    the other changed children are rendered and memoized.
+    """
+    cache = block._render_cache
+    if isinstance(cache, RenderMemo) and cache.key == _render_key(block, node is not None):
+        return len(cache.text), cache.text[since:]
+    node, source, children, target = _style_shadow(block, node)
+    parts = []
+    if target.prefix is not None:
+        parts.append(render_text(target.prefix))
+    if target.content is not None:
+        parts.append(target.content)
+    if target is node and target.children is children and len(children) == len(source):
+        last = len(source) - 1
+        for i, (c, n) in enumerate(zip(source, children)):
+            if isinstance(c, Block):
+                parts.append((c, n) if i == last else _render_block(c, n))
+            else:
+                parts.append(render(c))
+    elif target.children:
+        parts.extend(render(c) for c in target.children)
+    if target.postfix is not None:
+        parts.append(render_text(target.postfix))
+    length = 0
+    delta = []
+    for part in parts:
+        offset = max(since - length, 0)
+        if type(part) is str:
+            size, text = len(part), part[offset:]
+        elif type(part) is tuple:
+            size, text = _block_delta(part[0], offset, part[1])
+        else:
+            size, text = _sent_delta(part, offset)
+        length += size
+        if text:
+            delta.append(text)
+    return length, "".join(delta)
     
 
 class BlockStyle(metaclass=StyleMeta):
@@ -197,6 +665,10 @@ class ChunkStreamStyle(ChunkStyle):
 
     
     
+_default_text_style = TextStyle()
+_default_block_style = BlockStyle()
+    
+    
 class BlockStreamViewStyle(BlockStyle):
     styles = ["stream-view"]
     
@@ -0,0 +1,184 @@
+from bisect import bisect_left, bisect_right
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .block import Block
+
+
+
+class _Stale(Exception):
+    """An indexed block was moved, removed or retagged behind the index."""
+
+
+class BlockIndex:
+    """
+    Tag and id index of a block tree, kept on the root block by
+    `Block.build_index`. The blocks of every tag are kept in document order,
+    so `Block.get` and `Block.get_last` are a binary search instead of a walk
+    of the tree. The index is updated by append_child, insert_child,
+    replace_child, by assigning `tags` or `children` of an indexed block and
+    by editing its `tags` in place.
+
+    Changes that go around these (editing a `children` list in place,
+    setting the id of an indexed block) are not seen. A tag lookup
+    that runs into one rebuilds the index, or call `rebuild` after such
+    changes.
+
+    Example:
+        response.build_index()
+        answer = response.get_last("answer")
+    """
+
+    def __init__(self, root: "Block"):
+        self.root = root
+        self._tags: dict[str, list["Block"]] = {}
+        self._ids: dict[str, "Block"] = {}
+        # blocks whose id was not generated yet when they were indexed
+        self._unnamed: list["Block"] = []
+        self.rebuild()
+
+    def rebuild(self):
+        self._tags = {}
+        self._ids = {}
+        self._unnamed = []
+        self._add(self.root)
+
+    def _position(self, block: "Block") -> tuple[int, ...]:
+        """Index path of `block` from the root, it orders blocks in document order."""
+        path = []
+        root = self.root
+        while block is not root:
+            parent = block.parent
+            if parent is None:
+                raise _Stale()
+            children = parent.children
+            i = block._index
+            if i is None or i >= len(children) or children[i] is not block:
+                for i, child in enumerate(children):
+                    if child is block:
+                        block._index = i
+                        break
+                else:
+                    raise _Stale()
+            path.append(i)
+            block = parent
+        path.reverse()
+        return tuple(path)
+
+    def _subtree(self, block: "Block"):
+        yield block
+        for child in block.children:
+            yield from self._subtree(child)
+
+    def contains(self, block: "Block") -> bool:
+        """Whether `block` is in the indexed tree."""
+        try:
+            self._position(block)
+        except _Stale:
+            return False
+        return True
+
+    def add(self, block: "Block"):
+        """Index `block` and its descendants, blocks outside the tree are ignored."""
+        if not self.contains(block):
+            return
+        try:
+            self._add(block)
+        except _Stale:
+            self.rebuild()
+
+    def _add(self, block: "Block"):
+        position = self._position
+        for node in self._subtree(block):
+            for tag in node.tags:
+                nodes = self._tags.setdefault(tag, [])
+                if not nodes or position(nodes[-1]) < position(node):
+                    # blocks streamed in are usually the last of their tag
+                    nodes.append(node)
+                else:
+                    nodes.insert(bisect_right(nodes, position(node), key=position), node)
+            if node._id is None:
+                self._unnamed.append(node)
+            else:
+                self._ids.setdefault(node._id, node)
+
+    def remove(self, block: "Block"):
+        """Drop `block` and its descendants from the index."""
+        for node in self._subtree(block):
+            for tag in node.tags:
+                nodes = self._tags.get(tag)
+                if nodes is not None:
+                    nodes[:] = [n for n in nodes if n is not node]
+            if node._id is not None and self._ids.get(node._id) is node:
+                del self._ids[node._id]
+        if self._unnamed:
+            removed = {id(node) for node in self._subtree(block)}
+            self._unnamed = [n for n in self._unnamed if id(n) not in removed]
+
+    def _checked(self, block: "Block", tag: str) -> tuple[int, ...]:
+        if tag not in block.tags:
+            raise _Stale()
+        return self._position(block)
+
+    def _get(self, tag: str, block: "Block", last: bool) -> "Block | None":
+        nodes = self._tags.get(tag)
+        if not nodes:
+            return None
+        if block is self.root:
+            start = ()
+            found = nodes[-1] if last else nodes[0]
+        else:
+            start = self._position(block)
+            if last:
+                i = bisect_right(nodes, start + (float("inf"),), key=self._position)
+                if i == 0:
+                    return None
+                found = nodes[i - 1]
+            else:
+                i = bisect_left(nodes, start, key=self._position)
+                if i == len(nodes):
+                    return None
+                found = nodes[i]
+        if self._checked(found, tag)[:len(start)] != start:
+            return None
+        if last:
+            # like the walk of get_last, a tagged ancestor wins over the blocks inside it
+            node = found
+            while node is not block:
+                node = node.parent
+                if tag in node.tags:
+                    found = node
+        return found
+
+    def get(self, tag: str, block: "Block | None" = None, last: bool = False) -> "Block | None":
+        """First (or last) block with `tag` inside `block`, the root by default. `block` must be in the tree."""
+        block = block if block is not None else self.root
+        try:
+            return self._get(tag, block, last)
+        except _Stale:
+            self.rebuild()
+            return self._get(tag, block, last)
+
+    def _get_id(self, id: str) -> "Block | None":
+        block = self._ids.get(id)
+        if block is None and self._unnamed:
+            unnamed = []
+            for node in self._unnamed:
+                if node._id is None:
+                    unnamed.append(node)
+                else:
+                    self._ids.setdefault(node._id, node)
+            self._unnamed = unnamed
+            block = self._ids.get(id)
+        if block is not None:
+            if block._id != id:
+                raise _Stale()
+            self._position(block)
+        return block
+
+    def get_id(self, id: str) -> "Block | None":
+        try:
+            return self._get_id(id)
+        except _Stale:
+            self.rebuild()
+            return self._get_id(id)
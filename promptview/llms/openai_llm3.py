@@ -91,25 +91,32 @@ class OpenAiLLM(BaseLLM):
                         logprobs=True,                
                     )
                             
-                async for chunk in res_stream:                
-                    if chunk.choices[0].delta:
-                        choice = chunk.choices[0]                   
-                        content = choice.delta.content
-                        if content is not None:
-                            full_content += content
-                        if content is None:
-                            continue
-                        try:
-                            if choice.logprobs and choice.logprobs.content:                
-                                logprob = choice.logprobs.content[0].logprob
-                            else:
-                                logprob = 0  
-                        except:
-                            raise ValueError("No logprobs")        
-                        blk_chunk = BlockChunk(content, logprob=logprob)
-                        yield blk_chunk
+                try:
+                    async for chunk in res_stream:                
+                        if chunk.choices[0].delta:
+                            choice = chunk.choices[0]                   
+                            content = choice.delta.content
+                            if content is not None:
+                                full_content += content
+                            if content is None:
+                                continue
+                            try:
+                                if choice.logprobs and choice.logprobs.content:                
+                                    logprob = choice.logprobs.content[0].logprob
+                                else:
+                                    logprob = 0  
+                            except:
+                                raise ValueError("No logprobs")        
+                            blk_chunk = BlockChunk(content, logprob=logprob)
+                            yield blk_chunk
+                finally:
+                    # closes the HTTP response when the consumer stops reading early
+                    await res_stream.close()
                 llm_run.end(outputs={"content": full_content})
                 return
+            except GeneratorExit:
+                llm_run.end(outputs={"content": full_content})
+                raise
             except Exception as e:
                 llm_run.end(outputs={"content": full_content}, errors=str(e))
                 raise e
@@ -3,7 +3,7 @@ from .model3 import Model
 from .fields import ModelField, RelationField, KeyField, VectorField
 from .postgres2.pg_namespace import PgNamespace
 from .namespace_manager2 import NamespaceManager
-from .versioning.models import Branch, Turn, TurnStatus, VersionedModel, ArtifactModel, BlockModel, BlockNode, BlockTree, ExecutionSpan, Log, SpanEvent
+from .versioning.models import Branch, Turn, TurnStatus, VersionedModel, ArtifactModel, ArtifactCheckpoint, BlockModel, BlockNode, BlockTree, ExecutionSpan, Log, SpanEvent
 # from .context import Context
 from .vectors import Vector, SparseVector, transformer
 # from ..context.model_context import ModelCtx, Context
@@ -17,6 +17,7 @@ __all__ = [
     "Model", 
     "VersionedModel",    
     "ArtifactModel",
+    "ArtifactCheckpoint",
     "PgNamespace", 
     "NamespaceManager",
     "ModelField",
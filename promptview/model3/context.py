@@ -137,12 +137,54 @@ class Context(BaseModel):
     # def fork(self, branch: Branch | None = None)
     
     async def _handle_tasks(self) -> Branch:
-        for task in self._tasks:
-            if isinstance(task, LoadBranch):
+        tasks = list(self._tasks)
+        pending_branch_id = None
+        while tasks:
+            task = tasks.pop(0)
+            next_task = tasks[0] if tasks else None
+            if isinstance(task, LoadBranch) and isinstance(next_task, (StartTurn, ForkTurn)):
+                # the next task reads the branch in the same statement
+                pending_branch_id = task.branch_id
+            elif isinstance(task, ForkTurn) and isinstance(next_task, StartTurn):
+                start_task = tasks.pop(0)
+                if task.turn is not None:
+                    turn_id = task.turn.id
+                else:
+                    turn_id = task.turn_id
+                # a queued LoadBranch wins over the branch the context was made with
+                if pending_branch_id is not None:
+                    branch_id = pending_branch_id
+                elif self._branch is not None:
+                    branch_id = self._branch.id
+                else:
+                    branch_id = 1
+                self._branch, self._turn = await Branch.fork_and_start_turn(
+                    branch_id=branch_id,
+                    turn_id=turn_id,
+                    auto_commit=start_task.auto_commit,
+                )
+                pending_branch_id = None
+            elif isinstance(task, StartTurn) and (self._branch is None or pending_branch_id is not None):
+                if pending_branch_id is not None:
+                    self._branch, self._turn = await Branch.start_turn_on(
+                        pending_branch_id, 
+                        name=None, 
+                        auto_commit=task.auto_commit
+                    )
+                else:
+                    self._branch, self._turn = await Branch.start_turn_on(
+                        task.branch_id or 1, 
+                        auto_commit=task.auto_commit
+                    )
+                pending_branch_id = None
+            elif isinstance(task, LoadBranch):
                 self._branch = await Branch.get(task.branch_id)
             elif isinstance(task, LoadTurn):
                 self._turn = await Turn.get(task.turn_id)                
             elif isinstance(task, ForkTurn):
+                if pending_branch_id is not None:
+                    self._branch = await Branch.get(pending_branch_id)
+                    pending_branch_id = None
                 if task.turn is not None:
                     branch = await self._get_branch()
                     self._branch = await branch.fork_branch(task.turn)
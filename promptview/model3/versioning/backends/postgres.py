@@ -1,6 +1,25 @@
-from typing import List, Optional
+import datetime as dt
+from typing import List, Optional, Tuple
 from promptview.utils.db_connections import PGConnectionManager
-from ..models import Branch, Turn, TurnStatus
+from ..models import ArtifactCheckpoint, ArtifactModel, Branch, Turn, TurnStatus
+
+
+def branch_hierarchy_cte(name: str, param: str) -> str:
+    """
+    Recursive CTE over the ancestry of a branch. Every row carries the last turn
+    index visible from the starting branch (start_turn_index) and its depth.
+    """
+    return f"""
+        {name} AS (
+            SELECT id, forked_from_branch_id, forked_from_index, current_index AS start_turn_index, 0 AS depth
+            FROM branches
+            WHERE id = {param}
+            UNION ALL
+            SELECT b.id, b.forked_from_branch_id, b.forked_from_index, h.forked_from_index AS start_turn_index, h.depth + 1
+            FROM branches b
+            JOIN {name} h ON b.id = h.forked_from_branch_id
+        )"""
+
 
 class PostgresBranchManager:
     async def get_ancestors(self, branch_id: int) -> List[Branch]:
@@ -15,6 +34,38 @@ class PostgresBranchManager:
         """
         rows = await PGConnectionManager.fetch(sql, branch_id)
         return [Branch(**row) for row in rows]
+    
+    async def lineage(self, branch_id: int) -> List[Branch]:
+        """Ancestors of a branch ordered from the root down to the branch itself."""
+        sql = f"""
+            WITH RECURSIVE {branch_hierarchy_cte("branch_hierarchy", "$1")}
+            SELECT b.* FROM branches b
+            JOIN branch_hierarchy bh ON b.id = bh.id
+            ORDER BY bh.depth DESC;
+        """
+        rows = await PGConnectionManager.fetch(sql, branch_id)
+        return [Branch(**row) for row in rows]
+    
+    async def common_ancestor(
+        self, 
+        branch_a_id: int, 
+        branch_b_id: int, 
+        status: Optional[TurnStatus] = None
+    ) -> Optional[Turn]:
+        """The latest turn visible from both branches, None if they share no history."""
+        sql = f"""
+            WITH RECURSIVE {branch_hierarchy_cte("hierarchy_a", "$1")},
+            {branch_hierarchy_cte("hierarchy_b", "$2")}
+            SELECT t.* FROM turns t
+            JOIN hierarchy_a ha ON t.branch_id = ha.id
+            JOIN hierarchy_b hb ON t.branch_id = hb.id
+            WHERE t.index <= LEAST(ha.start_turn_index, hb.start_turn_index)
+              AND ($3::TEXT IS NULL OR t.status::TEXT = $3)
+            ORDER BY t.index DESC
+            LIMIT 1;
+        """
+        row = await PGConnectionManager.fetch_one(sql, branch_a_id, branch_b_id, status.value if status else None)
+        return Turn(**row) if row else None
 
     async def get_descendants(self, branch_id: int) -> List[Branch]:
         sql = """
@@ -52,29 +103,91 @@ class PostgresTurnManager:
         self,
         branch_id: int,
         status: Optional[TurnStatus] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        before_index: Optional[int] = None,
     ) -> List[Turn]:
-        branch_mgr = PostgresBranchManager()
-        ancestors = await branch_mgr.get_ancestors(branch_id)
-        ancestor_ids = [b.id for b in ancestors]
-
-        sql = """
-            SELECT * FROM turns
-            WHERE branch_id = ANY($1)
         """
-        params = [ancestor_ids]
-
-        if status is not None:
-            sql += " AND status = $2"
-            params.append(status.value)
-
-        sql += " ORDER BY index DESC"
-
-        if limit is not None:
-            sql += f" LIMIT {limit}"
-
-        rows = await PGConnectionManager.fetch(sql, *params)
+        Turns visible from a branch, newest first. Ancestor turns are cut at the
+        index the branch was forked from. Pass the index of the last turn of the
+        previous page as `before_index` to read the next page.
+        """
+        sql = f"""
+            WITH RECURSIVE {branch_hierarchy_cte("branch_hierarchy", "$1")}
+            SELECT t.* FROM turns t
+            JOIN branch_hierarchy bh ON t.branch_id = bh.id
+            WHERE t.index <= bh.start_turn_index
+              AND ($2::TEXT IS NULL OR t.status::TEXT = $2)
+              AND ($3::INTEGER IS NULL OR t.index < $3)
+            ORDER BY t.index DESC
+            LIMIT $4;
+        """
+        rows = await PGConnectionManager.fetch(
+            sql, 
+            branch_id, 
+            status.value if status else None, 
+            before_index, 
+            limit
+        )
         return [Turn(**row) for row in rows]
+    
+    async def diff(
+        self,
+        branch_a_id: int,
+        branch_b_id: int,
+        status: Optional[TurnStatus] = TurnStatus.COMMITTED,
+        limit: Optional[int] = None,
+        before: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[List[Turn], List[Turn]]:
+        """
+        Turns visible from only one of the two branches, newest first.
+        For every branch of a lineage only the index range between the two
+        cutoffs is read, so the shared history is never scanned.
+        `limit` applies to both sides together, `before` is the (index, id) of
+        the oldest turn of the previous page.
+        """
+        before_index, before_id = before if before is not None else (None, None)
+        sql = f"""
+            WITH RECURSIVE {branch_hierarchy_cte("hierarchy_a", "$1")},
+            {branch_hierarchy_cte("hierarchy_b", "$2")},
+            only_a AS (
+                SELECT t.*, 'a' AS side FROM turns t
+                JOIN hierarchy_a ha ON t.branch_id = ha.id
+                LEFT JOIN hierarchy_b hb ON hb.id = ha.id
+                WHERE t.index <= ha.start_turn_index
+                  AND (hb.id IS NULL OR t.index > hb.start_turn_index)
+            ),
+            only_b AS (
+                SELECT t.*, 'b' AS side FROM turns t
+                JOIN hierarchy_b hb ON t.branch_id = hb.id
+                LEFT JOIN hierarchy_a ha ON ha.id = hb.id
+                WHERE t.index <= hb.start_turn_index
+                  AND (ha.id IS NULL OR t.index > ha.start_turn_index)
+            ),
+            diff AS (
+                SELECT * FROM only_a
+                UNION ALL
+                SELECT * FROM only_b
+            )
+            SELECT * FROM diff
+            WHERE ($3::TEXT IS NULL OR status::TEXT = $3)
+              AND ($4::INTEGER IS NULL OR (index, id) < ($4, $5::INTEGER))
+            ORDER BY index DESC, id DESC
+            LIMIT $6;
+        """
+        rows = await PGConnectionManager.fetch(
+            sql, 
+            branch_a_id, 
+            branch_b_id, 
+            status.value if status else None,
+            before_index,
+            before_id,
+            limit,
+        )
+        only_a, only_b = [], []
+        for row in rows:
+            side = row.pop("side")
+            (only_a if side == "a" else only_b).append(Turn(**row))
+        return only_a, only_b
 
     async def start_turn(
         self, 
@@ -104,12 +217,20 @@ class PostgresTurnManager:
     async def update_status(self, turn: Turn, status: TurnStatus, message: Optional[str] = None) -> Turn:
         sql = """
             UPDATE turns
-            SET status = $2, ended_at = NOW(), message = $3
+            SET status = $2, ended_at = NOW(), message = COALESCE($3, message)
             WHERE id = $1
-            RETURNING *;
+            RETURNING ended_at;
         """
         row = await PGConnectionManager.fetch_one(sql, turn.id, status.value, message)
-        return Turn(**row)
+        turn.status = status
+        turn.ended_at = row["ended_at"] if row else dt.datetime.now()
+        if message:
+            turn.message = message
+        if status == TurnStatus.REVERTED:
+            await ArtifactCheckpoint.invalidate(turn.branch_id, turn.index)
+        elif status == TurnStatus.COMMITTED:
+            ArtifactModel.schedule_checkpoints(turn)
+        return turn
 
     async def rewind(self, branch: Branch, to_turn: Turn):
         """
@@ -120,3 +241,4 @@ class PostgresTurnManager:
             WHERE branch_id = $1 AND index > $2
         """
         await PGConnectionManager.execute(sql, branch.id, to_turn.index)
+        await ArtifactCheckpoint.invalidate(branch.id, to_turn.index + 1)
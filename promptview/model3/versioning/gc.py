@@ -0,0 +1,242 @@
+import asyncio
+import time
+import datetime as dt
+from dataclasses import dataclass, field
+from typing import Any, List
+
+from promptview.model3.namespace_manager2 import NamespaceManager
+from promptview.utils.db_connections import PGConnectionManager
+
+
+
+@dataclass
+class GCTableStats:
+    rows: int = 0
+    bytes: int = 0
+    batches: int = 0
+
+
+@dataclass
+class GCReport:
+    """
+    Result of a garbage collection run. In dry-run mode the table stats hold
+    what would be reclaimed. Bytes are the on-disk size of the row data
+    (pg_column_size), without indexes.
+    """
+    dry_run: bool
+    cutoff: dt.datetime
+    turn_ids: List[int] = field(default_factory=list)
+    branch_ids: List[int] = field(default_factory=list)
+    tables: dict[str, GCTableStats] = field(default_factory=dict)
+    duration: float = 0.0
+
+    @property
+    def total_rows(self) -> int:
+        return sum(s.rows for s in self.tables.values())
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(s.bytes for s in self.tables.values())
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "dry_run": self.dry_run,
+            "cutoff": self.cutoff.isoformat(),
+            "turns": len(self.turn_ids),
+            "branches": len(self.branch_ids),
+            "rows": self.total_rows,
+            "bytes": self.total_bytes,
+            "duration": self.duration,
+            "tables": {name: vars(stats) for name, stats in self.tables.items()},
+        }
+
+
+
+_BUILTIN_TABLES = {"turns", "branches", "span_events", "block_nodes", "block_trees", "execution_spans", "blocks", "artifact_checkpoints"}
+
+
+class VersionGC:
+    """
+    Mark-and-sweep garbage collector for the version graph.
+
+    Mark: turns that are unreachable from the live graph. These are reverted
+    turns older than the grace period, turns of deleted branches and turns of
+    abandoned forks (leaf forks older than the grace period without a
+    committed turn). Turns that a live branch was forked from are kept.
+
+    Sweep: deletes everything hanging off the marked turns, then the turns,
+    the abandoned branches and finally the content-addressed blocks of the
+    swept block trees that no other block node references. Every delete is a
+    separate statement of at most `batch_size` rows so locks are held briefly.
+
+    Example:
+        report = await VersionGC(grace_period=dt.timedelta(days=1)).collect(dry_run=True)
+        print(report.total_rows, report.total_bytes)
+    """
+
+    def __init__(
+        self,
+        grace_period: dt.timedelta = dt.timedelta(days=7),
+        batch_size: int = 1000,
+        pause: float = 0.0,
+    ):
+        if batch_size <= 0:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+        self.grace_period = grace_period
+        self.batch_size = batch_size
+        self.pause = pause
+
+    async def mark(self, cutoff: dt.datetime) -> tuple[List[int], List[int]]:
+        """Return the ids of unreachable turns and abandoned branches."""
+        sql = """
+            WITH dead_branches AS (
+                SELECT b.id FROM branches b
+                WHERE b.forked_from_branch_id IS NOT NULL
+                  AND b.created_at < $1
+                  AND NOT EXISTS (SELECT 1 FROM branches c WHERE c.forked_from_branch_id = b.id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM turns t
+                      WHERE t.branch_id = b.id
+                        AND (t.status = 'committed' OR COALESCE(t.ended_at, t.created_at) >= $1)
+                  )
+            ),
+            garbage_turns AS (
+                SELECT t.id FROM turns t
+                WHERE (
+                    t.branch_id IN (SELECT id FROM dead_branches)
+                    OR NOT EXISTS (SELECT 1 FROM branches b WHERE b.id = t.branch_id)
+                    OR (t.status = 'reverted' AND COALESCE(t.ended_at, t.created_at) < $1)
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM branches b
+                    WHERE b.forked_from_turn_id = t.id
+                      AND b.id NOT IN (SELECT id FROM dead_branches)
+                )
+            )
+            SELECT
+                ARRAY(SELECT id FROM garbage_turns ORDER BY id) AS turn_ids,
+                ARRAY(SELECT id FROM dead_branches ORDER BY id) AS branch_ids;
+        """
+        row = await PGConnectionManager.fetch_one(sql, cutoff)
+        return list(row["turn_ids"]), list(row["branch_ids"])
+
+    def _versioned_tables(self) -> List[str]:
+        tables = []
+        for (name, db_type), ns in NamespaceManager._registry.items():
+            if db_type != "postgres" or name in _BUILTIN_TABLES:
+                continue
+            if ns.has_field("turn_id"):
+                tables.append(ns.name)
+        return tables
+
+    def _turn_targets(self) -> List[tuple[str, str, str | None]]:
+        """
+        (table, condition on $1 turn ids, guard) in foreign key safe order.
+        The guard holds back the rows that are still referenced when the
+        batch runs, they are deleted by a later batch or kept.
+        """
+        targets = [
+            ("span_events", "turn_id = ANY($1::INTEGER[]) OR span_id IN (SELECT id FROM execution_spans WHERE turn_id = ANY($1::INTEGER[]))", None),
+            ("block_nodes", "tree_id IN (SELECT id FROM block_trees WHERE turn_id = ANY($1::INTEGER[]))", None),
+            ("block_trees", "turn_id = ANY($1::INTEGER[])", None),
+        ]
+        for table in self._versioned_tables():
+            targets.append((table, "turn_id = ANY($1::INTEGER[])", None))
+        targets += [
+            # child spans go before their parents
+            ("execution_spans", "turn_id = ANY($1::INTEGER[])", "NOT EXISTS (SELECT 1 FROM execution_spans c WHERE c.parent_span_id = execution_spans.id)"),
+            # turns that an abandoned fork starts from go after the fork itself
+            ("turns", "id = ANY($1::INTEGER[])", "NOT EXISTS (SELECT 1 FROM branches b WHERE b.forked_from_turn_id = turns.id)"),
+        ]
+        return targets
+
+    async def _measure(self, table: str, condition: str, *params) -> GCTableStats:
+        sql = f'SELECT COUNT(*) AS rows, COALESCE(SUM(pg_column_size("{table}".*)), 0) AS bytes FROM "{table}" WHERE {condition}'
+        row = await PGConnectionManager.fetch_one(sql, *params)
+        return GCTableStats(rows=row["rows"], bytes=int(row["bytes"]))
+
+    async def _sweep(self, stats: GCTableStats, table: str, condition: str, *params, guard: str | None = None):
+        if guard:
+            condition = f"({condition}) AND {guard}"
+        sql = f"""
+            DELETE FROM "{table}" t
+            WHERE t.ctid IN (
+                SELECT ctid FROM "{table}"
+                WHERE {condition}
+                LIMIT {self.batch_size}
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING pg_column_size(t.*) AS size;
+        """
+        while True:
+            rows = await PGConnectionManager.fetch(sql, *params)
+            if not rows:
+                break
+            stats.rows += len(rows)
+            stats.bytes += sum(r["size"] for r in rows)
+            stats.batches += 1
+            # with a guard, deleting a batch can release rows it held back
+            if len(rows) < self.batch_size and not guard:
+                break
+            if self.pause:
+                await asyncio.sleep(self.pause)
+
+    async def collect(self, dry_run: bool = False) -> GCReport:
+        """Run a full mark-and-sweep pass."""
+        start = time.perf_counter()
+        cutoff = dt.datetime.now() - self.grace_period
+        turn_ids, branch_ids = await self.mark(cutoff)
+        report = GCReport(dry_run=dry_run, cutoff=cutoff, turn_ids=turn_ids, branch_ids=branch_ids)
+        targets = self._turn_targets()
+        branch_condition = "branch_id = ANY($1::INTEGER[])"
+        id_condition = "id = ANY($1::INTEGER[])"
+
+        if dry_run:
+            for table, condition, _ in targets:
+                report.tables[table] = await self._measure(table, condition, turn_ids)
+            report.tables["artifact_checkpoints"] = await self._measure("artifact_checkpoints", branch_condition, branch_ids)
+            report.tables["branches"] = await self._measure("branches", id_condition, branch_ids)
+            report.tables["blocks"] = await self._measure("blocks", """blocks.id IN (
+                SELECT n.block_id FROM block_nodes n
+                JOIN block_trees bt ON n.tree_id = bt.id
+                WHERE bt.turn_id = ANY($1::INTEGER[])
+            ) AND NOT EXISTS (
+                SELECT 1 FROM block_nodes n
+                JOIN block_trees bt ON n.tree_id = bt.id
+                WHERE n.block_id = blocks.id AND NOT (bt.turn_id = ANY($1::INTEGER[]))
+            )""", turn_ids)
+            report.duration = time.perf_counter() - start
+            return report
+
+        for table, _, _ in targets:
+            report.tables[table] = GCTableStats()
+        # blocks are shared between trees, only the ones the swept trees used can become orphans
+        block_ids: set[str] = set()
+        for i in range(0, len(turn_ids), self.batch_size):
+            chunk = turn_ids[i:i + self.batch_size]
+            rows = await PGConnectionManager.fetch(
+                "SELECT DISTINCT n.block_id FROM block_nodes n JOIN block_trees bt ON n.tree_id = bt.id WHERE bt.turn_id = ANY($1::INTEGER[])",
+                chunk,
+            )
+            block_ids.update(r["block_id"] for r in rows)
+            for table, condition, guard in targets:
+                await self._sweep(report.tables[table], table, condition, chunk, guard=guard)
+
+        report.tables["artifact_checkpoints"] = GCTableStats()
+        report.tables["branches"] = GCTableStats()
+        if branch_ids:
+            await self._sweep(report.tables["artifact_checkpoints"], "artifact_checkpoints", branch_condition, branch_ids)
+            await self._sweep(report.tables["branches"], "branches", id_condition, branch_ids)
+            await self._sweep(report.tables["turns"], "turns", id_condition, turn_ids)
+
+        report.tables["blocks"] = GCTableStats()
+        block_ids = sorted(block_ids)
+        for i in range(0, len(block_ids), self.batch_size):
+            await self._sweep(
+                report.tables["blocks"],
+                "blocks",
+                "id = ANY($1::TEXT[]) AND NOT EXISTS (SELECT 1 FROM block_nodes n WHERE n.block_id = blocks.id)",
+                block_ids[i:i + self.batch_size],
+            )
+        report.duration = time.perf_counter() - start
+        return report
@@ -1,10 +1,12 @@
 from __future__ import annotations
+import datetime as dt
 from contextlib import asynccontextmanager
 from typing import List, Optional, Tuple
 
 from promptview.model3.versioning.backends.postgres import PostgresBranchManager, PostgresTurnManager
 from .models import Branch, Turn, TurnStatus
 from .managers import BranchManager, TurnManager
+from .gc import GCReport, VersionGC
 
 class VersionGraph:
     """
@@ -19,9 +21,18 @@ class VersionGraph:
         """
         Get the full lineage of a branch from its ancestors to itself.
         """
-        ancestors = await self.branch_mgr.get_ancestors(branch_id)
-        ancestors_sorted = sorted(ancestors, key=lambda b: b.created_at)
-        return ancestors_sorted
+        return await self.branch_mgr.lineage(branch_id)
+    
+    async def common_ancestor(
+        self, 
+        branch_a_id: int, 
+        branch_b_id: int, 
+        status: Optional[TurnStatus] = TurnStatus.COMMITTED
+    ) -> Turn | None:
+        """
+        Get the latest turn shared by two branches, or None if they share no history.
+        """
+        return await self.branch_mgr.common_ancestor(branch_a_id, branch_b_id, status=status)
 
     async def branch_tree(self, branch_id: int) -> List[Branch]:
         """
@@ -33,12 +44,13 @@ class VersionGraph:
         self,
         branch_id: int,
         status: Optional[TurnStatus] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        before_index: Optional[int] = None,
     ) -> List[Turn]:
         """
         Get turns for this branch and its ancestors, ordered newest first.
         """
-        return await self.turn_mgr.history(branch_id, status=status, limit=limit)
+        return await self.turn_mgr.history(branch_id, status=status, limit=limit, before_index=before_index)
 
     async def latest_turn(self, branch_id: int, status: TurnStatus = TurnStatus.COMMITTED) -> Turn:
         """
@@ -71,22 +83,22 @@ class VersionGraph:
     async def diff_turns(
         self,
         branch_a_id: int,
-        branch_b_id: int
+        branch_b_id: int,
+        limit: Optional[int] = None,
+        before: Optional[Tuple[int, int]] = None,
     ) -> Tuple[List[Turn], List[Turn]]:
         """
         Compare committed turns between two branches.
-        Returns (turns_only_in_a, turns_only_in_b).
+        Returns (turns_only_in_a, turns_only_in_b), newest first.
+        Page with `limit` and `before=(index, id)` of the oldest turn returned.
         """
-        turns_a = await self.branch_turns(branch_a_id, status=TurnStatus.COMMITTED)
-        turns_b = await self.branch_turns(branch_b_id, status=TurnStatus.COMMITTED)
-
-        ids_a = {t.id for t in turns_a}
-        ids_b = {t.id for t in turns_b}
-
-        only_a = [t for t in turns_a if t.id not in ids_b]
-        only_b = [t for t in turns_b if t.id not in ids_a]
-
-        return only_a, only_b
+        return await self.turn_mgr.diff(
+            branch_a_id, 
+            branch_b_id, 
+            status=TurnStatus.COMMITTED, 
+            limit=limit, 
+            before=before
+        )
 
     async def merge_branch(
         self,
@@ -108,6 +120,18 @@ class VersionGraph:
             await self.turn_mgr.update_status(new_turn, TurnStatus.COMMITTED)
             merged_turns.append(new_turn)
         return merged_turns
+    
+    async def collect_garbage(
+        self, 
+        grace_period: dt.timedelta = dt.timedelta(days=7), 
+        batch_size: int = 1000, 
+        dry_run: bool = False
+    ) -> GCReport:
+        """
+        Delete reverted turns, abandoned forks and the spans, block trees and
+        blocks only they reference. Use dry_run to get a report without deleting.
+        """
+        return await VersionGC(grace_period=grace_period, batch_size=batch_size).collect(dry_run=dry_run)
 
     
     @asynccontextmanager
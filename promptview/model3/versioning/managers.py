@@ -1,6 +1,6 @@
 from __future__ import annotations
 import datetime as dt
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from .models import Branch, Turn, TurnStatus, VersionedModel
 
 class BranchManager:
@@ -24,6 +24,14 @@ class BranchManager:
     async def get_ancestors(self, branch_id: int) -> List[Branch]:
         """Get all parent branches recursively."""
         raise NotImplementedError
+    
+    async def lineage(self, branch_id: int) -> List[Branch]:
+        """Get the ancestors of a branch ordered from the root to the branch."""
+        raise NotImplementedError
+    
+    async def common_ancestor(self, branch_a_id: int, branch_b_id: int, status: Optional[TurnStatus] = None) -> Optional[Turn]:
+        """Get the latest turn shared by two branches."""
+        raise NotImplementedError
 
 
 class TurnManager:
@@ -50,9 +58,26 @@ class TurnManager:
             turn.message = message
         return await turn.save()
 
-    async def history(self, branch_id: int, status: Optional[TurnStatus] = None, limit: Optional[int] = None) -> List[Turn]:
+    async def history(
+        self, 
+        branch_id: int, 
+        status: Optional[TurnStatus] = None, 
+        limit: Optional[int] = None, 
+        before_index: Optional[int] = None
+    ) -> List[Turn]:
         """List turns in a branch (with backend-specific recursion for forks)."""
         raise NotImplementedError
+    
+    async def diff(
+        self,
+        branch_a_id: int,
+        branch_b_id: int,
+        status: Optional[TurnStatus] = TurnStatus.COMMITTED,
+        limit: Optional[int] = None,
+        before: Optional[Tuple[int, int]] = None,
+    ) -> Tuple[List[Turn], List[Turn]]:
+        """Turns visible from only one of two branches."""
+        raise NotImplementedError
 
     async def rewind(self, branch: Branch, to_turn: Turn):
         """Delete all versioned models created after a given turn in this branch."""
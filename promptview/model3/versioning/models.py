@@ -1,9 +1,11 @@
+import asyncio
 from contextlib import asynccontextmanager
 import enum
+import json
 import uuid
 import datetime as dt
 import contextvars
-from typing import TYPE_CHECKING, AsyncGenerator, Callable, List, Literal, Type, TypeVar, Self, Any
+from typing import TYPE_CHECKING, AsyncGenerator, Callable, ClassVar, List, Literal, Type, TypeVar, Self, Any
 
 
 
@@ -143,6 +145,120 @@ class Branch(Model):
         # finally:
             # await turn.commit()
         
+        
+    @classmethod
+    def _turn_insert_columns(cls, kwargs: dict[str, Any], start_index: int) -> tuple[str, str, list[Any]]:
+        turn_ns = Turn.get_namespace()
+        columns = "".join([", " + k for k in kwargs.keys()])
+        placeholders = "".join([", $" + str(i) for i in range(start_index, len(kwargs) + start_index)])
+        values = []
+        for k, v in kwargs.items():
+            values.append(turn_ns.get_field(k).serialize(v) if turn_ns.has_field(k) else v)
+        return columns, placeholders, values
+    
+    @classmethod
+    def _parse_branch_turn_row(cls, row: dict | None, auto_commit: bool) -> tuple["Branch", "Turn"]:
+        if not row:
+            raise ValueError("Failed to create turn")
+        turn_ns = Turn.get_namespace()
+        if turn_ns._model_cls is None:
+            raise ValueError("Turn namespace is not initialized")
+        branch = cls(**json.loads(row["branch"]))
+        turn = turn_ns._model_cls(**json.loads(row["turn"]))
+        turn._auto_commit = auto_commit
+        return branch, turn
+    
+    
+    @classmethod
+    async def start_turn_on(
+        cls,
+        branch_id: int,
+        name: str | None = "main",
+        status: TurnStatus = TurnStatus.STAGED,
+        auto_commit: bool = True,
+        **kwargs
+    ) -> tuple["Branch", "Turn"]:
+        """
+        Start a turn on a branch in a single statement. If the branch is missing
+        it is created with `name`, or an error is raised when `name` is None.
+        """
+        columns, placeholders, values = cls._turn_insert_columns(kwargs, 4)
+        query = f"""
+            WITH updated_branch AS (
+                UPDATE branches
+                SET current_index = current_index + 1
+                WHERE id = $1
+                RETURNING *
+            ),
+            created_branch AS (
+                INSERT INTO branches (name, current_index, created_at, updated_at)
+                SELECT $2, 1, current_timestamp, current_timestamp
+                WHERE NOT EXISTS (SELECT 1 FROM updated_branch) AND $2::TEXT IS NOT NULL
+                RETURNING *
+            ),
+            target_branch AS (
+                SELECT * FROM updated_branch
+                UNION ALL
+                SELECT * FROM created_branch
+            ),
+            new_turn AS (
+                INSERT INTO turns (branch_id, index, created_at, status{columns})
+                SELECT id, current_index - 1, current_timestamp, $3{placeholders}
+                FROM target_branch
+                RETURNING *
+            )
+            SELECT row_to_json(b) AS branch, row_to_json(t) AS turn
+            FROM target_branch b, new_turn t;
+        """
+        row = await PGConnectionManager.fetch_one(query, branch_id, name, status.value, *values)
+        if row is None and name is None:
+            raise ValueError(f"Branch with ID '{branch_id}' not found")
+        return cls._parse_branch_turn_row(row, auto_commit)
+    
+    
+    @classmethod
+    async def fork_and_start_turn(
+        cls,
+        branch_id: int | None = None,
+        turn_id: int | None = None,
+        name: str | None = None,
+        status: TurnStatus = TurnStatus.STAGED,
+        auto_commit: bool = True,
+        **kwargs
+    ) -> tuple["Branch", "Turn"]:
+        """
+        Fork a branch at a turn and start a turn on the new branch in a single statement.
+        If no turn is given the branch is forked at its latest turn.
+        """
+        if branch_id is None and turn_id is None:
+            raise ValueError("branch_id or turn_id is required to fork")
+        columns, placeholders, values = cls._turn_insert_columns(kwargs, 5)
+        query = f"""
+            WITH from_turn AS (
+                SELECT id, index, branch_id
+                FROM turns
+                WHERE ($2::INTEGER IS NOT NULL AND id = $2)
+                   OR ($2::INTEGER IS NULL AND branch_id = $1)
+                ORDER BY index DESC
+                LIMIT 1
+            ),
+            new_branch AS (
+                INSERT INTO branches (name, forked_from_index, forked_from_turn_id, forked_from_branch_id, current_index, created_at, updated_at)
+                SELECT $3, index, id, COALESCE($1::INTEGER, branch_id), index + 2, current_timestamp, current_timestamp
+                FROM from_turn
+                RETURNING *
+            ),
+            new_turn AS (
+                INSERT INTO turns (branch_id, index, created_at, status{columns})
+                SELECT id, current_index - 1, current_timestamp, $4{placeholders}
+                FROM new_branch
+                RETURNING *
+            )
+            SELECT row_to_json(b) AS branch, row_to_json(t) AS turn
+            FROM new_branch b, new_turn t;
+        """
+        row = await PGConnectionManager.fetch_one(query, branch_id, turn_id, name, status.value, *values)
+        return cls._parse_branch_turn_row(row, auto_commit)
 
     
     @classmethod
@@ -217,19 +333,30 @@ class Turn(Model):
         return await insert_block(block, self.branch_id, self.id, span_id)
         
         
+    async def update_status(self, status: TurnStatus, message: str | None = None):
+        """Write only status, ended_at and message instead of the full row."""
+        self.status = status
+        self.ended_at = dt.datetime.now()
+        if message:
+            self.message = message
+        ns = self.get_namespace()
+        await PGConnectionManager.execute(
+            f'UPDATE "{ns.name}" SET status = $2, ended_at = $3, message = COALESCE($4, message) WHERE id = $1',
+            self.id, status.value, self.ended_at, message or None
+        )
+        return self
+        
     async def commit(self):
         """Mark this turn as committed."""
-        self.status = TurnStatus.COMMITTED
-        self.ended_at = dt.datetime.now()
-        return await self.save()
+        await self.update_status(TurnStatus.COMMITTED)
+        ArtifactModel.schedule_checkpoints(self)
+        return self
 
     async def revert(self, reason: str | None = None):
         """Mark this turn as reverted with an optional reason."""
-        self.status = TurnStatus.REVERTED
-        self.ended_at = dt.datetime.now()
-        if reason:
-            self.message = reason
-        return await self.save()
+        await self.update_status(TurnStatus.REVERTED, reason)
+        await ArtifactCheckpoint.invalidate(self.branch_id, self.index)
+        return self
     
     
     
@@ -435,8 +562,16 @@ class BlockTree(VersionedModel):
 
 
 class ArtifactModel(VersionedModel):
-    """VersionedModel with artifact tracking."""
+    """
+    VersionedModel with artifact tracking. Saving an artifact that has an id
+    inserts its next version, (id, version) is the key of the table, so the
+    state of any branch at any turn can be read back.
+    Set `checkpoint_interval` on a subclass to build a state checkpoint
+    in the background every N committed turns.
+    """
     _is_base = True
+    checkpoint_interval: ClassVar[int | None] = None
+    _checkpoint_tasks: ClassVar[set[asyncio.Task]] = set()
     # id: int = KeyField(primary_key=True)
     # artifact_id: uuid.UUID = KeyField(
     #         default_factory=uuid.uuid4, 
@@ -446,10 +581,26 @@ class ArtifactModel(VersionedModel):
     version: int = KeyField(default=1)
 
     @classmethod
-    async def latest(cls, artifact_id: uuid.UUID) -> Self | None:
-        """Backend-specific: get latest version per artifact."""
-        # Placeholder — will be overridden in backend manager
-        return await cls.query().filter(artifact_id=artifact_id).order_by("-version").first()
+    async def latest(cls, artifact_id: Any) -> Self | None:
+        """Latest version of an artifact, on any branch."""
+        ns = cls.get_namespace()
+        row = await PGConnectionManager.fetch_one(
+            f'SELECT * FROM "{ns.name}" WHERE "{ns.primary_key}" = $1 ORDER BY version DESC LIMIT 1',
+            artifact_id,
+        )
+        return cls(**ns.deserialize(dict(row))) if row else None
+    
+    @classmethod
+    async def get(cls, id: Any) -> Self:
+        # an artifact has a row per version
+        artifact = await cls.latest(id)
+        if artifact is None:
+            raise ValueError(f"{cls.__name__} with ID '{id}' not found")
+        return artifact
+    
+    @classmethod
+    async def get_or_none(cls, id: Any) -> Self | None:
+        return await cls.latest(id)
 
     
     async def _super_save(self):
@@ -458,12 +609,28 @@ class ArtifactModel(VersionedModel):
     async def save(self, *, branch: Branch | int | None = None, turn: Turn | int | None = None):        
         ns = self.get_namespace()
         if primary_key:= ns.get_primary_key(self):
+            # every version is a row of its own, (id, version) is the key of the table
             obj = self.model_copy(update={"turn_id": None, "branch_id": None})
             obj.version += 1
-            return await obj._super_save()
+            if not obj._should_save_to_db(branch, turn):
+                return obj
+            return await obj._insert_version(primary_key)
         else:
             return await super().save()
     
+    async def _insert_version(self, primary_key: Any) -> Self:
+        ns = self.get_namespace()
+        # versions are numbered per artifact across branches, forks can not reuse one
+        row = await PGConnectionManager.fetch_one(
+            f'SELECT COALESCE(MAX(version), 0) AS version FROM "{ns.name}" WHERE "{ns.primary_key}" = $1',
+            primary_key,
+        )
+        self.version = max(self.version, row["version"] + 1)
+        result = await ns.insert(self.model_dump())
+        for key, value in result.items():
+            setattr(self, key, value)
+        return self
+    
     # @classmethod
     # def query(
     #     cls: Type[Self], 
@@ -498,20 +665,186 @@ class ArtifactModel(VersionedModel):
         if offset:
             turn_cte = turn_cte.offset(offset)
         
-        
+        ns = cls.get_namespace()
+        pk_field = ns.primary_key_field
         query = (
             PgSelectQuerySet(cls, alias=alias) \
             .use_cte(
                 turn_cte,
                 name="committed_turns",
                 alias="ct",
-            ).distinct_on("artifact_id")
-            .order_by("-artifact_id", "-version")
+            )
         )
+        # the versions visible from the branch, resolved from its nearest checkpoint
         where_keys = cls._get_context_fields()
+        where_keys.pop("branch_id", None)
+        where_keys.pop("turn_id", None)
+        branch_id = int(Turn._resolve_branch_id())
+        latest = cls._state_sql("NULL::INTEGER", branch_sql=str(branch_id), table_sql=f"'{ns.name}'")
+        query.where(RawValue(
+            f'("{query.table}"."{pk_field.name}", "{query.table}".version) IN '
+            f"({latest} SELECT l.pk::{pk_field.sql_type}, l.version FROM latest l)"
+        ))
         if where_keys:
             query.where(**where_keys)
         return query
+    
+    @classmethod
+    def _state_sql(cls, bound_sql: str, branch_sql: str = "$1", table_sql: str = "$3") -> str:
+        """
+        CTEs resolving the latest visible version of every artifact up to
+        the index given by `bound_sql`. Reads the nearest usable checkpoint and
+        only the artifact rows of the turns committed after it.
+        Params by default: $1 branch id, $2 turn index (or NULL), $3 artifact table.
+        """
+        from promptview.model3.versioning.backends.postgres import branch_hierarchy_cte
+        ns = cls.get_namespace()
+        pk = ns.primary_key
+        return f"""
+            WITH RECURSIVE {branch_hierarchy_cte("branch_hierarchy", branch_sql)},
+            bound AS (
+                SELECT {bound_sql} AS turn_index
+            ),
+            visible AS (
+                SELECT bh.id AS branch_id, LEAST(bh.start_turn_index, bound.turn_index) AS max_index
+                FROM branch_hierarchy bh, bound
+            ),
+            checkpoint AS (
+                SELECT c.turn_index, c.versions FROM artifact_checkpoints c
+                JOIN visible v ON c.branch_id = v.branch_id
+                WHERE c.artifact_table = {table_sql} AND c.turn_index <= v.max_index
+                ORDER BY c.turn_index DESC
+                LIMIT 1
+            ),
+            candidates AS (
+                SELECT e.key AS pk, e.value::INTEGER AS version
+                FROM checkpoint, jsonb_each_text(checkpoint.versions) e
+                UNION ALL
+                SELECT a."{pk}"::TEXT AS pk, a.version FROM "{ns.name}" a
+                JOIN turns t ON a.turn_id = t.id
+                JOIN visible v ON t.branch_id = v.branch_id
+                WHERE t.index <= v.max_index
+                  AND t.status = 'committed'
+                  AND t.index > COALESCE((SELECT turn_index FROM checkpoint), -1)
+            ),
+            latest AS (
+                SELECT DISTINCT ON (pk) pk, version FROM candidates
+                ORDER BY pk, version DESC
+            )"""
+    
+    @classmethod
+    async def state(cls, branch: Branch | int | None = None, at_index: int | None = None) -> List[Self]:
+        """
+        Latest committed version of every artifact visible from a branch,
+        as of turn index `at_index` (the head of the branch by default).
+        """
+        ns = cls.get_namespace()
+        pk_field = ns.primary_key_field
+        branch_id = branch.id if isinstance(branch, Branch) else branch
+        if branch_id is None:
+            branch_id = Turn._resolve_branch_id()
+        sql = f"""
+            {cls._state_sql("$2::INTEGER")}
+            SELECT a.* FROM "{ns.name}" a
+            JOIN latest l ON a."{pk_field.name}" = l.pk::{pk_field.sql_type} AND a.version = l.version
+            ORDER BY a."{pk_field.name}";
+        """
+        rows = await PGConnectionManager.fetch(sql, branch_id, at_index, ns.name)
+        return [cls(**ns.deserialize(dict(row))) for row in rows]
+    
+    @classmethod
+    async def build_checkpoint(cls, branch: Branch | int | None = None, at_index: int | None = None) -> "ArtifactCheckpoint | None":
+        """
+        Materialize the artifact state of a branch at `at_index` (the latest
+        committed turn by default). The checkpoint never reaches past a staged
+        turn, so turns committed later can not make it stale.
+        """
+        ns = cls.get_namespace()
+        branch_id = branch.id if isinstance(branch, Branch) else branch
+        if branch_id is None:
+            branch_id = Turn._resolve_branch_id()
+        bound_sql = """LEAST(
+                    $2::INTEGER,
+                    (
+                        SELECT MIN(t.index) - 1 FROM turns t
+                        JOIN branch_hierarchy bh ON t.branch_id = bh.id
+                        WHERE t.index <= bh.start_turn_index AND t.status = 'staged'
+                    ),
+                    (
+                        SELECT MAX(t.index) FROM turns t
+                        JOIN branch_hierarchy bh ON t.branch_id = bh.id
+                        WHERE t.index <= bh.start_turn_index AND t.status = 'committed'
+                    )
+                )"""
+        sql = f"""
+            {cls._state_sql(bound_sql)}
+            INSERT INTO artifact_checkpoints (branch_id, turn_index, artifact_table, versions, created_at)
+            SELECT $1, bound.turn_index, $3, COALESCE((SELECT jsonb_object_agg(pk, version) FROM latest), '{{}}'::JSONB), NOW()
+            FROM bound
+            WHERE bound.turn_index IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM checkpoint WHERE checkpoint.turn_index = bound.turn_index)
+            RETURNING *;
+        """
+        row = await PGConnectionManager.fetch_one(sql, branch_id, at_index, ns.name)
+        if row is None:
+            return None
+        cp_ns = ArtifactCheckpoint.get_namespace()
+        return ArtifactCheckpoint(**cp_ns.deserialize(dict(row)))
+    
+    @classmethod
+    def _checkpointed_models(cls) -> List[Type["ArtifactModel"]]:
+        models = []
+        stack = list(cls.__subclasses__())
+        while stack:
+            model_cls = stack.pop()
+            stack.extend(model_cls.__subclasses__())
+            if model_cls.checkpoint_interval:
+                models.append(model_cls)
+        return models
+    
+    @classmethod
+    def schedule_checkpoints(cls, turn: Turn):
+        """Build due checkpoints in the background after a turn is committed."""
+        for model_cls in cls._checkpointed_models():
+            if (turn.index + 1) % model_cls.checkpoint_interval != 0:
+                continue
+            task = asyncio.create_task(model_cls.build_checkpoint(turn.branch_id, turn.index))
+            cls._checkpoint_tasks.add(task)
+            task.add_done_callback(cls._checkpoint_tasks.discard)
+    
+    @classmethod
+    async def wait_for_checkpoints(cls):
+        """Wait until all checkpoints scheduled in the background are built."""
+        if cls._checkpoint_tasks:
+            await asyncio.gather(*cls._checkpoint_tasks, return_exceptions=True)
+
+
+class ArtifactCheckpoint(Model):
+    """
+    Materialized artifact state of a branch at a turn index.
+    `versions` maps the primary key of every visible artifact to its latest version.
+    """
+    id: int = KeyField(primary_key=True)
+    created_at: dt.datetime = ModelField(default_factory=dt.datetime.now)
+    branch_id: int = ModelField(foreign_key=True, foreign_cls=Branch)
+    turn_index: int = ModelField()
+    artifact_table: str = ModelField()
+    versions: dict = ModelField(default_factory=dict)
+    
+    @classmethod
+    async def invalidate(cls, branch_id: int, from_index: int):
+        """Drop checkpoints of a branch and its forks that cover `from_index` or later."""
+        sql = """
+            WITH RECURSIVE descendants AS (
+                SELECT id FROM branches WHERE id = $1
+                UNION ALL
+                SELECT b.id FROM branches b
+                JOIN descendants d ON b.forked_from_branch_id = d.id
+            )
+            DELETE FROM artifact_checkpoints
+            WHERE branch_id IN (SELECT id FROM descendants) AND turn_index >= $2;
+        """
+        await PGConnectionManager.execute(sql, branch_id, from_index)
 
 
 
@@ -566,6 +899,17 @@ class ExecutionSpan(VersionedModel):
     #     turn_id = super()._resolve_turn_id(turn)
     #     return turn_id or 1
     
+    async def persist(self):
+        """
+        Insert a span that was kept in memory with a client side id.
+        """
+        if not self._should_save_to_db():
+            return self
+        result = await self.get_namespace().insert(self.model_dump())
+        for key, value in result.items():
+            setattr(self, key, value)
+        return self
+    
     async def add_block_event(self, block: "Block", index: int):
         from promptview.model3.block_models.block_log import insert_block
         from promptview.model3.namespace_manager2 import NamespaceManager
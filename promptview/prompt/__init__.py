@@ -3,8 +3,9 @@ from .agent import Agent, agent
 # from ..block.renderer import ContentRenderer, ItemsRenderer
 # from .output_format import OutputModel
 from .depends import Depends
-from .flow_components import StreamController, PipeController
+from .flow_components import StreamController, PipeController, Parallel, parallel, Buffer, Coalescer
 from .decorators import stream, component
+from .tracing import TracePolicy, TraceLevel
 
 
 
@@ -19,6 +20,12 @@ __all__ = [
     "Depends",
     "StreamController",
     "PipeController",
+    "Parallel",
+    "parallel",
+    "Buffer",
+    "Coalescer",
     "stream",
     "component",
+    "TracePolicy",
+    "TraceLevel",
 ]
\ No newline at end of file
@@ -1,20 +1,27 @@
 import asyncio
+from collections import deque
 import copy
+from dataclasses import dataclass, replace
 from enum import Enum
 from functools import wraps
 import json
 from queue import SimpleQueue
 import datetime as dt
+import time
+from uuid import uuid4
 
 from typing import Any, AsyncGenerator, Callable, Iterable, Literal, ParamSpec, Protocol, Self, TypeVar, TYPE_CHECKING, runtime_checkable
 import xml
-from promptview.block import BlockChunk, BlockSchema
+from pydantic import BaseModel, ValidationError
+from promptview.block import BlockChunk, BlockSchema, ToolCall
 from promptview.block.block9.block_schema import BlockBuilderContext, BlockBuilderError
 from promptview.prompt.injector import resolve_dependencies, resolve_dependencies_kwargs
 from promptview.prompt.parser import BlockBuffer, SaxStreamParser
 from promptview.prompt.events import StreamEvent
+from promptview.prompt.recording import StreamRecorder, StreamReplay
+from promptview.prompt.tag_tokenizer import TagEvent, TagTokenizer
+from promptview.prompt.tracing import TraceDecision, TracePolicy
 from promptview.utils.function_utils import call_function
-from lxml import etree
 
 from promptview.block import BlockSchema, Block
 if TYPE_CHECKING:
@@ -41,6 +48,9 @@ class BaseFbpComponent:
         self._did_error = False
         self._last_value = None
         self._span = None
+        self._span_recorded = False
+        self._trace: TraceDecision | None = None
+        self.parent: "BaseFbpComponent | None" = None
         
         
     @property
@@ -61,16 +71,76 @@ class BaseFbpComponent:
     def get_response(self):
         return self._last_value
     
-    async def on_start_event(self, payload: Any = None, attrs: dict[str, Any] | None = None):
+    @property
+    def trace(self) -> TraceDecision:
+        if self._trace is None:
+            if self.parent is not None:
+                self._trace = self.parent.trace
+            else:
+                self._trace = TracePolicy.current().decide()
+        return self._trace
+    
+    def should_record_span(self) -> bool:
+        return self.trace.records_span(is_root=self.parent is None)
+    
+    def should_record_error(self) -> bool:
+        return self._span_recorded or self.trace.persist_errors
+    
+    async def _record_span(self, span: "ExecutionSpan") -> "ExecutionSpan":
+        """
+        Save the span if the trace policy records it, otherwise keep it in memory
+        with a client side id so events can still reference it.
+        """
+        if self.should_record_span():
+            span = await span.save()
+            self._span_recorded = True
+        else:
+            ns = span.get_namespace()
+            ns.set_primary_key(span, ns.generate_fake_key())
+        return span
+    
+    async def _persist_span(self):
+        """
+        Write an in-memory span and its unrecorded ancestors, used to keep the
+        failing path of an unsampled run.
+        """
+        if self._span_recorded or self._span is None:
+            return
+        if self.parent is not None:
+            await self.parent._persist_span()
+        self._span = await self._span.persist()
+        self._span_recorded = True
+        
+    async def _end_span(self, status: str, metadata: dict | None = None):
+        if self._span is None:
+            return
+        self._span.end_time = dt.datetime.now()
+        self._span.status = status
+        if metadata is not None:
+            self._span.metadata = metadata
+        if self._span_recorded:
+            self._span = await self._span.save()
+    
+    async def _record_error_log(self, error: Exception) -> "Log | None":
+        from promptview.model3.versioning.models import Log
+        if not self.should_record_error():
+            return None
+        await self._persist_span()
+        return await Log(
+            message=str(error),
+            level="error"
+        ).save()
+    
+    def on_start_event(self, payload: Any = None, attrs: dict[str, Any] | None = None):
         raise NotImplementedError(f"Flow generator ({self.__class__.__name__}) does not implement on_start_event")
     
-    async def on_value_event(self, payload: Any = None):
+    def on_value_event(self, payload: Any = None):
         raise NotImplementedError(f"Flow generator ({self.__class__.__name__}) does not implement on_value_event")
     
-    async def on_stop_event(self, payload: Any = None):
+    def on_stop_event(self, payload: Any = None):
         raise NotImplementedError(f"Flow generator ({self.__class__.__name__}) does not implement on_stop_event")
     
-    async def on_error_event(self, error: Exception):
+    def on_error_event(self, error: Exception):
         raise NotImplementedError(f"Flow generator ({self.__class__.__name__}) does not implement on_error_event")
     
     async def on_start(self, value: Any = None):
@@ -165,27 +235,51 @@ class Stream(BaseFbpComponent):
     def __init__(self, gen: AsyncGenerator, name: str = "stream"):
         super().__init__(gen)
         self._name = name
-        self._save_stream_dir: str | None = None
+        self._recorder: StreamRecorder | None = None
     
 
     def __aiter__(self):
         return self
     
-    def save_stream(self, filepath: str):
-        self._save_stream_dir = filepath        
+    def save_stream(self, filepath: str, flush_size: int = 256, flush_interval: float = 1.0, record_times: bool = False):
+        """Record the stream to a .jsonl (or .jsonl.gz) file, see StreamRecorder."""
+        self._recorder = StreamRecorder(filepath, flush_size=flush_size, flush_interval=flush_interval, record_times=record_times)
     
     
     async def pre_next(self):
         self._index += 1
         
     async def post_next(self, value: Any = None):
-        if self._save_stream_dir:
-            with open(self._save_stream_dir, "a") as f:
-                f.write(json.dumps(value.model_dump()) + "\n")
+        if self._recorder is not None:
+            self._recorder.write(value)
         return value
         
     async def on_stop(self):
         self._index -= 1
+        if self._recorder is not None:
+            await self._recorder.close()
+            
+    async def on_error(self, error: Exception):
+        if self._recorder is not None:
+            await self._recorder.close()
+            
+    async def aclose(self):
+        try:
+            await super().aclose()
+        finally:
+            if self._recorder is not None:
+                await self._recorder.close()
+            
+    async def asend(self, value: Any = None):
+        # controllers pull the stream with asend, it has to end the recording too
+        try:
+            return await super().asend(value)
+        except StopAsyncIteration:
+            await self.on_stop()
+            raise
+        except Exception as e:
+            await self.on_error(e)
+            raise e
         
     # async def __anext__(self):
     #     try:
@@ -199,23 +293,68 @@ class Stream(BaseFbpComponent):
             
     
 
+StopCondition = Callable[[Block], bool] | str | list[str]
+
+
 class Parser(BaseFbpComponent):
+    """
+    Builds the response block of `response_schema` from a stream of chunks.
+    Tags are found by a TagTokenizer, so the output does not need to be well
+    formed XML: tags that are not in the schema are text and tags that are
+    not closed are closed at the end of the stream. Chunks are never split,
+    a chunk with (part of) a start tag is content of the new view and a
+    chunk with (part of) an end tag is its postfix.
+
+    With `stop_when` the parser stops reading and closes the upstream (the
+    LLM request) as soon as the response is complete: when the view of a
+    tag, or of every tag of a list, is closed, or when a callable returns
+    True for the response block, it is called whenever a view is closed.
+    The views that are still open are closed then, like at the end of the
+    stream.
+
+    With `tools` every `tool_tag` view is turned into a ToolCall as soon as
+    it is closed, a `tool_call` event is emitted and `on_tool_call` is
+    called with it, so the tool can run while the rest of the response is
+    streamed. The body of the view is the JSON of the tool arguments, or the
+    tag attributes other than `name` when the body is empty. Calls of
+    unknown tools, with invalid arguments, or with a tag that was never
+    closed are dropped.
+    """
       
-    def __init__(self, response_schema: "Block", gen=None) -> None:
+    def __init__(
+        self, 
+        response_schema: "Block", 
+        gen=None, 
+        stop_when: "StopCondition | None" = None,
+        tools: list[type[BaseModel]] | None = None,
+        tool_tag: str = "tool",
+        on_tool_call: Callable[[ToolCall], Any] | None = None,
+    ) -> None:
         super().__init__(gen)
         self.start_tag = "tag_start"
         self.end_tag = "tag_end"
         self.text_tag = "chunk"                
-        self._safety_tag = "stream_start"        
-        self.res_ctx = BlockBuilderContext(response_schema.copy())
-        self.parser = etree.XMLPullParser(events=("start", "end"))
+        self.res_ctx = BlockBuilderContext(response_schema.copy(), delta_events=True)
+        self.tokenizer = TagTokenizer(tags=[
+            tag 
+            for schema in self.res_ctx.schema.traverse() if isinstance(schema, BlockSchema) 
+            for tag in schema.tags
+        ])
         self.block_buffer = []
-        self._stream_started = False
-        self._detected_tag = False
         self._total_chunks = 0
         self._chunks_from_last_tag = 0
         self._tag_stack = []
-        self._full_content = ""
+        self._stream_ended = False
+        self.stop_when = stop_when
+        self.stopped_early = False
+        self._closed_tags: set[str] = set()
+        self.tools = {tool.__name__: tool for tool in tools} if tools is not None else None
+        self.tool_tag = tool_tag.lower()
+        self.on_tool_call = on_tool_call
+        self.tool_calls: list[ToolCall] = []
+        # text and attributes of the tool tag that is open
+        self._tool_text: list[str] | None = None
+        self._tool_attrs: dict[str, str] = {}
         
         
 
@@ -245,16 +384,14 @@ class Parser(BaseFbpComponent):
     
     
     
-    def _read_buffer(self, start_from: str | None = None, flush=True):
-        buffer = []
-        start_appending = start_from is None
-        for block in self.block_buffer:
-            if start_from and start_from in block.content:
-                start_appending = True
-            if start_appending:
-                buffer.append(block)
-        if flush:
-            self.block_buffer = []
+    def _read_buffer(self, until: int | None = None):
+        """Take the buffered chunks up to chunk number `until`, all of them by default."""
+        if until is None:
+            count = len(self.block_buffer)
+        else:
+            count = max(0, until - (self._total_chunks - len(self.block_buffer)) + 1)
+        buffer = self.block_buffer[:count]
+        self.block_buffer = self.block_buffer[count:]
         return buffer
     
     def _write_to_buffer(self, value: Any):
@@ -266,116 +403,126 @@ class Parser(BaseFbpComponent):
     def _buffer_size(self):
         return len(self.block_buffer)
     
-
-        
-    def _try_set_tag_lock(self, value: Any):
-        if "<" in value.content:
-            self._detected_tag = True
-            
     def _release_tag_lock(self):
         self._chunks_from_last_tag = 0
-        self._detected_tag = False
         
     def _should_output_chunk(self):
-        if self.current_tag and not self._detected_tag:
+        if self.current_tag and not self.tokenizer.pending:
             if self._chunks_from_last_tag < 2:
                 return False
             return True
         return False
     
-    
-    def _feed_parser(self, content: str):
-        # try:
-        self._full_content += content
-        self.parser.feed(content)
-        # except Exception as e:
-        #     print(self._full_content)
-        #     print(f"Error happened on content: {content}")
-        #     raise e
+    def _output_chunks(self, chunks: list[BlockChunk]):
+        for c in chunks:
+            self.res_ctx.append(self.current_tag, c)
+    
+    def _on_tag(self, event: TagEvent):
+        if event.type == "start":
+            # start of a field
+            if self.current_tag_is_list:
+                view, schema = self.res_ctx.instantiate_list_item(
+                    self.current_tag,
+                    event.tag,
+                    self._read_buffer(event.end[0]),
+                    attrs=event.attrs,
+                )
+            else:
+                view, schema = self.res_ctx.instantiate(
+                    event.tag,
+                    self._read_buffer(event.end[0]),
+                    attrs=event.attrs,
+                )
+            self._push_tag(event.tag, schema.is_list)
+            self._release_tag_lock()
+            if self.tools is not None and event.tag.lower() == self.tool_tag:
+                self._tool_text = []
+                self._tool_attrs = event.attrs
+        elif event.type == "end":
+            # end of a field, the chunks before the end tag are the rest of its content
+            self._output_chunks(self._read_buffer(event.start[0] - 1))
+            view = self.res_ctx.set_view_attr(
+                event.tag,
+                postfix=self._read_buffer(event.end[0]) if event.start != event.end else [],
+            )
+            self._pop_tag()
+            self._release_tag_lock()
+            self._closed_tags.add(event.tag.lower())
+            if self._tool_text is not None and event.tag.lower() == self.tool_tag:
+                # a tool tag closed by another tag or by the end of the stream is cut off
+                tool_call = self._build_tool_call() if event.start != event.end else None
+                self._tool_text = None
+                if tool_call is not None:
+                    self.tool_calls.append(tool_call)
+                    self.res_ctx.push_tool_call(view, tool_call)
+                    if self.on_tool_call is not None:
+                        self.on_tool_call(tool_call)
+                        
+    def _on_text(self, event: TagEvent):
+        if self._tool_text is not None:
+            self._tool_text.append(event.text)
+            
+    def _build_tool_call(self) -> ToolCall | None:
+        attrs = dict(self._tool_attrs)
+        name = attrs.pop("name", None)
+        tool_cls = self.tools.get(name) if name is not None else None
+        if tool_cls is None:
+            return None
+        body = "".join(self._tool_text).strip()
+        try:
+            tool = tool_cls.model_validate_json(body) if body else tool_cls.model_validate(attrs)
+        except ValidationError:
+            return None
+        return ToolCall(id=f"tool_call_{uuid4()}"[:40], name=name, tool=tool)
+            
+    def _should_stop(self) -> bool:
+        stop_when = self.stop_when
+        if stop_when is None:
+            return False
+        if isinstance(stop_when, str):
+            return stop_when.lower() in self._closed_tags
+        if isinstance(stop_when, (list, tuple, set)):
+            return all(tag.lower() in self._closed_tags for tag in stop_when)
+        return bool(stop_when(self.res_ctx.instance))
+    
+    def _end_stream(self):
+        # tags that are still open are closed with the stream
+        self._stream_ended = True
+        for event in self.tokenizer.close():
+            if event.type != "text":
+                self._on_tag(event)
+            else:
+                self._on_text(event)
 
         
     async def asend(self, value: Any = None):
-        for i in range(20):            
+        while True:
+            if self.res_ctx.has_events():
+                return self.res_ctx.get_event()
+            if self._stream_ended:
+                raise StopAsyncIteration
             try:
-                if not self._stream_started:
-                    self._feed_parser(f'<{self._safety_tag}>')
-                    self._stream_started = True                
-                if self.res_ctx.has_events():
-                    v = self.res_ctx.get_event()
-                    # print("1", type(v), v)
-                    return v
-                value = await self.gen.asend(value) 
-                # print(value.content)
-                self._write_to_buffer(value)
-                try:
-                    self._feed_parser(value.content)
-                except Exception as e:
-                    raise e
-                
-                self._try_set_tag_lock(value)
-                
-                # in the middle of the stream, adding chunks to the current field
-                if self._should_output_chunk():               
-                    for c in self._read_buffer(flush=True):
-                        chunk = self.res_ctx.append(
-                            self.current_tag,
-                            c,
-                        )
-                
-                # start or end of a field, adding the whole field to the queue
-                for event, element in self.parser.read_events():
-                    if element.tag == self._safety_tag:
-                        continue                
-                    if event == 'start':
-                        # start of a field
-                        if self.current_tag_is_list:
-                            view, schema = self.res_ctx.instantiate_list_item(
-                                self.current_tag,
-                                element.tag,
-                                self._read_buffer(),
-                                attrs=dict(element.attrib),
-                            )
-                        else:
-                            view, schema = self.res_ctx.instantiate(
-                                element.tag,
-                                self._read_buffer(),
-                                attrs=dict(element.attrib),
-                            )                    
-                        
-                        self._push_tag(element.tag, schema.is_list)
-                        self._release_tag_lock()
-                    elif event == 'end':
-                        # end of a field
-                        self.res_ctx.set_view_attr(
-                            element.tag,
-                            postfix=self._read_buffer(start_from="</"), 
-                        )
-                        # self.res_ctx.commit_view(
-                        #     element.tag,
-                        # )
-                        self._pop_tag()
-                        # field = self.response_schema.commit_field(
-                        #     element.tag, 
-                        #     postfix=self._read_buffer(start_from="</"), 
-                        #     tags=[self.end_tag]
-                        # )
-                        # if field.postfix is not None:
-                            # self._push_to_output(field.postfix)
-                        
-                        self._release_tag_lock()
-                    
-                        
-                if self.res_ctx.has_events():
-                    v = self.res_ctx.get_event()
-                    return v
+                value = await self.gen.asend(value)
             except StopAsyncIteration:
-                raise 
-            except Exception as e:
-                print(self._full_content)
-                print(f"Parser Error happened on content: {value.content}")
-                raise e
-        else:
-            raise StopAsyncIteration
+                self._end_stream()
+                continue
+            self._write_to_buffer(value)
+            closed = False
+            for event in self.tokenizer.feed(value.content):
+                if event.type != "text":
+                    self._on_tag(event)
+                    closed = closed or event.type == "end"
+                else:
+                    self._on_text(event)
+            if closed and self._should_stop():
+                # the response is complete, the rest of the LLM stream is not read
+                self.stopped_early = True
+                await self.gen.aclose()
+                self._end_stream()
+                continue
+            # in the middle of the stream, adding chunks to the current field
+            if self._should_output_chunk():
+                self._output_chunks(self._read_buffer())
         
 
     
@@ -405,6 +552,330 @@ class Accumulator(BaseFbpComponent):
     #     except StopAsyncIteration:
     #         raise StopAsyncIteration
   
+@dataclass
+class BufferStats:
+    """Queue depth and stall times of a Buffer stage."""
+    capacity: int
+    depth: int = 0
+    max_depth: int = 0
+    received: int = 0
+    sent: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    # seconds the upstream stage waited for room in the queue
+    producer_stall: float = 0.0
+    # seconds the downstream stage waited for a value
+    consumer_stall: float = 0.0
+
+
+def _merge_chunks(a: BlockChunk, b: BlockChunk) -> BlockChunk | None:
+    if a.prefix or a.postfix or b.prefix or b.postfix or not isinstance(a.content, str) or not isinstance(b.content, str):
+        return None
+    logprob = a.logprob + b.logprob if a.logprob is not None and b.logprob is not None else None
+    return BlockChunk(a.content + b.content, logprob=logprob)
+
+
+def coalesce_deltas(a: Any, b: Any) -> Any | None:
+    """
+    Merge two consecutive deltas into one, or return None if they can not be
+    merged: chunks, block_append events of the same block and stream_delta
+    events of the same span with deltas that can be merged. The text is kept, the logprobs are added.
+    """
+    if isinstance(a, BlockChunk) and isinstance(b, BlockChunk):
+        return _merge_chunks(a, b)
+    if isinstance(a, dict) and isinstance(b, dict):
+        if a.get("type") == b.get("type") == "block_append" and a.get("id") == b.get("id"):
+            chunk = _merge_chunks(BlockChunk(**a["chunk"]), BlockChunk(**b["chunk"]))
+            if chunk is None:
+                return None
+            merged = {**a, "chunk": {**a["chunk"], "content": chunk.content, "logprob": chunk.logprob}}
+            if "text" in a:
+                # the rendering of b starts inside the text of a
+                start = b["offset"] - a["offset"]
+                if not 0 <= start <= len(a["text"]):
+                    return None
+                merged["text"] = a["text"][:start] + b["text"]
+            return merged
+        return None
+    if isinstance(a, StreamEvent) and isinstance(b, StreamEvent):
+        if a.type == b.type == "stream_delta" and a.span_id == b.span_id:
+            payload = coalesce_deltas(a.payload, b.payload)
+            if payload is not None:
+                return replace(a, payload=payload)
+    return None
+
+
+def delta_size(value: Any) -> int:
+    """Characters of text in a delta."""
+    if isinstance(value, BlockChunk):
+        return len(value.content) if isinstance(value.content, str) else 0
+    if isinstance(value, dict):
+        content = value.get("chunk", {}).get("content")
+        return len(content) if isinstance(content, str) else 0
+    if isinstance(value, StreamEvent):
+        return delta_size(value.payload)
+    return 0
+
+
+def is_delta(value: Any) -> bool:
+    if isinstance(value, BlockChunk):
+        return True
+    if isinstance(value, dict):
+        return value.get("type") == "block_append"
+    return isinstance(value, StreamEvent) and value.type == "stream_delta"
+
+
+class Buffer(BaseFbpComponent):
+    """
+    Bounded queue between two stages. The upstream stage runs in its own
+    task and fills the queue while the downstream stage consumes it, so a
+    slow consumer does not stall the LLM read loop and a fast one finds
+    values prefetched. When the queue is full:
+    - "block" waits for room, the upstream is slowed down to the consumer.
+    - "drop" drops the oldest delta in the queue.
+    - "coalesce" merges the value into the last one with `coalesce`
+      (coalesce_deltas by default).
+    Values that are not deltas are never dropped or merged, they wait for
+    room. Depth and stall times are kept in `stats`.
+
+    Example:
+        stream = Stream(llm_stream()) | Buffer(256) | Parser(schema) | Buffer(64, policy="coalesce")
+        async for event in Buffer(256, policy="coalesce", gen=agent.stream_events()):
+            await websocket.send_json(event.to_dict())
+    """
+    
+    def __init__(
+        self, 
+        capacity: int = 64, 
+        policy: Literal["block", "drop", "coalesce"] = "block", 
+        coalesce: Callable[[Any, Any], Any | None] | None = None,
+        gen=None,
+    ):
+        super().__init__(gen)
+        if capacity < 1:
+            raise ValueError("Buffer capacity must be at least 1")
+        if policy not in ("block", "drop", "coalesce"):
+            raise ValueError(f"Invalid buffer policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.coalesce = coalesce or coalesce_deltas
+        self.stats = BufferStats(capacity=capacity)
+        self._items: deque = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._ended = False
+        self._error: Exception | None = None
+        
+    @property
+    def name(self):
+        return "buffer"
+        
+    async def on_start(self, value: Any = None):
+        self._task = asyncio.create_task(self._produce())
+        
+    async def _produce(self):
+        gen = self.gen
+        try:
+            while True:
+                if hasattr(gen, "asend"):
+                    value = await gen.asend(None)
+                else:
+                    value = await gen.__anext__()
+                await self._put(value)
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            self._error = e
+        finally:
+            self._ended = True
+            self._readable.set()
+            
+    async def _put(self, value: Any):
+        items = self._items
+        stats = self.stats
+        stats.received += 1
+        if len(items) >= self.capacity:
+            if self.policy == "coalesce":
+                merged = self.coalesce(items[-1], value)
+                if merged is not None:
+                    items[-1] = merged
+                    stats.coalesced += 1
+                    return
+            elif self.policy == "drop":
+                for i, item in enumerate(items):
+                    if is_delta(item):
+                        del items[i]
+                        stats.dropped += 1
+                        break
+            if len(items) >= self.capacity:
+                start = time.perf_counter()
+                while len(items) >= self.capacity:
+                    self._writable.clear()
+                    await self._writable.wait()
+                stats.producer_stall += time.perf_counter() - start
+        items.append(value)
+        stats.depth = len(items)
+        if stats.depth > stats.max_depth:
+            stats.max_depth = stats.depth
+        self._readable.set()
+    
+    async def asend(self, value: Any = None):
+        if not self._did_start:
+            await self.on_start(value)
+            self._did_start = True
+        items = self._items
+        if not items and not self._ended:
+            start = time.perf_counter()
+            while not items and not self._ended:
+                self._readable.clear()
+                await self._readable.wait()
+            self.stats.consumer_stall += time.perf_counter() - start
+        if not items:
+            # the values are delivered before the error of the upstream
+            if self._error is not None:
+                raise self._error
+            raise StopAsyncIteration
+        value = items.popleft()
+        self.stats.sent += 1
+        self.stats.depth = len(items)
+        self._writable.set()
+        self._last_value = value
+        return value
+    
+    async def __anext__(self):
+        return await self.asend(None)
+    
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if hasattr(self.gen, "aclose"):
+            await self.gen.aclose()
+
+
+
+class Coalescer(BaseFbpComponent):
+    """
+    Merges consecutive deltas into one value for consumers that pay per
+    value, like a websocket or an SSE response where every event is
+    serialized and sent as a frame of its own. The first delta is held for
+    up to `window` seconds and the deltas that arrive meanwhile are merged
+    into it with `coalesce` (coalesce_deltas by default). It is sent when
+    the window is over, when it holds `max_chars` characters or when a value
+    that can not be merged arrives, that value is sent right after it. Other
+    values are not held. `received` and `sent` count the values.
+
+    Example:
+        async for event in Coalescer(0.03, gen=agent.stream_events()):
+            await websocket.send_text(event.to_json())
+    """
+    
+    def __init__(
+        self, 
+        window: float = 0.03, 
+        max_chars: int | None = None, 
+        coalesce: Callable[[Any, Any], Any | None] | None = None,
+        gen=None,
+    ):
+        super().__init__(gen)
+        self.window = window
+        self.max_chars = max_chars
+        self.coalesce = coalesce or coalesce_deltas
+        self.received = 0
+        self.sent = 0
+        self._held: Any = None
+        self._deadline = 0.0
+        self._ready: deque = deque()
+        self._next: asyncio.Future | None = None
+        self._ended = False
+        self._error: Exception | None = None
+        
+    @property
+    def name(self):
+        return "coalescer"
+        
+    async def _read(self):
+        if hasattr(self.gen, "asend"):
+            return await self.gen.asend(None)
+        return await self.gen.__anext__()
+    
+    def _release(self):
+        held, self._held = self._held, None
+        self._ready.append(held)
+        
+    def _add(self, value: Any):
+        self.received += 1
+        if self._held is not None:
+            merged = self.coalesce(self._held, value)
+            if merged is not None:
+                self._held = merged
+                if self.max_chars is not None and delta_size(merged) >= self.max_chars:
+                    self._release()
+                return
+            self._release()
+        if self.window > 0 and is_delta(value):
+            self._held = value
+            self._deadline = asyncio.get_running_loop().time() + self.window
+        else:
+            self._ready.append(value)
+    
+    async def asend(self, value: Any = None):
+        self._did_start = True
+        while not self._ready:
+            if self._ended:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                raise StopAsyncIteration
+            try:
+                if self._held is None and self._next is None:
+                    value = await self._read()
+                else:
+                    # the upstream read outlives a window that ends before it
+                    if self._next is None:
+                        self._next = asyncio.ensure_future(self._read())
+                    if self._held is not None:
+                        timeout = self._deadline - asyncio.get_running_loop().time()
+                        done, _ = await asyncio.wait((self._next,), timeout=max(timeout, 0))
+                        if not done:
+                            self._release()
+                            break
+                    pending, self._next = self._next, None
+                    value = await pending
+            except StopAsyncIteration:
+                self._ended = True
+            except Exception as e:
+                self._ended = True
+                self._error = e
+            else:
+                self._add(value)
+                continue
+            if self._held is not None:
+                self._release()
+        self.sent += 1
+        self._last_value = self._ready.popleft()
+        return self._last_value
+    
+    async def __anext__(self):
+        return await self.asend(None)
+    
+    async def aclose(self):
+        if self._next is not None:
+            self._next.cancel()
+            try:
+                await self._next
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._next = None
+        if hasattr(self.gen, "aclose"):
+            await self.gen.aclose()
+
+
+
 @runtime_checkable
 class Spanable(Protocol):
     index: int
@@ -457,18 +928,29 @@ class StreamController(BaseFbpComponent):
         self.parent: "PipeController | None" = None
         self._span: "ExecutionSpan | None" = None
         self.event: "SpanEvent | None" = None
+        self.stream_event: "SpanEvent | None" = None
+        self.error_event: "SpanEvent | None" = None
+        self._execution_path: list[int] | None = None
+        # position in a Parallel group, a level of the execution path
+        self.branch: int | None = None
+        self.buffers: list[Buffer] = []
+        self._run_tool: Callable[[ToolCall], Any] | None = None
+        self._keep_tool: Callable[[Block | None, ToolCall], bool] | None = None
+        self._tool_tasks: dict[str, tuple[ToolCall, asyncio.Task]] = {}
+        self.tool_results: dict[str, Any] = {}
+        self.replay: StreamReplay | None = None
         
         
     async def build_span(self, parent_span_id: str | None = None):
         from promptview.model3.versioning.models import ExecutionSpan
-        self._span = await ExecutionSpan(
+        self._span = await self._record_span(ExecutionSpan(
             span_type=self._span_type,
             name=self._name,
             index=self.index,
             tags=self._tags,
             start_time=dt.datetime.now(),
             parent_span_id=parent_span_id,
-        ).save()
+        ))
         return self._span
     
     @property
@@ -489,52 +971,138 @@ class StreamController(BaseFbpComponent):
 
     def get_execution_path(self) -> list[int]:
         """Build execution path using existing index tracking"""
-        path = []
-        current = self
-        while current:
-            path.insert(0, current.index)  # Prepend to build path from root
-            current = current.parent
-        return path
+        # the parents do not move while the stream runs, the path is built once per run
+        if self._execution_path is None:
+            path = []
+            current = self
+            while current:
+                path.insert(0, current.index)  # Prepend to build path from root
+                if current.branch is not None:
+                    path.insert(0, current.branch)
+                current = current.parent
+            self._execution_path = path
+        return list(self._execution_path)
     
     def get_response(self):
         if self._parser:
             return self._parser.res_ctx.instance
         # return self.acc
         
-    def parse(self, block_schema: Block) -> Self:
+    def parse(
+        self, 
+        block_schema: Block, 
+        stop_when: StopCondition | None = None,
+        tools: list[type[BaseModel]] | None = None,
+        run_tool: Callable[[ToolCall], Any] | None = None,
+        keep_tool: Callable[[Block | None, ToolCall], bool] | None = None,
+    ) -> Self:
+        """
+        Parse the stream into a response of `block_schema`. With `stop_when`
+        (a tag, a list of tags or a callable on the response) the LLM
+        request is closed as soon as the response is complete, see Parser.
+        
+        With `tools` and `run_tool` (an async function of a ToolCall) every
+        tool call is started as soon as its tag is closed, while the LLM is
+        still streaming. The calls are joined when the stream ends, their
+        results (or exceptions) are in `tool_results` by call id. A call for
+        which `keep_tool(response, call)` returns False is cancelled then,
+        all calls are cancelled when the stream fails.
+        """
         if self._parser is not None:
             raise ValueError("Parser already initialized")
         if self._gen is None:
             raise ValueError("StreamController is not initialized")
-        self._parser = Parser(response_schema=block_schema)
+        if run_tool is not None and tools is None:
+            raise ValueError("run_tool needs the tools to parse the tool calls")
+        self._run_tool = run_tool
+        self._keep_tool = keep_tool
+        self._parser = Parser(
+            response_schema=block_schema, 
+            stop_when=stop_when,
+            tools=tools,
+            on_tool_call=self._start_tool if run_tool is not None else None,
+        )
         self._gen |= self._parser        
         return self
     
-    def save(self, name: str, dir: str | None = None):
+    def _start_tool(self, tool_call: ToolCall):
+        task = asyncio.create_task(self._run_tool(tool_call))
+        self._tool_tasks[tool_call.id] = (tool_call, task)
+        
+    async def _join_tools(self, response: Block | None):
+        tasks, self._tool_tasks = self._tool_tasks, {}
+        for tool_call, task in tasks.values():
+            if self._keep_tool is not None and not self._keep_tool(response, tool_call):
+                task.cancel()
+        results = await asyncio.gather(*(task for _, task in tasks.values()), return_exceptions=True)
+        for (tool_call, task), result in zip(tasks.values(), results):
+            if not task.cancelled():
+                self.tool_results[tool_call.id] = result
+                
+    async def _cancel_tools(self):
+        tasks, self._tool_tasks = self._tool_tasks, {}
+        for _, task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*(task for _, task in tasks.values()), return_exceptions=True)
+    
+    def buffer(
+        self, 
+        capacity: int = 64, 
+        policy: Literal["block", "drop", "coalesce"] = "block", 
+        coalesce: Callable[[Any, Any], Any | None] | None = None,
+    ) -> Self:
+        """
+        Run the stages added so far in their own task, behind a bounded queue.
+        Before parse() it decouples the LLM stream from the parser, after it
+        the parser from the consumer. See Buffer.
+        """
+        if self._gen is None:
+            raise ValueError("StreamController is not initialized")
+        buffer = Buffer(capacity, policy=policy, coalesce=coalesce)
+        self._gen |= buffer
+        self.buffers.append(buffer)
+        return self
+    
+    def coalesce(self, window: float = 0.03, max_chars: int | None = None) -> Self:
+        """
+        Merge the deltas of the stages added so far that arrive within
+        `window` seconds, so fewer and larger stream_delta events are
+        emitted. After parse() it merges the appends of a view. See Coalescer.
+        """
+        if self._gen is None:
+            raise ValueError("StreamController is not initialized")
+        self._gen |= Coalescer(window, max_chars=max_chars)
+        return self
+    
+    def save(self, name: str, dir: str | None = None, compress: bool = False, record_times: bool = False):
         import os
         path = f"{dir}/{name}.jsonl" if dir else f"{name}.jsonl"
-        self._stream.save_stream(path)
+        if compress:
+            path += ".gz"
+        self._stream.save_stream(path, record_times=record_times)
         if os.path.exists(path):
             os.remove(path)
         return self
     
-    def load(self, name: str, dir: str | None = None, delay: float = 0.07):
-        import asyncio
-        import random
+    def load(
+        self, 
+        name: str, 
+        dir: str | None = None, 
+        delay: float = 0.07, 
+        timing: Literal["none", "fixed", "recorded", "random"] = "random",
+        seed: int | None = None,
+    ):
+        """
+        Replay a recorded stream instead of calling the LLM. `delay` is the
+        interval of the "fixed" and "random" timings, see StreamReplay, the
+        replay is kept in `replay` for its stats.
+        """
+        import os
         path = f"{dir}/{name}.jsonl" if dir else f"{name}.jsonl"
-        
-        async def load_stream():
-            with open(path, "r") as f:
-                for line in f:
-                    # Add random delay between 0.5x and 1.5x of base delay
-                    random_delay = delay * (max(-0.5 + random.random(), 0))
-                    if random_delay > 0:
-                        await asyncio.sleep(random_delay)
-                    j = json.loads(line)
-                    block = BlockChunk.model_validate(j)
-                    yield block
-                    
-        self._gen = Stream(load_stream())
+        if not os.path.exists(path) and os.path.exists(path + ".gz"):
+            path += ".gz"
+        self.replay = StreamReplay.from_record(path, timing=timing, interval=delay, seed=seed)
+        self._gen = Stream(self.replay.stream())
         return self
     
                 
@@ -559,42 +1127,52 @@ class StreamController(BaseFbpComponent):
     async def on_start(self, value: Any = None):
         if not self._span:
             from promptview.model3.versioning.models import ExecutionSpan
-            self._span = await ExecutionSpan(
+            self._span = await self._record_span(ExecutionSpan(
                 span_type=self._span_type,
                 name=self._name,
                 index=self.index,
                 tags=self._tags,
                 start_time=dt.datetime.now(),
                 parent_span_id=self.parent.span_id if self.parent else None,
-            ).save()
+            ))
+        self._execution_path = None
+        self.stream_event = None
+        if self._span_recorded and self.trace.records_streams():
+            self.stream_event = await self.span.add_stream(self.index)
 
             
+    async def _close_buffers(self):
+        for buffer in self.buffers:
+            await buffer.aclose()
+            
     async def on_stop(self):
-        self.span.end_time = dt.datetime.now()
-        self.span.status = "completed"
-        self._span = await self.span.save()
+        await self._close_buffers()
+        await self._join_tools(self.get_response())
+        if self._parser is not None and self._parser.stopped_early:
+            await self._end_span("completed", {"stop_reason": "stop_when"})
+        else:
+            await self._end_span("completed")
+        response = self.get_response()
+        if response is not None and self._span_recorded and self.trace.records_streams():
+            await self.span.add_block_event(response, self.index)
         
     async def on_error(self, error: Exception):
-        from promptview.model3.versioning.models import Log
-        log = await Log(
-            message=str(error),
-            level="error"
-        ).save()
-        self.span.end_time = dt.datetime.now()
-        self.span.status = "failed"
-        self.span.metadata = {"error": str(error)}
-        self._span = await self.span.save()
-        self.stream_event = None
+        await self._close_buffers()
+        await self._cancel_tools()
+        self.error_event = None
+        if log := await self._record_error_log(error):
+            self.error_event = await self.span.add_log_event(log, self.index)
+        await self._end_span("failed", {"error": str(error)})
         
         
     
         
         
     
+    # the on_*_event methods only build the events, the records are written
+    # by on_start, on_stop and on_error whether or not the events are emitted
     
-    async def on_start_event(self, payload: Any = None, attrs: dict[str, Any] | None = None):
-        event = await self.span.add_stream(self.index)
-        self.stream_event = event
+    def on_start_event(self, payload: Any = None, attrs: dict[str, Any] | None = None):
         return StreamEvent(
             type="stream_start", 
             name=self._name, 
@@ -605,7 +1183,7 @@ class StreamController(BaseFbpComponent):
             parent_event_id=self.event.id if self.event else None,
         )
     
-    async def on_value_event(self, payload: Any = None):
+    def on_value_event(self, payload: Any = None):
         return StreamEvent(
             type="stream_delta", 
             name=self._name, 
@@ -615,10 +1193,7 @@ class StreamController(BaseFbpComponent):
             parent_event_id=self.stream_event.id if self.stream_event else None,
         )
     
-    async def on_stop_event(self, payload: Any = None):
-        response = self.get_response()
-        if response is not None:
-            await self.span.add_block_event(response, self.index)
+    def on_stop_event(self, payload: Any = None):
         return StreamEvent(
             type="stream_end", 
             name=self._name, 
@@ -627,28 +1202,22 @@ class StreamController(BaseFbpComponent):
             parent_event_id=self.stream_event.id if self.stream_event else None,
         )
     
-    async def on_error_event(self, error: Exception):
-        from promptview.model3.versioning.models import Log
-        log = await Log(
-            message=str(error),
-            level="error"
-        ).save()
-        event = await self.span.add_log_event(log, self.index)
+    def on_error_event(self, error: Exception):
         return StreamEvent(
             type="stream_error", 
             name=self._name, 
             payload=error, 
             span_id=str(self.span_id), 
             path=self.get_execution_path(), 
-            event=event,
+            event=self.error_event,
             parent_event_id=self.stream_event.id if self.stream_event else None,
         )
         
     def __aiter__(self):
         return FlowRunner(self)
     
-    async def stream_events(self, event_level: EventLogLevel = EventLogLevel.chunk):
-        return FlowRunner(self, event_level).stream_events()
+    async def stream_events(self, event_level: EventLogLevel = EventLogLevel.chunk, trace_policy: TracePolicy | None = None):
+        return FlowRunner(self, trace_policy=trace_policy).stream_events(event_level)
     
 
 
@@ -704,6 +1273,11 @@ class PipeController(BaseFbpComponent):
         self._span: "ExecutionSpan | None" = None
         self.index = 0
         self.event: "SpanEvent | None" = None
+        self.value_event: "SpanEvent | None" = None
+        self.error_event: "SpanEvent | None" = None
+        # position in a Parallel group, a level of the execution path
+        self.branch: int | None = None
+        self._parent_path: list[int] | None = None
     
     @property
     def span(self):
@@ -717,14 +1291,19 @@ class PipeController(BaseFbpComponent):
 
     def get_execution_path(self) -> list[int]:
         """Build execution path using existing index tracking"""
-        path = []
-        current = self
-        while current:
-            path.insert(0, current.index)  # Prepend to build path from root
-            current = current.parent
+        # the parents do not step while this component runs, only its own index moves
+        if self._parent_path is None:
+            self._parent_path = self.parent.get_execution_path() if self.parent else []
+        path = list(self._parent_path)
+        if self.branch is not None:
+            path.append(self.branch)
+        path.append(self.index)
         return path
         
-    async def on_start_event(self, payload: Any = None, attrs: dict[str, Any] | None = None):
+    # the on_*_event methods only build the events, the records are written
+    # by on_start, post_next, on_stop and on_error whether or not the events are emitted
+        
+    def on_start_event(self, payload: Any = None, attrs: dict[str, Any] | None = None):
         return StreamEvent(
             type="span_start", 
             name=self._gen_func.__name__, 
@@ -735,50 +1314,32 @@ class PipeController(BaseFbpComponent):
             parent_event_id=self.event.id if self.event else None,            
         )
     
-    async def on_value_event(self, payload: Any = None):
-        if isinstance(payload, StreamController):
-            span = await payload.build_span(str(self.span_id))
-            event = await self.span.add_span_event(span, self.index)
-            payload.event = event
-            return StreamEvent(
-                type="span_event", 
-                name=self._gen_func.__name__, 
-                payload=span, 
-                span_id=str(self.span_id), 
-                path=self.get_execution_path(), 
-                event=event,
-                parent_event_id=self.event.id if self.event else None,
-            )
-            
-        elif isinstance(payload, PipeController):
-            span = await payload.build_span(str(self.span_id))
-            event = await self.span.add_span_event(span, self.index)
-            payload.event = event
+    def on_value_event(self, payload: Any = None):
+        if isinstance(payload, (StreamController, PipeController)):
             return StreamEvent(
                 type="span_event", 
                 name=self._gen_func.__name__, 
-                payload=span, 
+                payload=payload.span, 
                 span_id=str(self.span_id), 
                 path=self.get_execution_path(), 
-                event=event,
+                event=payload.event,
                 parent_event_id=self.event.id if self.event else None,
             )
         elif isinstance(payload, Block):
-            event = await self.span.add_block_event(payload, self.index)
             return StreamEvent(
                 type="span_event", 
                 name=self._gen_func.__name__, 
                 payload=payload, 
                 span_id=str(self.span_id), 
                 path=self.get_execution_path(), 
-                event=event,
+                event=self.value_event,
                 parent_event_id=self.event.id if self.event else None,
             )
         else:
             # raise ValueError(f"Invalid payload type: {type(payload)}")
             return StreamEvent(type="span_event", name=self._gen_func.__name__, payload=payload, span_id=str(self.span_id), path=self.get_execution_path())
     
-    async def on_stop_event(self, payload: Any = None):
+    def on_stop_event(self, payload: Any = None):
         return StreamEvent(
             type="span_end", 
             name=self._gen_func.__name__, 
@@ -788,24 +1349,28 @@ class PipeController(BaseFbpComponent):
             parent_event_id=self.event.id if self.event else None,
         )
     
-    async def on_error_event(self, error: Exception):
-        from promptview.model3.versioning.models import Log
-        log = await Log(
-            message=str(error),
-            level="error"
-        ).save()
-        event = await self.span.add_log_event(log, self.index)
+    def on_error_event(self, error: Exception):
         return StreamEvent(
             type="span_error", 
             name=self._gen_func.__name__, 
             payload=error, 
             span_id=str(self.span_id), 
             path=self.get_execution_path(), 
-            event=event
+            event=self.error_event
         )
     
     async def post_next(self, value: Any = None):
         self.index += 1
+        # spans of sub components and yielded blocks are written here, not by on_value_event
+        if isinstance(value, (StreamController, PipeController)):
+            await self.add_event(value)
+        elif isinstance(value, Parallel):
+            for i, gen in enumerate(value.gens):
+                gen.branch = i
+                gen.parent = self
+                await self.add_event(gen)
+        elif isinstance(value, Block):
+            self.value_event = await self.span.add_block_event(value, self.index) if self._span_recorded else None
         return value
     
     # async def post_next(self, value: Any = None):
@@ -834,17 +1399,19 @@ class PipeController(BaseFbpComponent):
     
     async def build_span(self, parent_span_id: str | None = None):
         from promptview.model3.versioning.models import ExecutionSpan
-        self._span = await ExecutionSpan(
+        self._span = await self._record_span(ExecutionSpan(
             span_type=self._span_type,
             name=self._name,
             index=self.index,
             tags=self._tags,
             start_time=dt.datetime.now(),
             parent_span_id=parent_span_id,
-        ).save()
+        ))
         return self._span
     
     async def add_span(self, span: "ExecutionSpan"):
+        if not self._span_recorded:
+            return None
         event = await self.span.add_span_event(span, self.index)
         return event
     
@@ -852,12 +1419,12 @@ class PipeController(BaseFbpComponent):
     async def add_event(self, gen: "PipeController | StreamController"):
         if isinstance(gen, StreamController):
             span = await gen.build_span(str(self.span_id))
-            event = await self.span.add_span_event(span, self.index)
+            event = await self.span.add_span_event(span, self.index) if gen._span_recorded else None
             gen.event = event
             return event
         elif isinstance(gen, PipeController):
             span = await gen.build_span(str(self.span_id))
-            event = await self.span.add_span_event(span, self.index)        
+            event = await self.span.add_span_event(span, self.index) if gen._span_recorded else None
             gen.event = event
             return event
         else:
@@ -867,38 +1434,31 @@ class PipeController(BaseFbpComponent):
         from promptview.model3.versioning.models import ExecutionSpan
         bound, kwargs = await resolve_dependencies_kwargs(self._gen_func, self._args, self._kwargs)
         self._gen = self._gen_func(*bound.args, **bound.kwargs)
+        self._parent_path = None
         if not self._span:
-            self._span = await ExecutionSpan(
+            self._span = await self._record_span(ExecutionSpan(
                 span_type=self._span_type,
                 name=self._name,
                 tags=self._tags,
                 index=self.index,
                 parent_span_id=self.parent.span_id if self.parent else None,
-            ).save()
+            ))
         
         
     async def on_stop(self):
-        self.span.end_time = dt.datetime.now()
-        self.span.status = "completed"
-        self._span = await self.span.save()
+        await self._end_span("completed")
         
     async def on_error(self, error: Exception):
-        from promptview.model3.versioning.models import Log
-        log = await Log(
-            message=str(error),
-            level="error"
-        ).save()
-        await self.span.add_log_event(log, self.index)
-        self.span.end_time = dt.datetime.now()
-        self.span.status = "failed"
-        self.span.metadata = {"error": str(error)}
-        self._span = await self.span.save()
+        self.error_event = None
+        if log := await self._record_error_log(error):
+            self.error_event = await self.span.add_log_event(log, self.index)
+        await self._end_span("failed", {"error": str(error)})
     
     def __aiter__(self):
         return FlowRunner(self)
     
-    def stream_events(self, event_level: EventLogLevel = EventLogLevel.chunk):
-        return FlowRunner(self, event_level).stream_events()
+    def stream_events(self, event_level: EventLogLevel = EventLogLevel.chunk, trace_policy: TracePolicy | None = None):
+        return FlowRunner(self, trace_policy=trace_policy).stream_events(event_level)
             
     @classmethod
     def decorator_factory(cls) -> Callable[[], Callable[[Callable[P, AsyncGenerator[CHUNK, None]]], Callable[P, Self]]]:
@@ -915,11 +1475,123 @@ class PipeController(BaseFbpComponent):
 
 
 
+class _Done:
+    """Marks the end of the events of a child of Parallel."""
+
+
+class Parallel(BaseFbpComponent):
+    """
+    Runs streams and components concurrently, yielded from a component:
+
+        answers = yield parallel(search(q1), search(q2), summarize(doc))
+
+    Every child runs in its own task with its own FlowRunner, at the event
+    level of the parent runner. Their events are emitted as they come, or
+    child by child with `ordered=True`. The parent gets the list of the
+    responses, in the order of the children. The children are spans of the
+    parent component like yielded ones, their position in the group is a
+    level of their execution path. If a child fails the others are
+    cancelled and the error is raised in the parent.
+    """
+    
+    def __init__(self, *gens: "StreamController | PipeController", ordered: bool = False):
+        super().__init__(None)
+        for gen in gens:
+            if not isinstance(gen, (StreamController, PipeController)):
+                raise ValueError(f"Invalid generator type: {type(gen)}")
+        self.gens = list(gens)
+        self.ordered = ordered
+        self.event_level = EventLogLevel.chunk
+        # events of the parent to emit before the events of the children
+        self.events: list[StreamEvent] = []
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+        self._done = 0
+        self._failed: tuple[BaseFbpComponent, Exception] | None = None
+        
+    @property
+    def name(self):
+        return "parallel"
+        
+    async def _run(self, i: int, gen: "StreamController | PipeController"):
+        queue = self._queues[i if self.ordered else 0]
+        runner = FlowRunner(gen)
+        try:
+            async for event in runner.stream_events(self.event_level):
+                queue.put_nowait(event)
+        except asyncio.CancelledError:
+            # close the child and what it yielded the way an error would
+            await runner.close(asyncio.CancelledError("cancelled"))
+            raise
+        except Exception as e:
+            if self._failed is None:
+                self._failed = (gen, e)
+            for task in self._tasks:
+                if task is not asyncio.current_task():
+                    task.cancel()
+        finally:
+            queue.put_nowait(_Done)
     
+    async def on_start(self, value: Any = None):
+        self._queues = [asyncio.Queue() for _ in (self.gens if self.ordered else [None])]
+        self._tasks = [asyncio.create_task(self._run(i, gen)) for i, gen in enumerate(self.gens)]
+        
+    async def asend(self, value: Any = None):
+        if not self._did_start:
+            await self.start_generator()
+        if self.events:
+            return self.events.pop(0)
+        while self._done < len(self.gens):
+            queue = self._queues[self._done if self.ordered else 0]
+            # the events queued before a child failed are emitted first
+            if self._failed is not None and queue.empty():
+                break
+            event = await queue.get()
+            if event is _Done:
+                self._done += 1
+                continue
+            return event
+        if self._failed is not None:
+            raise self._failed[1]
+        raise StopAsyncIteration
+    
+    async def _cancel(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    async def on_error(self, error: Exception):
+        await self._cancel()
+        
+    async def aclose(self):
+        await self._cancel()
+        
+    def get_response(self):
+        return [gen.get_response() for gen in self.gens]
+    
+    def on_error_event(self, error: Exception):
+        if self._failed is None:
+            raise error
+        return self._failed[0].on_error_event(error)
+    
+    
+def parallel(*gens: "StreamController | PipeController", ordered: bool = False) -> Parallel:
+    """Run the streams and components concurrently, see Parallel."""
+    return Parallel(*gens, ordered=ordered)
+
 
 
+    
+
 class FlowRunner:
-    def __init__(self, gen: BaseFbpComponent, event_level: EventLogLevel = EventLogLevel.chunk):
+    def __init__(
+        self, 
+        gen: BaseFbpComponent, 
+        event_level: EventLogLevel = EventLogLevel.chunk, 
+        trace_policy: TracePolicy | None = None
+    ):
+        if trace_policy is not None and gen._trace is None:
+            gen._trace = trace_policy.decide()
         self.stack: list[BaseFbpComponent] = [gen]
         self.last_value: Any = None
         self._output_events = False
@@ -942,6 +1614,10 @@ class FlowRunner:
         return False
     
     def push(self, value: BaseFbpComponent):
+        if self.stack:
+            value.parent = self.current
+        if isinstance(value, Parallel):
+            value.event_level = self._event_level
         self.stack.append(value)
         
     def pop(self):
@@ -971,57 +1647,16 @@ class FlowRunner:
         return func(value)
     
     
-    async def try_build_start_event(self, gen: BaseFbpComponent, value: Any):
-        event = await gen.on_start_event(value)
-        if event is None:
-            return None
-        if self._event_level == EventLogLevel.span:
-            return None
-        elif self._event_level == EventLogLevel.turn:
-            return None
-        elif self._event_level == EventLogLevel.chunk:
-            return event
-        return None
-    
-    
-    async def try_build_value_event(self, gen: BaseFbpComponent, value: Any):
-        event = await gen.on_value_event(value)
-        if event is None:
-            return None
-        if self._event_level == EventLogLevel.span:
-            if isinstance(value, PipeController):
-                return event
-            return None
-        elif self._event_level == EventLogLevel.turn:
-            return None
-        elif self._event_level == EventLogLevel.chunk:
-            return event
-        return None
-    
-    async def try_build_stop_event(self, gen: BaseFbpComponent, value: Any):
-        event = await gen.on_stop_event(value)
-        if event is None:
-            return None
-        if self._event_level == EventLogLevel.span:
-            return gen.get_response()
-        elif self._event_level == EventLogLevel.turn:
-            return None
-        elif self._event_level == EventLogLevel.chunk:
-            return event
-        return None
+    # events are built only for the levels that emit them, the components
+    # write their records in on_start, post_next, on_stop and on_error
     
-    async def try_build_error_event(self, gen: BaseFbpComponent, value: Any):
-        event = await gen.on_error_event(value)
-        if event is None:
-            return None
-        if self._event_level == EventLogLevel.span:
-            return event
-        elif self._event_level == EventLogLevel.turn:
-            return None
-        elif self._event_level == EventLogLevel.chunk:
-            return event
-        return None
+    def emits_start_event(self) -> bool:
+        return self._event_level == EventLogLevel.chunk
     
+    def emits_value_event(self, value: Any) -> bool:
+        if self._event_level == EventLogLevel.chunk:
+            return True
+        return self._event_level == EventLogLevel.span and isinstance(value, PipeController)
     
 
     
@@ -1039,50 +1674,49 @@ class FlowRunner:
                     await gen.athrow(self._error_to_raise)
                 if not gen._did_start:
                     await gen.start_generator()                    
-                    payload = gen.span if isinstance(gen, PipeController) and len(self.stack) == 1 else None
-                    # event = await gen.on_start_event(payload)
-                    # if not self.should_output_events:
-                    #     continue
-                    # return event
-                    if event:=await self.try_build_start_event(gen, payload):
-                        return event
-                    else:
-                        continue
+                    if self.emits_start_event() and not isinstance(gen, Parallel):
+                        payload = gen.span if isinstance(gen, PipeController) and len(self.stack) == 1 else None
+                        return gen.on_start_event(payload)
+                    continue
                     
 
                 response = self._get_response()
                 value = await gen.asend(response)
+                if isinstance(gen, Parallel):
+                    # events of the children, already built for this level
+                    return value
                 
                 if isinstance(value, StreamController):
                     self.push(value)
                 elif isinstance(value, PipeController):
                     self.push(value)
+                elif isinstance(value, Parallel):
+                    self.push(value)
+                    value.events = [gen.on_value_event(child) for child in value.gens if self.emits_value_event(child)]
+                    continue
                 
                 self.last_value = value
-                # event = await gen.on_value_event(value)
-                if event:=await self.try_build_value_event(gen, value):
-                    return event
-                # if not self.should_output_events:
-                #     return value
-                # return event
+                if self.emits_value_event(value):
+                    return gen.on_value_event(value)
                 
             except StopAsyncIteration:
                 gen = self.pop()
                 await gen.on_stop()
-                event = await gen.on_stop_event(None)
-                if event:=await self.try_build_stop_event(gen, value):
-                    return event
-                # if not self.should_output_events:
-                #     continue
-                # return event                
+                if isinstance(gen, Parallel):
+                    # the children ended in their own runners, the parent gets the responses
+                    continue
+                if self._event_level == EventLogLevel.chunk:
+                    return gen.on_stop_event(value)
+                elif self._event_level == EventLogLevel.span:
+                    if response := gen.get_response():
+                        return response
             except Exception as e:
                 gen = self.pop()
-                event = await gen.on_error_event(e)
                 await gen.on_error(e)                
                 if not self.should_output_events or not self.stack:
                     raise e
                 self._error_to_raise = e
-                return event
+                return gen.on_error_event(e)
         else:
             raise StopAsyncIteration
 
@@ -1092,6 +1726,21 @@ class FlowRunner:
         self._output_events = True
         return self
     
+    async def close(self, error: BaseException):
+        """
+        End the components on the stack with an error raised outside of the
+        runner, like a cancellation, the way an error they raised ends them.
+        """
+        while self.stack:
+            gen = self.pop()
+            try:
+                if gen._did_start:
+                    await gen.on_error(error)
+            finally:
+                # a component that did not start has no generator to close yet
+                if gen._did_start or gen._gen is not None:
+                    await gen.aclose()
+    
     
     
     
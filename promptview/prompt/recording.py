@@ -0,0 +1,254 @@
+import asyncio
+import gzip
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import IO, Any, AsyncIterable, Literal
+
+from promptview.block import BlockChunk
+
+
+
+# one writer thread for all recorders, it keeps the batches of a file in order
+_executor: ThreadPoolExecutor | None = None
+
+
+def _writer() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream-recorder")
+    return _executor
+
+
+def open_record(path: str, mode: str = "r") -> IO[str]:
+    """Open a stream record, records ending with .gz are gzip compressed."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+
+class StreamRecorder:
+    """
+    Records the values of a stream to a .jsonl file without blocking the
+    event loop. Values are buffered and handed to a writer thread in batches,
+    when `flush_size` values are buffered, when `flush_interval` seconds
+    passed since the last batch and when the recorder is closed at the end of
+    the stream. Values are serialized to JSON lines on the loop, the writer
+    thread only writes (and compresses), which releases the GIL, so it does
+    not compete with the loop. A path ending with .gz is gzip compressed.
+    With `record_times` every value gets a "_time" key, the seconds since
+    the first value, so StreamReplay can replay the recorded timing.
+
+    Example:
+        recorder = StreamRecorder("records/answer.jsonl.gz")
+        async for chunk in stream:
+            recorder.write(chunk)
+        await recorder.close()
+    """
+
+    def __init__(self, path: str, flush_size: int = 256, flush_interval: float = 1.0, record_times: bool = False):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.record_times = record_times
+        self._first_write: float | None = None
+        self._buffer: list[str] = []
+        self._last_flush = time.monotonic()
+        self._pending: list[asyncio.Future] = []
+        self._file: IO[str] | None = None
+        self._closed = False
+
+    def write(self, value: Any):
+        if self._closed:
+            raise ValueError(f"Recorder of {self.path} is closed")
+        data = value.model_dump() if hasattr(value, "model_dump") else value
+        if self.record_times and isinstance(data, dict):
+            now = time.monotonic()
+            if self._first_write is None:
+                self._first_write = now
+            data["_time"] = round(now - self._first_write, 6)
+        self._buffer.append(json.dumps(data))
+        if len(self._buffer) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered values to the writer thread."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        data = "\n".join(self._buffer) + "\n"
+        self._buffer = []
+        loop = asyncio.get_running_loop()
+        self._pending = [f for f in self._pending if not f.done()]
+        self._pending.append(loop.run_in_executor(_writer(), self._write_batch, data))
+
+    def _write_batch(self, data: str):
+        if self._file is None:
+            self._file = open_record(self.path, "a")
+        self._file.write(data)
+        self._file.flush()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def close(self):
+        """Write what is left and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        pending, self._pending = self._pending, []
+        try:
+            await asyncio.gather(*pending)
+        finally:
+            await asyncio.get_running_loop().run_in_executor(_writer(), self._close_file)
+
+
+
+@dataclass
+class ReplayStats:
+    """Timings of a replay, in seconds from its start."""
+    chunks: int = 0
+    events: int = 0
+    first_chunk: float | None = None
+    first_event: float | None = None
+    total: float = 0.0
+    # time the replay waited to keep the timing
+    waited: float = 0.0
+    
+    @property
+    def overhead_per_chunk(self) -> float:
+        """Time of the pipeline per chunk, without the waits of the timing."""
+        return (self.total - self.waited) / self.chunks if self.chunks else 0.0
+
+
+
+class StreamReplay:
+    """
+    Replays a recorded stream with a chosen timing, for tests and
+    benchmarks. The record is read and its chunks validated once, every
+    replay yields fresh copies of them, so the same replay can run many
+    times and a run only spends time in the pipeline that consumes it.
+    
+    Timings:
+    - "none": the chunks are yielded as fast as they are read.
+    - "fixed": one chunk every `interval` seconds.
+    - "recorded": the times of a record written with `record_times`.
+    - "random": up to 1.5 * `interval` seconds between chunks, half of them
+      without a wait, the timing of StreamController.load. With a `seed`
+      the waits are the same on every replay.
+    `speed` divides the waits. Waits are kept on a schedule from the start
+    of the replay, so the time spent in the pipeline does not add up.
+    
+    `measure` wraps the events of the pipeline to time the first event and
+    the whole run, the results are in `stats`.
+    
+    Example:
+        replay = StreamReplay.from_record("records/answer.jsonl", timing="none")
+        stream = llm_stream(replay.stream()).parse(schema)
+        async for event in replay.measure(await stream.stream_events()):
+            pass
+        print(replay.stats.first_event, replay.stats.overhead_per_chunk)
+    """
+    
+    def __init__(
+        self, 
+        chunks: list[BlockChunk], 
+        timing: Literal["none", "fixed", "recorded", "random"] = "none",
+        interval: float = 0.0,
+        times: list[float] | None = None,
+        seed: int | None = None,
+        speed: float = 1.0,
+    ):
+        if timing not in ("none", "fixed", "recorded", "random"):
+            raise ValueError(f"Invalid replay timing: {timing}")
+        if timing == "recorded" and (times is None or len(times) != len(chunks)):
+            raise ValueError("Recorded timing needs a time for every chunk, record the stream with record_times")
+        self.chunks = chunks
+        self.timing = timing
+        self.interval = interval
+        self.times = times
+        self.seed = seed
+        self.speed = speed
+        self.stats = ReplayStats()
+        self._start: float | None = None
+        
+    @classmethod
+    def from_record(cls, path: str, **kwargs) -> "StreamReplay":
+        chunks = []
+        times = []
+        with open_record(path) as f:
+            for line in f:
+                data = json.loads(line)
+                chunks.append(BlockChunk.model_validate(data))
+                times.append(data.get("_time"))
+        if "times" not in kwargs and all(t is not None for t in times):
+            kwargs["times"] = times
+        return cls(chunks, **kwargs)
+    
+    def schedule(self) -> list[float]:
+        """The time of every chunk from the start of the replay."""
+        if self.timing == "none":
+            return [0.0] * len(self.chunks)
+        if self.timing == "fixed":
+            offsets = [self.interval * (i + 1) for i in range(len(self.chunks))]
+        elif self.timing == "recorded":
+            offsets = list(self.times)
+        else:
+            rng = random.Random(self.seed)
+            offsets = []
+            offset = 0.0
+            for _ in self.chunks:
+                offset += self.interval * max(-0.5 + rng.random(), 0)
+                offsets.append(offset)
+        return [offset / self.speed for offset in offsets]
+    
+    def _begin(self) -> bool:
+        """Start a run, False when `measure` already started it."""
+        if self._start is not None:
+            return False
+        self._start = time.perf_counter()
+        self.stats = ReplayStats()
+        return True
+    
+    def _end(self):
+        self.stats.total = time.perf_counter() - self._start
+        self._start = None
+    
+    async def stream(self):
+        schedule = self.schedule()
+        chunks = [chunk.copy() for chunk in self.chunks]
+        run = self._begin()
+        start = self._start
+        stats = self.stats
+        for chunk, offset in zip(chunks, schedule):
+            if offset:
+                wait = start + offset - time.perf_counter()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    stats.waited += wait
+            if stats.first_chunk is None:
+                stats.first_chunk = time.perf_counter() - start
+            stats.chunks += 1
+            yield chunk
+        if run:
+            self._end()
+        
+    async def measure(self, events: AsyncIterable[Any]):
+        """Yield the events of the pipeline and time them in `stats`."""
+        run = self._begin()
+        stats = self.stats
+        try:
+            async for event in events:
+                if stats.first_event is None:
+                    stats.first_event = time.perf_counter() - self._start
+                stats.events += 1
+                yield event
+        finally:
+            if run:
+                self._end()
@@ -0,0 +1,174 @@
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Literal
+from xml.sax.saxutils import unescape
+
+
+
+_TAG = re.compile(r"<(/?)([A-Za-z_][\w\-.:]*)(\s[^<>]*?)?\s*(/?)>")
+_PARTIAL_TAG = re.compile(r"</?([A-Za-z_][\w\-.:]*)?")
+_ATTR = re.compile(r"""([A-Za-z_][\w\-.:]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'<>/=]+))""")
+_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+
+
+@dataclass
+class TagEvent:
+    """
+    A start tag, an end tag or a run of text of a tokenized stream. `start`
+    and `end` are (chunk, offset) positions, the chunk is the index of the
+    fed text and the offset is inside it, `end` is past the last character.
+    End events without text of their own, of self closing tags and of tags
+    that were never closed, have `start == end`.
+    """
+    type: Literal["start", "end", "text"]
+    start: tuple[int, int]
+    end: tuple[int, int]
+    tag: str | None = None
+    attrs: dict[str, str] = field(default_factory=dict)
+    text: str = ""
+
+
+
+class TagTokenizer:
+    """
+    Incremental tokenizer of the tags in an LLM output. Chunks are fed as
+    they stream in and only the text of a tag that is not complete yet is
+    kept between chunks, so every chunk is scanned once.
+
+    It does not need well formed XML:
+    - with `tags`, only these tag names are tags, any other tag is text.
+    - a '<' that can not start a tag is text as soon as that is known, so it
+      does not hold back the chunks after it.
+    - an end tag closes the tags that were opened inside it and were not
+      closed, an end tag of a tag that is not open is text.
+    - `close` ends the tags that are still open at the end of the stream.
+
+    Example:
+        tokenizer = TagTokenizer(tags=["thought", "answer"])
+        for chunk in chunks:
+            for event in tokenizer.feed(chunk):
+                ...
+        events = tokenizer.close()
+    """
+
+    def __init__(self, tags: Iterable[str] | None = None, max_tag_length: int = 256):
+        self.tags = {t.lower() for t in tags} if tags is not None else None
+        self._prefixes = {t[:i] for t in self.tags for i in range(1, len(t) + 1)} if self.tags is not None else None
+        self.max_tag_length = max_tag_length
+        self.stack: list[str] = []
+        self._chunks = 0
+        self._pending: str | None = None
+        self._pending_start = (0, 0)
+
+    @property
+    def pending(self) -> bool:
+        """Whether the text fed so far ends inside what may still become a tag."""
+        return self._pending is not None
+
+    def feed(self, text: str) -> list[TagEvent]:
+        chunk = self._chunks
+        self._chunks += 1
+        events: list[TagEvent] = []
+        pos = 0
+        if self._pending is not None:
+            pos = self._feed_pending(text, chunk, events)
+        size = len(text)
+        while pos < size:
+            lt = text.find("<", pos)
+            if lt == -1:
+                events.append(TagEvent("text", (chunk, pos), (chunk, size), text=text[pos:]))
+                break
+            if lt > pos:
+                events.append(TagEvent("text", (chunk, pos), (chunk, lt), text=text[pos:lt]))
+            gt = text.find(">", lt + 1)
+            next_lt = text.find("<", lt + 1)
+            if next_lt != -1 and (gt == -1 or next_lt < gt):
+                events.append(TagEvent("text", (chunk, lt), (chunk, next_lt), text=text[lt:next_lt]))
+                pos = next_lt
+            elif gt == -1:
+                if self._is_partial_tag(text[lt:]):
+                    self._pending = text[lt:]
+                    self._pending_start = (chunk, lt)
+                else:
+                    events.append(TagEvent("text", (chunk, lt), (chunk, size), text=text[lt:]))
+                break
+            else:
+                self._tag(text[lt:gt + 1], (chunk, lt), (chunk, gt + 1), events)
+                pos = gt + 1
+        return events
+
+    def _feed_pending(self, text: str, chunk: int, events: list[TagEvent]) -> int:
+        pending = self._pending
+        start = self._pending_start
+        self._pending = None
+        gt = text.find(">")
+        lt = text.find("<")
+        if lt != -1 and (gt == -1 or lt < gt):
+            events.append(TagEvent("text", start, (chunk, lt), text=pending + text[:lt]))
+            return lt
+        if gt == -1:
+            if self._is_partial_tag(pending + text):
+                self._pending = pending + text
+                self._pending_start = start
+            else:
+                events.append(TagEvent("text", start, (chunk, len(text)), text=pending + text))
+            return len(text)
+        self._tag(pending + text[:gt + 1], start, (chunk, gt + 1), events)
+        return gt + 1
+
+    def _is_partial_tag(self, text: str) -> bool:
+        if len(text) > self.max_tag_length:
+            return False
+        match = _PARTIAL_TAG.match(text)
+        name = match.group(1)
+        rest = text[match.end():]
+        if name is None:
+            return not rest
+        name = name.lower()
+        if not rest:
+            return self._prefixes is None or name in self._prefixes
+        if self.tags is not None and name not in self.tags:
+            return False
+        if text[1] == "/":
+            return not rest.strip()
+        return rest[0].isspace() or rest[0] == "/"
+
+    def _tag(self, text: str, start: tuple[int, int], end: tuple[int, int], events: list[TagEvent]):
+        match = _TAG.fullmatch(text)
+        if match is None:
+            events.append(TagEvent("text", start, end, text=text))
+            return
+        closing, tag, rest, self_closing = match.groups()
+        name = tag.lower()
+        if self.tags is not None and name not in self.tags:
+            events.append(TagEvent("text", start, end, text=text))
+            return
+        if closing:
+            if (rest and rest.strip()) or self_closing or name not in [t.lower() for t in self.stack]:
+                events.append(TagEvent("text", start, end, text=text))
+                return
+            while self.stack[-1].lower() != name:
+                events.append(TagEvent("end", start, start, tag=self.stack.pop()))
+            self.stack.pop()
+            events.append(TagEvent("end", start, end, tag=tag))
+            return
+        attrs = {}
+        if rest:
+            for key, double, single, bare in _ATTR.findall(rest):
+                attrs[key] = unescape(double or single or bare, _ENTITIES)
+        events.append(TagEvent("start", start, end, tag=tag, attrs=attrs))
+        if self_closing:
+            events.append(TagEvent("end", end, end, tag=tag))
+        else:
+            self.stack.append(tag)
+
+    def close(self) -> list[TagEvent]:
+        """End of the stream, flushes a pending partial tag as text and ends the open tags."""
+        events = []
+        end = (self._chunks, 0)
+        if self._pending is not None:
+            events.append(TagEvent("text", self._pending_start, end, text=self._pending))
+            self._pending = None
+        while self.stack:
+            events.append(TagEvent("end", end, end, tag=self.stack.pop()))
+        return events
@@ -0,0 +1,129 @@
+import contextvars
+import random
+from dataclasses import dataclass
+from enum import Enum
+
+
+
+
+class TraceLevel(Enum):
+    """
+    How much of a run is persisted to the database.
+
+    off  - nothing is written
+    turn - only the root span and the blocks it yields
+    span - the full span tree, span links, logs and component blocks
+    full - everything, including stream records and streamed response blocks
+    """
+    off = 0
+    turn = 1
+    span = 2
+    full = 3
+
+
+
+@dataclass(frozen=True)
+class TraceDecision:
+    """
+    The tracing decision of a single run. It is taken once on the root
+    component and shared by every sub-stream and sub-component.
+    """
+    level: TraceLevel
+    persist_errors: bool = False
+
+    def records_span(self, is_root: bool) -> bool:
+        if self.level == TraceLevel.turn:
+            return is_root
+        return self.level.value >= TraceLevel.span.value
+
+    def records_streams(self) -> bool:
+        return self.level == TraceLevel.full
+
+
+
+_trace_policy_ctx = contextvars.ContextVar("trace_policy_ctx", default=None)
+
+
+class TracePolicy:
+    """
+    Tracing policy for the flow runtime.
+
+    Set it globally with `TracePolicy.set_default(...)` or for a context with
+    `with TracePolicy("span"): ...`. A sample rate turns the policy into
+    "record N% of runs"; with `always_on_error` the failing span path of an
+    unsampled run is still written when an error happens.
+
+    Example:
+        TracePolicy.set_default(TracePolicy.sampled(5))
+        with TracePolicy("off"):
+            async for event in agent(message).stream_events():
+                ...
+    """
+    _default: "TracePolicy | None" = None
+
+    def __init__(
+        self,
+        level: TraceLevel | str = TraceLevel.full,
+        sample_rate: float | None = None,
+        always_on_error: bool = True,
+        seed: int | None = None,
+    ):
+        if isinstance(level, str):
+            level = TraceLevel[level]
+        if sample_rate is not None and not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        self.level = level
+        self.sample_rate = sample_rate
+        self.always_on_error = always_on_error
+        self._rng = random.Random(seed)
+        self._token = None
+
+    @classmethod
+    def sampled(
+        cls,
+        percent: float,
+        level: TraceLevel | str = TraceLevel.full,
+        always_on_error: bool = True,
+        seed: int | None = None
+    ) -> "TracePolicy":
+        return cls(level, sample_rate=percent / 100, always_on_error=always_on_error, seed=seed)
+
+    def decide(self) -> TraceDecision:
+        if self.level == TraceLevel.off:
+            return TraceDecision(TraceLevel.off, persist_errors=False)
+        if self.sample_rate is not None and self._rng.random() >= self.sample_rate:
+            return TraceDecision(TraceLevel.off, persist_errors=self.always_on_error)
+        return TraceDecision(self.level, persist_errors=self.always_on_error)
+
+    @classmethod
+    def set_default(cls, policy: "TracePolicy | TraceLevel | str | None"):
+        if policy is not None and not isinstance(policy, TracePolicy):
+            policy = TracePolicy(policy)
+        cls._default = policy
+
+    @classmethod
+    def current(cls) -> "TracePolicy":
+        policy = _trace_policy_ctx.get()
+        if policy is not None:
+            return policy
+        if cls._default is not None:
+            return cls._default
+        return _FULL_POLICY
+
+    def __enter__(self):
+        self._token = _trace_policy_ctx.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._token:
+            _trace_policy_ctx.reset(self._token)
+            self._token = None
+        return False
+
+    def __repr__(self):
+        sample = f", sample_rate={self.sample_rate}" if self.sample_rate is not None else ""
+        return f"TracePolicy({self.level.name}{sample}, always_on_error={self.always_on_error})"
+
+
+
+_FULL_POLICY = TracePolicy(TraceLevel.full)